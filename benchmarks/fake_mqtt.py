@@ -0,0 +1,153 @@
+"""
+In-process stand-in for the AWS IoT MQTT connection used by the benchmarks.
+
+FakeBroker.install() replaces awsiot's mqtt_connection_builder.mtls_from_path, so the app's
+ConnectionManager gets a FakeMqttConnection instead of a TLS connection. The fake implements
+the calls the app makes (connect, disconnect, subscribe, unsubscribe, resubscribe_existing_topics,
+publish) with concurrent.futures.Future results, routes publishes to matching subscriptions
+(+ and # wildcards) and completes everything on one dispatcher thread, like awscrt's event loop.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter match (+ matches one level, # the rest)."""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class FakeBroker:
+    """Routes publishes between FakeMqttConnections; `latency_secs` delays every completion."""
+
+    def __init__(self, latency_secs: float = 0.0):
+        self.latency_secs = latency_secs
+        self.published = 0
+        self.delivered = 0
+        self._subscriptions = {}  # (connection id, filter) -> callback
+        self._lock = threading.Lock()
+        self._events = []  # heap of (due, seq, fn)
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._packet_ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._dispatch, name="FakeBroker", daemon=True)
+        self._thread.start()
+
+    def install(self):
+        """Make the app build FakeMqttConnections on this broker."""
+        from awsiot import mqtt_connection_builder
+        mqtt_connection_builder.mtls_from_path = self.connection_builder
+
+    def connection_builder(self, **kwargs) -> "FakeMqttConnection":
+        return FakeMqttConnection(self, **kwargs)
+
+    def close(self):
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join(5)
+
+    def inject(self, topic: str, payload: bytes, qos: int = 1):
+        """Deliver a message as if another device had published it."""
+        with self._lock:
+            callbacks = [cb for (conn_id, topic_filter), cb in self._subscriptions.items()
+                         if cb and topic_matches(topic_filter, topic)]
+        for callback in callbacks:
+            callback(topic=topic, payload=payload, dup=False, qos=qos, retain=False)
+        self.delivered += len(callbacks)
+
+    def schedule(self, fn, delay: float = None):
+        due = time.perf_counter() + (self.latency_secs if delay is None else delay)
+        with self._wakeup:
+            heapq.heappush(self._events, (due, next(self._seq), fn))
+            self._wakeup.notify()
+
+    def complete(self, result=None, exception=None) -> Future:
+        future = Future()
+        if exception is not None:
+            self.schedule(lambda: future.set_exception(exception))
+        else:
+            self.schedule(lambda: future.set_result(result))
+        return future
+
+    def next_packet_id(self) -> int:
+        return next(self._packet_ids)
+
+    def _subscribe(self, connection, topic_filter: str, callback):
+        with self._lock:
+            self._subscriptions[(id(connection), topic_filter)] = callback
+
+    def _unsubscribe(self, connection, topic_filter: str):
+        with self._lock:
+            self._subscriptions.pop((id(connection), topic_filter), None)
+
+    def _drop_connection(self, connection):
+        with self._lock:
+            for key in [key for key in self._subscriptions if key[0] == id(connection)]:
+                del self._subscriptions[key]
+
+    def _dispatch(self):
+        while True:
+            with self._wakeup:
+                while not self._closed and (not self._events or self._events[0][0] > time.perf_counter()):
+                    timeout = self._events[0][0] - time.perf_counter() if self._events else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+                _, _, fn = heapq.heappop(self._events)
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+class FakeMqttConnection:
+    """The subset of awscrt.mqtt.Connection the app uses."""
+
+    def __init__(self, broker: FakeBroker, on_connection_interrupted=None, on_connection_resumed=None, **kwargs):
+        self.broker = broker
+        self.on_connection_interrupted = on_connection_interrupted
+        self.on_connection_resumed = on_connection_resumed
+        self.client_id = kwargs.get("client_id")
+        self.filters = {}
+
+    def connect(self) -> Future:
+        return self.broker.complete({"session_present": False})
+
+    def disconnect(self) -> Future:
+        self.broker._drop_connection(self)
+        return self.broker.complete({})
+
+    def subscribe(self, topic, qos, callback=None):
+        self.filters[topic] = (qos, callback)
+        self.broker._subscribe(self, topic, callback)
+        return self.broker.complete({"topic": topic, "qos": qos}), self.broker.next_packet_id()
+
+    def unsubscribe(self, topic):
+        self.filters.pop(topic, None)
+        self.broker._unsubscribe(self, topic)
+        return self.broker.complete({}), self.broker.next_packet_id()
+
+    def resubscribe_existing_topics(self):
+        topics = [(topic, qos) for topic, (qos, _) in self.filters.items()]
+        return self.broker.complete({"topics": topics}), self.broker.next_packet_id()
+
+    def publish(self, topic, payload, qos):
+        self.broker.published += 1
+        data = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+        qos_value = getattr(qos, "value", qos)
+        self.broker.schedule(lambda: self.broker.inject(topic, data, qos_value))
+        return self.broker.complete({"packet_id": None}), self.broker.next_packet_id()
@@ -0,0 +1,630 @@
+"""
+Startup and hot-path benchmarks for the AWS IoT Pub/Sub app.
+
+Runs against benchmarks/fake_mqtt.py (no network, no broker) and a temporary database
+(IOT_DB_PATH), and writes the results as JSON for comparison between releases.
+
+    python benchmarks/run_benchmarks.py                       # full suite
+    python benchmarks/run_benchmarks.py --quick               # smaller sizes, short soak
+    python benchmarks/run_benchmarks.py --only ingest,publish
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<previous>.json
+
+Benchmarks: cold_start, ingest, viewer, search, chart, topic_match, subscribe, publish, soak.
+The window is created offscreen (QT_QPA_PLATFORM=offscreen) unless --display is given.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent.absolute()
+APP_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(APP_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_mqtt import FakeBroker  # noqa: E402
+
+BENCHMARKS = ("cold_start", "ingest", "viewer", "search", "chart", "topic_match", "subscribe", "publish", "soak")
+PAYLOAD = json.dumps({"seq": 0, "temperature": 23.5, "humidity": 41.2, "status": "ok", "device": "bench-01"})
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Bench:
+    """Shared state: one QApplication, a fake broker and a scratch directory for databases."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix="iot-bench-"))
+        self._app = None
+        self._gui = None
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def db_path(self, name: str) -> str:
+        path = self.tmp_dir / f"{name}.db"
+        os.environ["IOT_DB_PATH"] = str(path)
+        return str(path)
+
+    @property
+    def gui(self):
+        """The app module, imported on first use (after cold_start has run in a clean process)."""
+        if self._gui is None:
+            import iot_pubsub_gui
+            from PyQt6.QtWidgets import QApplication, QDialog
+            logging.getLogger().setLevel(logging.WARNING)
+            # No network access from benchmarks
+            iot_pubsub_gui.AWSIoTPubSubGUI.start_update_check = lambda self: None
+            # show_all_messages() runs a modal dialog; time it up to the first rendered frame instead
+            QDialog.exec = lambda dialog: (dialog.show(), QApplication.processEvents(), dialog.close(), 0)[-1]
+            self._app = QApplication.instance() or QApplication([sys.argv[0], "--no-fullscreen"])
+            self._gui = iot_pubsub_gui
+        return self._gui
+
+    def process_events(self, seconds: float = 0.0):
+        end = time.perf_counter() + seconds
+        while True:
+            self._app.processEvents()
+            if time.perf_counter() >= end:
+                return
+            time.sleep(0.001)
+
+    def new_window(self, broker: FakeBroker = None, connect: bool = False):
+        gui = self.gui
+        if broker:
+            broker.install()
+        window = gui.AWSIoTPubSubGUI()
+        if connect:
+            window.connect_to_iot()
+            self.wait_for(lambda: window.is_connected, 10)
+        return window
+
+    def wait_for(self, condition, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                return False
+            self.process_events(0.002)
+        return True
+
+
+def bench_cold_start(bench: Bench) -> dict:
+    """Process start to first paint (median of N runs), per startup phase."""
+    env = dict(os.environ)
+    if not bench.args.display:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    runs = []
+    for i in range(bench.args.cold_start_runs):
+        env["IOT_DB_PATH"] = str(bench.tmp_dir / f"cold_start_{i}.db")
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(APP_DIR / "iot_pubsub_gui.py"), "--startup-profile", "--no-fullscreen"],
+            cwd=str(APP_DIR), env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        phases = {}
+        try:
+            for line in proc.stdout:
+                parts = line.split()
+                if len(parts) >= 2 and line.startswith("  "):
+                    try:
+                        phases[" ".join(parts[:-1])] = float(parts[-1])
+                    except ValueError:
+                        continue
+                    if parts[0] == "total":
+                        phases["process_to_first_paint"] = (time.perf_counter() - started) * 1000.0
+                        break
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if "total" not in phases:
+            raise RuntimeError("app did not report a startup profile")
+        runs.append(phases)
+    return {
+        "runs": len(runs),
+        "median_ms": {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]},
+    }
+
+
+def bench_ingest(bench: Bench) -> dict:
+    """Messages through on_message_received / insert_message_to_db / the MQTT callback until persisted."""
+    count = bench.args.ingest_messages
+    results = {"messages": count}
+    timestamp = datetime.now().isoformat()
+
+    # Signal-slot path used for already-decoded messages (decode, parse, persist, display)
+    bench.db_path("ingest_slot")
+    window = bench.new_window()
+    pipeline, engine = window.ingest_pipeline, window.engine
+    started = time.perf_counter()
+    for i in range(count):
+        while pipeline.get_stats()["queue_depth"] > 15000:
+            bench.process_events(0.001)
+        window.on_message_received(timestamp, f"bench/device/{i % 16}", PAYLOAD)
+    submitted = time.perf_counter()
+    bench.wait_for(lambda: engine.message_writer.get_stats()["rows_written"] >= count, 120)
+    persisted = time.perf_counter()
+    writer = engine.message_writer.get_stats()
+    results["on_message_received"] = {
+        "submit_per_sec": count / (submitted - started),
+        "persisted_per_sec": writer["rows_written"] / (persisted - started),
+        "rows_written": writer["rows_written"],
+        "dropped": pipeline.get_stats()["dropped"] + writer["dropped"],
+        "avg_commit_ms": writer["avg_commit_ms"],
+        "max_commit_ms": writer["max_commit_ms"],
+    }
+    window.close()
+
+    # Persistence only (batched writer)
+    bench.db_path("ingest_writer")
+    window = bench.new_window()
+    engine = window.engine
+    started = time.perf_counter()
+    for i in range(count):
+        while engine.message_writer.get_stats()["queue_depth"] > 8000:
+            time.sleep(0.001)
+        window.insert_message_to_db(timestamp, f"bench/device/{i % 16}", PAYLOAD)
+    engine.message_writer.flush(60)
+    elapsed = time.perf_counter() - started
+    writer = engine.message_writer.get_stats()
+    results["insert_message_to_db"] = {
+        "rows_per_sec": writer["rows_written"] / elapsed,
+        "rows_written": writer["rows_written"],
+        "dropped": writer["dropped"],
+        "avg_commit_ms": writer["avg_commit_ms"],
+    }
+    window.close()
+
+    # Full MQTT path: broker delivery -> subscribe callback -> pipeline -> database
+    bench.db_path("ingest_mqtt")
+    broker = FakeBroker()
+    window = bench.new_window(broker, connect=True)
+    window.engine.subscribe("bench/#")
+    pipeline, engine = window.ingest_pipeline, window.engine
+    payload = PAYLOAD.encode("utf-8")
+    started = time.perf_counter()
+    for i in range(count):
+        while pipeline.get_stats()["queue_depth"] > 15000:
+            bench.process_events(0.001)
+        broker.inject(f"bench/device/{i % 16}", payload)
+    bench.wait_for(lambda: engine.message_writer.get_stats()["rows_written"] >= count, 120)
+    elapsed = time.perf_counter() - started
+    writer = engine.message_writer.get_stats()
+    results["mqtt_callback"] = {
+        "persisted_per_sec": writer["rows_written"] / elapsed,
+        "rows_written": writer["rows_written"],
+        "dropped": pipeline.get_stats()["dropped"] + writer["dropped"],
+    }
+    window.close()
+    broker.close()
+    return results
+
+
+def _fill_messages(db_path: str, target_rows: int, payload=None):
+    import iot_engine
+    conn = iot_engine.open_database(db_path)
+    iot_engine.migrate_database(conn)
+    have = iot_engine.get_message_count(conn)
+    now = time.time()
+    while have < target_rows:
+        chunk = min(50000, target_rows - have)
+        # One message per 10 ms, ending now
+        rows = ((have + i, now - (target_rows - have - i) / 100.0) for i in range(chunk))
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (timestamp, topic, payload, ts) VALUES (?, ?, ?, ?)",
+                ((datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S"), f"bench/device/{n % 16}",
+                  payload(n) if payload else PAYLOAD, iot_engine.epoch_us(t)) for n, t in rows),
+            )
+        have += chunk
+    conn.close()
+
+
+def bench_viewer(bench: Bench) -> dict:
+    """show_all_messages() from click to first rendered frame at growing table sizes."""
+    db_path = bench.db_path("viewer")
+    results = {}
+    for rows in bench.args.viewer_rows:
+        _fill_messages(db_path, rows)
+        window = bench.new_window()
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            window.show_all_messages()
+            timings.append((time.perf_counter() - started) * 1000.0)
+        window.close()
+        results[str(rows)] = {"open_ms_median": statistics.median(timings), "open_ms_max": max(timings)}
+    return results
+
+
+def _search_payload(n: int) -> str:
+    # 1 in 1000 messages is an alarm; device names give a 500-way prefix search
+    return json.dumps({"seq": n, "temperature": 20 + n % 15, "status": "alarm overheat" if n % 1000 == 0 else "ok",
+                       "device": f"bench-{n % 500:03d}"})
+
+
+def bench_search(bench: Bench) -> dict:
+    """Full-text index build rate and size, and search latency (first page + capped count)."""
+    import iot_engine
+    queries = {"rare_word": "overheat", "common_word": "ok", "prefix": "bench-01*",
+               "phrase": '"alarm overheat"', "topic": "device 7"}
+    results = {}
+    for rows in bench.args.search_rows:
+        db_path = bench.db_path(f"search-{rows}")
+        _fill_messages(db_path, rows, _search_payload)
+        conn = iot_engine.open_database(db_path)
+        iot_engine.migrate_database(conn)
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        indexer = iot_engine.SearchIndexer(db_path, batch_rows=5000)
+        decoder = iot_engine.PayloadDecoder(conn)
+        started = time.perf_counter()
+        while iot_engine.search_index_backlog(conn):
+            indexer.index_pending(conn, decoder)
+        index_secs = time.perf_counter() - started
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        growth = (conn.execute("PRAGMA page_count").fetchone()[0] - pages_before) * page_size
+        result = {"index_rows_per_sec": rows / index_secs if index_secs else 0.0,
+                  "index_mb": growth / 1e6, "index_bytes_per_row": growth / rows}
+        for name, text in queries.items():
+            query = iot_engine.fts_query(text)
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                page = iot_engine.search_messages_page(conn, query, limit=500)
+                count = iot_engine.count_search_matches(conn, query, limit=10000)
+                timings.append((time.perf_counter() - started) * 1000.0)
+            result[name] = {"ms_median": statistics.median(timings), "page_rows": len(page), "count": count}
+        conn.close()
+        results[str(rows)] = result
+    return results
+
+
+def bench_chart(bench: Bench) -> dict:
+    """Live chart: samples/s through the field series listener and frame time with a full buffer."""
+    import iot_engine
+    gui = bench.gui
+    samples = bench.args.chart_samples
+    feed = iot_engine.FieldSeriesFeed(capacity=samples)
+    feed.watch("bench/device/+", "temperature")
+    now = time.time()
+    messages = [
+        iot_engine.ReceivedMessage("", now - 60 + 60 * i / samples, f"bench/device/{i % 16}", "",
+                                   {"temperature": 20 + (i % 1000) / 100, "humidity": 41.2})
+        for i in range(samples)
+    ]
+    started = time.perf_counter()
+    for message in messages:
+        feed.on_message(message)
+    listener_secs = time.perf_counter() - started
+    dialog = gui.LiveChartDialog(feed, lambda: [])
+    dialog.resize(800, 480)
+    dialog.show()
+    bench.process_events(0.05)
+    frames = []
+    for _ in range(20):
+        dialog.chart.grab()
+        frames.append(dialog.chart.frame_ms)
+    result = {
+        "samples": samples,
+        "listener_samples_per_sec": samples / listener_secs if listener_secs else 0.0,
+        "frame_ms_median": statistics.median(frames),
+        "frame_ms_max": max(frames),
+        "points_drawn": dialog.chart.points_drawn,
+    }
+    dialog.close()
+    return result
+
+
+def _fleet_filters(count: int) -> list:
+    """Realistic mix: exact topics, per-site metric filters (+), per-site and per-device subtrees (#)"""
+    filters = []
+    for i in range(count):
+        site, device = i % 50, i // 50
+        kind = i % 4
+        if kind == 0:
+            filters.append(f"fleet/site{site}/dev{device}/temperature")
+        elif kind == 1:
+            filters.append(f"fleet/site{site}/+/metric{device}")
+        elif kind == 2:
+            filters.append(f"fleet/site{site}/dev{device}/#")
+        else:
+            filters.append(f"fleet/+/dev{device}/status/#")
+    return filters
+
+
+def bench_topic_match(bench: Bench) -> dict:
+    """Topics matched against --match-filters subscription filters: TopicFilterTrie vs a linear scan."""
+    import random
+    import iot_engine
+    rng = random.Random(7)
+    results = {}
+    for count in bench.args.match_filters:
+        filters = list(dict.fromkeys(_fleet_filters(count)))
+        trie = iot_engine.TopicFilterTrie(filters)
+        devices = max(1, count // 50)
+        topics = [f"fleet/site{rng.randrange(50)}/dev{rng.randrange(devices)}/"
+                  f"{rng.choice(['temperature', 'status/online', f'metric{rng.randrange(devices)}'])}"
+                  for _ in range(2000)]
+        for topic in topics[:200]:
+            expected = [f for f in filters if iot_engine.topic_matches(f, topic)]
+            assert [f for f, _ in trie.match(topic)] == expected, topic
+        rates = {}
+        for name, match in (("trie", lambda topic: trie.match(topic)),
+                            ("linear", lambda topic: [f for f in filters if iot_engine.topic_matches(f, topic)])):
+            # The linear baseline is O(filters) per topic: cap it at about 1M topic_matches() calls
+            runs, sample = (20, topics) if name == "trie" else (1, topics[:max(100, 1000000 // len(filters))])
+            started = time.perf_counter()
+            for _ in range(runs):
+                for topic in sample:
+                    match(topic)
+            rates[name] = runs * len(sample) / (time.perf_counter() - started)
+        results[str(count)] = {
+            "trie_matches_per_sec": rates["trie"],
+            "linear_matches_per_sec": rates["linear"],
+            "speedup": rates["trie"] / rates["linear"],
+            "avg_matching_filters": sum(len(trie.match(topic)) for topic in topics) / len(topics),
+        }
+    return results
+
+
+def bench_subscribe(bench: Bench) -> dict:
+    """--subscribe-filters filters: one subscription set applied on connect vs blocking subscribe() calls."""
+    gui = bench.gui
+    count = bench.args.subscribe_filters
+    filters = list(dict.fromkeys(_fleet_filters(count)))
+    broker = FakeBroker(latency_secs=bench.args.broker_latency_ms / 1000.0)
+    broker.install()
+    engine = gui.IoTEngine(db_path=bench.db_path("subscribe"))
+    engine.start()
+    try:
+        engine.subscriptions.save_set("bench", filters)
+        engine.connect()
+        bench.wait_for(lambda: engine.subscriptions.get_stats()["subscribed"] >= len(filters), 300)
+        stats = engine.subscriptions.get_stats()
+        bulk_secs = stats["last_batch_secs"]
+        engine.subscriptions.delete_set("bench")
+        bench.wait_for(lambda: not engine.subscribed_topics, 60)
+        started = time.perf_counter()
+        for topic_filter in filters:
+            engine.subscribe(topic_filter)
+        serial_secs = time.perf_counter() - started
+    finally:
+        engine.stop()
+        broker.close()
+    return {
+        "broker_latency_ms": bench.args.broker_latency_ms,
+        "filters": len(filters),
+        "bulk_secs": bulk_secs,
+        "bulk_filters_per_sec": len(filters) / bulk_secs if bulk_secs else None,
+        "avg_suback_ms": stats["avg_suback_secs"] * 1000.0,
+        "serial_secs": serial_secs,
+        "serial_filters_per_sec": len(filters) / serial_secs,
+        "speedup": serial_secs / bulk_secs if bulk_secs else None,
+    }
+
+
+def bench_publish(bench: Bench) -> dict:
+    """Publish throughput through the outbox (PublishEngine) and the load generator."""
+    gui = bench.gui
+    count = bench.args.publish_messages
+    broker = FakeBroker(latency_secs=bench.args.broker_latency_ms / 1000.0)
+    bench.db_path("publish")
+    window = bench.new_window(broker, connect=True)
+    publish_engine = window.publish_engine
+    started = time.perf_counter()
+    for i in range(count):
+        window.engine.publish(f"bench/out/{i % 16}", PAYLOAD)
+    bench.wait_for(lambda: publish_engine.get_stats()["acked"] >= count, 300)
+    elapsed = time.perf_counter() - started
+    stats = publish_engine.get_stats()
+    results = {
+        "broker_latency_ms": bench.args.broker_latency_ms,
+        "outbox": {
+            "messages": count,
+            "acked_per_sec": stats["acked"] / elapsed,
+            "max_in_flight": publish_engine.max_in_flight,
+            "avg_latency_ms": stats["avg_latency_secs"] * 1000.0,
+            "failed": stats["failed"],
+        },
+    }
+    generator = gui.LoadGenerator(
+        window.connection_manager,
+        gui.load_test_topics("bench/load", 16),
+        gui.DEFAULT_LOAD_TEMPLATE,
+        count=count,
+        max_in_flight=100,
+    )
+    generator.start()
+    while not generator.wait(0.05):
+        bench.process_events()
+    report = generator.get_report()
+    results["load_generator"] = {
+        "messages": count,
+        "acked_per_sec": report["achieved_rate"],
+        "max_in_flight": generator.max_in_flight,
+        "p50_ms": report["puback_latency"]["p50_ms"],
+        "p99_ms": report["puback_latency"]["p99_ms"],
+        "failed": report["failed"],
+    }
+    window.close()
+    broker.close()
+    return results
+
+
+def bench_soak(bench: Bench) -> dict:
+    """RSS over a long run with steady incoming traffic and the GUI event loop running."""
+    seconds = bench.args.soak_seconds
+    rate = bench.args.soak_rate
+    broker = FakeBroker()
+    bench.db_path("soak")
+    window = bench.new_window(broker, connect=True)
+    window.engine.subscribe("bench/#")
+    stop = threading.Event()
+    sent = [0]
+
+    def feeder():
+        payload = PAYLOAD.encode("utf-8")
+        started = time.perf_counter()
+        while not stop.is_set():
+            due = int((time.perf_counter() - started) * rate)
+            while sent[0] < due:
+                broker.inject(f"bench/device/{sent[0] % 16}", payload)
+                sent[0] += 1
+            time.sleep(0.005)
+
+    bench.process_events(1.0)  # settle before the baseline sample
+    samples = [(0.0, rss_mb())]
+    thread = threading.Thread(target=feeder, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    next_sample = started + 1.0
+    while time.perf_counter() - started < seconds:
+        bench.process_events(0.02)
+        if time.perf_counter() >= next_sample:
+            samples.append((time.perf_counter() - started, rss_mb()))
+            next_sample += 1.0
+    stop.set()
+    thread.join()
+    window.engine.message_writer.flush(30)
+    rows = window.engine.message_writer.get_stats()["rows_written"]
+    window.close()
+    broker.close()
+
+    # Growth rate over the second half, after caches and buffers have warmed up
+    tail = samples[len(samples) // 2:]
+    slope = 0.0
+    if len(tail) >= 2:
+        mean_t = statistics.mean(t for t, _ in tail)
+        mean_m = statistics.mean(m for _, m in tail)
+        denom = sum((t - mean_t) ** 2 for t, _ in tail)
+        slope = sum((t - mean_t) * (m - mean_m) for t, m in tail) / denom if denom else 0.0
+    return {
+        "seconds": seconds,
+        "rate_per_sec": rate,
+        "messages": sent[0],
+        "rows_written": rows,
+        "rss_start_mb": samples[0][1],
+        "rss_end_mb": samples[-1][1],
+        "rss_peak_mb": max(m for _, m in samples),
+        "rss_growth_mb": samples[-1][1] - samples[0][1],
+        "rss_slope_mb_per_min": slope * 60.0,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def print_comparison(previous: dict, current: dict):
+    old, new = flatten(previous.get("results", {})), flatten(current["results"])
+    print(f"\nComparison with {previous.get('version', '?')} ({previous.get('timestamp', '?')}):")
+    for name in sorted(set(old) & set(new)):
+        change = (new[name] - old[name]) / old[name] * 100.0 if old[name] else 0.0
+        print(f"  {name:<60}{old[name]:>14.2f}{new[name]:>14.2f}{change:>+9.1f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AWS IoT Pub/Sub app against a fake MQTT connection.")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="small sizes and a short soak (explicit options still win)")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<version>-<time>.json)")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--display", action="store_true", help="use the real display instead of offscreen")
+    parser.add_argument("--cold-start-runs", type=int, default=5)
+    parser.add_argument("--ingest-messages", type=int, default=100000)
+    parser.add_argument("--viewer-rows", default="10000,100000,1000000")
+    parser.add_argument("--search-rows", default="100000,1000000,3000000")
+    parser.add_argument("--chart-samples", type=int, default=200000, help="samples in the charted minute")
+    parser.add_argument("--match-filters", default="10,100,1000,10000", help="subscription filter counts for topic_match")
+    parser.add_argument("--subscribe-filters", type=int, default=1000, help="filters in the subscribe benchmark's set")
+    parser.add_argument("--publish-messages", type=int, default=20000)
+    parser.add_argument("--broker-latency-ms", type=float, default=2.0)
+    parser.add_argument("--soak-seconds", type=float, default=600)
+    parser.add_argument("--soak-rate", type=float, default=200, help="incoming messages/s during the soak")
+    args = parser.parse_args(argv)
+    if args.quick:
+        quick = {"cold_start_runs": 2, "ingest_messages": 10000, "viewer_rows": "10000,100000",
+                 "search_rows": "10000,100000", "chart_samples": 50000, "match_filters": "10,100,1000", "subscribe_filters": 200,
+                 "publish_messages": 2000, "soak_seconds": 20}
+        for name, value in quick.items():
+            if getattr(args, name) == parser.get_default(name):
+                setattr(args, name, value)
+    args.viewer_rows = [int(n) for n in args.viewer_rows.split(",") if n.strip()]
+    args.search_rows = [int(n) for n in args.search_rows.split(",") if n.strip()]
+    args.match_filters = [int(n) for n in args.match_filters.split(",") if n.strip()]
+    selected = [name.strip() for name in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    if not args.display:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+
+    version = (APP_DIR / "VERSION").read_text().strip() if (APP_DIR / "VERSION").exists() else "unknown"
+    report = {
+        "version": version,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("only", "output", "compare")},
+        "results": {},
+    }
+    bench = Bench(args)
+    try:
+        for name in BENCHMARKS:
+            if name not in selected:
+                continue
+            print(f"Running {name}...", flush=True)
+            started = time.perf_counter()
+            try:
+                report["results"][name] = globals()[f"bench_{name}"](bench)
+            except Exception as e:
+                report["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  {name} done in {time.perf_counter() - started:.1f} s: "
+                  f"{json.dumps(report['results'][name])}", flush=True)
+    finally:
+        bench.close()
+
+    output = Path(args.output) if args.output else (
+        BENCH_DIR / "results" / f"{version}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"\nResults written to {output}")
+    if args.compare:
+        print_comparison(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
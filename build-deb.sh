@@ -10,7 +10,7 @@ SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 cd "$SCRIPT_DIR"
 
 if [ ! -f "VERSION" ]; then echo "ERROR: VERSION file not found in $SCRIPT_DIR"; exit 1; fi
-for req in iot_pubsub_gui.py requirements.txt iot-pubsub-gui-launch.sh; do [ -f "$req" ] || { echo "ERROR: $req not found"; exit 1; }; done
+for req in iot_pubsub_gui.py iot_engine.py requirements.txt iot-pubsub-gui-launch.sh; do [ -f "$req" ] || { echo "ERROR: $req not found"; exit 1; }; done
 VERSION=$(cat VERSION | tr -d '\r\n ')
 APP_NAME="iot-pubsub-gui"
 INSTALL_PREFIX="/opt/iot-pubsub-gui"
@@ -25,7 +25,7 @@ echo "Building $DEB_NAME (version $VERSION, arch $ARCH) ..."
 
 # App files under /opt/iot-pubsub-gui (single-line loop to avoid CRLF breaking do/done)
 mkdir -p "$PKG_ROOT"
-for f in iot_pubsub_gui.py requirements.txt VERSION iot-pubsub-gui-launch.sh iot-pubsub-gui.svg; do [ -f "$f" ] && cp "$f" "$PKG_ROOT/"; done
+for f in iot_pubsub_gui.py iot_engine.py requirements.txt VERSION iot-pubsub-gui-launch.sh iot-pubsub-gui.svg iot-pubsub-headless.service.example; do [ -f "$f" ] && cp "$f" "$PKG_ROOT/"; done
 chmod +x "$PKG_ROOT/iot-pubsub-gui-launch.sh" 2>/dev/null || true
 sed -i 's/\r$//' "$PKG_ROOT/iot-pubsub-gui-launch.sh" 2>/dev/null || true
 
@@ -0,0 +1,5576 @@
+"""
+GUI-independent engine for the AWS IoT Pub/Sub app.
+
+Everything here runs without PyQt6: MQTT connection and reconnect handling, the ingest
+pipeline and batched SQLite persistence, publishing with the outbox, the load generator
+and latency probe, and the release update logic. iot_pubsub_gui.py builds the window on top
+of IoTEngine; `iot_pubsub_gui.py --headless` runs the same engine as a daemon (e.g. under
+systemd) without loading Qt. Workers report through plain callbacks, which the GUI marshals
+onto its own thread with Qt signals.
+"""
+
+import sys
+import json
+import traceback
+import os
+import sqlite3
+import subprocess
+import logging
+import threading
+import time
+import queue
+import collections
+import functools
+import random
+import concurrent.futures
+import itertools
+import math
+import re
+import argparse
+import csv
+import gzip
+import signal
+import importlib.util
+import struct
+import zlib
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Optional
+
+from awscrt import mqtt
+from awsiot import mqtt_connection_builder
+
+# requests (update check) and GitPython (in-app git updates) are imported on first use;
+# at startup only check that they are installed
+REQUESTS_AVAILABLE = importlib.util.find_spec("requests") is not None
+GITPYTHON_AVAILABLE = importlib.util.find_spec("git") is not None
+# zstandard (optional zstd payload compression) is only imported when zstd is configured
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+# pyarrow (optional Parquet / Arrow export) is only imported when such an export runs
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+# NumPy (optional live charts) is only imported when a chart series is watched
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# Version information
+__version__ = "1.0.0"
+VERSION_FILE = Path(__file__).parent / "VERSION"
+
+# Try to read version from VERSION file if it exists
+if VERSION_FILE.exists():
+    try:
+        with open(VERSION_FILE, 'r') as f:
+            version_from_file = f.read().strip()
+            if version_from_file:
+                __version__ = version_from_file
+    except Exception:
+        pass
+
+LOG_FILE = Path(__file__).parent / "iot_pubsub_gui.log"
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: int = logging.INFO):
+    """File + console logging shared by the GUI and headless modes"""
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+
+
+# AWS IoT connection settings (shared by the GUI and the command-line load test)
+IOT_ENDPOINT = "a1qvvs16o26pnz-ats.iot.ap-southeast-2.amazonaws.com"
+IOT_THING_NAME = "feasibility_demo"
+IOT_CLIENT_ID = "feasibility_demo"
+# Certificate files, relative to the script directory
+IOT_CA_FILE = "AmazonRootCA1.pem"
+IOT_CERT_FILE = "ebb0b9fb27d1eb1ca52f7f89260e123a992759bf3b630f9863575015132ebbef-certificate.pem.crt"
+IOT_KEY_FILE = "ebb0b9fb27d1eb1ca52f7f89260e123a992759bf3b630f9863575015132ebbef-private.pem.key"
+
+# SQLite tuning for iot_messages.db. WAL lets the viewer read while the writer commits.
+# Each value can be overridden with an environment variable, e.g. IOT_DB_SYNCHRONOUS=FULL.
+DB_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # only takes effect when the file is created (see compact_database)
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # safe with WAL; FULL fsyncs on every commit
+    "cache_size": -8000,  # negative = KiB (8 MB page cache)
+    "mmap_size": 64 * 1024 * 1024,
+    "journal_size_limit": 16 * 1024 * 1024,  # truncate the -wal file after checkpoints
+    "busy_timeout": 5000,  # ms to wait on a locked database instead of failing
+}
+
+
+def get_db_pragmas() -> dict:
+    """Return DB_PRAGMAS with IOT_DB_<NAME> environment overrides applied."""
+    pragmas = dict(DB_PRAGMAS)
+    for name in pragmas:
+        value = os.environ.get(f"IOT_DB_{name.upper()}")
+        if value:
+            pragmas[name] = value.strip()
+    return pragmas
+
+
+def open_database(db_path: str, pragmas: Optional[dict] = None) -> sqlite3.Connection:
+    """Open a connection to the message store with the configured pragmas applied."""
+    conn = sqlite3.connect(db_path)
+    for name, value in (pragmas if pragmas is not None else get_db_pragmas()).items():
+        if not str(value).lstrip("-").replace("_", "").isalnum():
+            logger.warning("Ignoring invalid value for PRAGMA %s: %r", name, value)
+            continue
+        result = conn.execute(f"PRAGMA {name} = {value}").fetchone()
+        if name == "journal_mode" and result and str(result[0]).lower() != str(value).lower():
+            logger.warning("SQLite journal_mode is %s (requested %s)", result[0], value)
+    return conn
+
+
+# Schema migrations for iot_messages.db, applied in order on startup.
+# PRAGMA user_version records the last applied version; never edit an entry once released,
+# append a new (version, description, steps) tuple instead. Steps are SQL strings or
+# callables taking the connection.
+DB_MIGRATIONS = [
+    (1, "Create messages table and indexes", [
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_topic ON messages(topic)",
+    ]),
+    (2, "Trigger-maintained message counter", [
+        """
+        CREATE TABLE IF NOT EXISTS message_counts (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR REPLACE INTO message_counts (id, total) SELECT 1, COUNT(*) FROM messages",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert AFTER INSERT ON messages
+        BEGIN
+            UPDATE message_counts SET total = total + 1 WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete AFTER DELETE ON messages
+        BEGIN
+            UPDATE message_counts SET total = total - 1 WHERE id = 1;
+        END
+        """,
+    ]),
+    (3, "Outbox for unacknowledged publishes", [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            qos INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (4, "Integer microsecond epoch column with (topic, ts) index", [
+        "ALTER TABLE messages ADD COLUMN ts INTEGER",
+        # Existing timestamps are local "%Y-%m-%d %H:%M:%S" text ('utc' converts local -> UTC)
+        """
+        UPDATE messages SET ts = COALESCE(
+            CAST(strftime('%s', timestamp, 'utc') AS INTEGER),
+            CAST(strftime('%s', created_at) AS INTEGER),
+            0
+        ) * 1000000
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_topic_ts ON messages(topic, ts)",
+        # Superseded: nothing orders by the text timestamp any more, and (topic, ts) covers topic lookups
+        "DROP INDEX IF EXISTS idx_timestamp",
+        "DROP INDEX IF EXISTS idx_topic",
+    ]),
+    (5, "Per-topic payload compression dictionaries", [
+        """
+        CREATE TABLE IF NOT EXISTS payload_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            codec INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            data BLOB NOT NULL
+        )
+        """,
+    ]),
+    (6, "Full-text index over topic and payload", [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(topic, payload)",
+        # Rows are added by SearchIndexer (it decodes compressed payloads); last_id is its progress
+        """
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+        BEGIN
+            DELETE FROM messages_fts WHERE rowid = old.id;
+        END
+        """,
+    ]),
+    (7, "Extracted JSON payload fields", [
+        """
+        CREATE TABLE IF NOT EXISTS message_field_names (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )
+        """,
+        # One row per (message, field); the value index answers "field <op> value" without payloads
+        """
+        CREATE TABLE IF NOT EXISTS message_fields (
+            message_id INTEGER NOT NULL,
+            field_id INTEGER NOT NULL,
+            value NOT NULL,
+            PRIMARY KEY (message_id, field_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_message_fields_value ON message_fields(field_id, value)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fields_delete AFTER DELETE ON messages
+        BEGIN
+            DELETE FROM message_fields WHERE message_id = old.id;
+        END
+        """,
+    ]),
+    (8, "Per-topic minute/hour rollups", [
+        # bucket_secs 60 or 3600 (bucket_us = bucket start, epoch microseconds) or 0 (all time, bucket_us 0).
+        # Rollups are kept when messages are deleted. Time-first keys keep each batch's upserts on the
+        # same few (rightmost) pages.
+        """
+        CREATE TABLE IF NOT EXISTS message_rollups (
+            bucket_secs INTEGER NOT NULL,
+            bucket_us INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            first_ts INTEGER NOT NULL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (bucket_secs, bucket_us, topic)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_field_rollups (
+            bucket_secs INTEGER NOT NULL,
+            bucket_us INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            field_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (bucket_secs, bucket_us, topic, field_id)
+        ) WITHOUT ROWID
+        """,
+        # Existing messages by stored size (as MessageWriter counts them), then hours from minutes
+        """
+        INSERT OR IGNORE INTO message_rollups
+        SELECT 60, ts - ts % 60000000, topic, COUNT(*), SUM(length(CAST(payload AS BLOB))), MIN(ts), MAX(ts)
+        FROM messages GROUP BY topic, ts - ts % 60000000
+        """,
+        """
+        INSERT OR IGNORE INTO message_field_rollups
+        SELECT 60, m.ts - m.ts % 60000000, m.topic, f.field_id, COUNT(*), SUM(f.value), MIN(f.value), MAX(f.value)
+        FROM message_fields AS f JOIN messages AS m ON m.id = f.message_id
+        WHERE f.value < ''
+        GROUP BY m.topic, f.field_id, m.ts - m.ts % 60000000
+        """,
+        """
+        INSERT OR IGNORE INTO message_rollups
+        SELECT 3600, bucket_us - bucket_us % 3600000000, topic, SUM(count), SUM(bytes), MIN(first_ts), MAX(last_ts)
+        FROM message_rollups WHERE bucket_secs = 60 GROUP BY topic, bucket_us - bucket_us % 3600000000
+        """,
+        """
+        INSERT OR IGNORE INTO message_field_rollups
+        SELECT 3600, bucket_us - bucket_us % 3600000000, topic, field_id, SUM(count), SUM(sum), MIN(min), MAX(max)
+        FROM message_field_rollups WHERE bucket_secs = 60
+        GROUP BY topic, field_id, bucket_us - bucket_us % 3600000000
+        """,
+        """
+        INSERT OR IGNORE INTO message_rollups
+        SELECT 0, 0, topic, SUM(count), SUM(bytes), MIN(first_ts), MAX(last_ts)
+        FROM message_rollups WHERE bucket_secs = 3600 GROUP BY topic
+        """,
+        """
+        INSERT OR IGNORE INTO message_field_rollups
+        SELECT 0, 0, topic, field_id, SUM(count), SUM(sum), MIN(min), MAX(max)
+        FROM message_field_rollups WHERE bucket_secs = 3600 GROUP BY topic, field_id
+        """,
+    ]),
+    (9, "Create named subscription sets", [
+        """
+        CREATE TABLE IF NOT EXISTS subscription_sets (
+            name TEXT PRIMARY KEY,
+            enabled INTEGER NOT NULL DEFAULT 1
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subscription_set_filters (
+            set_name TEXT NOT NULL,
+            topic_filter TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (set_name, topic_filter)
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+
+def migrate_database(conn: sqlite3.Connection, migrations=None) -> tuple:
+    """
+    Apply pending schema migrations, each in its own transaction.
+    Returns (previous_version, current_version).
+    """
+    migrations = DB_MIGRATIONS if migrations is None else migrations
+    previous = current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Database migrated to schema version %d: %s", version, description)
+        current = version
+    return previous, current
+
+
+def get_message_count(conn: sqlite3.Connection) -> int:
+    """Total stored messages from the trigger-maintained counter (no table scan)."""
+    row = conn.execute("SELECT total FROM message_counts WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def epoch_us(epoch_secs: float) -> int:
+    """Epoch seconds (time.time()) -> integer microseconds, as stored in messages.ts."""
+    return int(round(epoch_secs * 1_000_000))
+
+
+def timestamp_to_epoch_us(timestamp: str) -> Optional[int]:
+    """Local "%Y-%m-%d %H:%M:%S" (or ISO 8601) text -> epoch microseconds; None if unparsable."""
+    try:
+        return epoch_us(datetime.fromisoformat(timestamp).timestamp())
+    except (ValueError, TypeError):
+        return None
+
+
+def format_epoch_us(ts_us: Optional[int]) -> str:
+    """messages.ts -> local time with milliseconds for display."""
+    if ts_us is None:
+        return ""
+    return datetime.fromtimestamp(ts_us / 1_000_000).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+# Extracted payload fields (IOT_DB_FIELDS="temperature,sensor.humidity,readings[0]"): the writer
+# parses each JSON payload once and stores the scalar values at these paths in message_fields.
+_FIELD_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+
+def parse_field_path(path: str) -> tuple:
+    """ "sensor.readings[0]" -> ("sensor", "readings", 0); raises ValueError if malformed."""
+    path = path.strip().removeprefix("$.")
+    keys, pos = [], 0
+    while pos < len(path):
+        if keys and path[pos] == ".":
+            pos += 1
+        match = _FIELD_PATH_TOKEN.match(path, pos)
+        if not match:
+            raise ValueError(f"Invalid field path: {path!r}")
+        keys.append(match.group(1) if match.group(1) is not None else int(match.group(2)))
+        pos = match.end()
+    if not keys:
+        raise ValueError("Empty field path")
+    return tuple(keys)
+
+
+def lookup_field(doc, keys: tuple):
+    """Value at parsed path keys in a decoded JSON document, or None if the path is missing"""
+    value = doc
+    for key in keys:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+def numeric_paths(doc, limit: int = 100) -> list:
+    """Paths of the number and boolean leaves of a decoded JSON document, in document order"""
+    paths = []
+
+    def walk(value, path):
+        if len(paths) >= limit:
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(item, f"{path}.{key}" if path else str(key))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                walk(item, f"{path}[{index}]")
+        elif isinstance(value, (int, float)) and path:
+            paths.append(path)
+
+    walk(doc, "")
+    return paths
+
+
+def get_extracted_fields() -> list:
+    """Field paths to extract from payloads (IOT_DB_FIELDS, comma-separated); invalid ones are logged and skipped."""
+    paths = []
+    for path in os.environ.get("IOT_DB_FIELDS", "").split(","):
+        if not path.strip():
+            continue
+        try:
+            parse_field_path(path)
+        except ValueError as e:
+            logger.warning(f"Ignoring IOT_DB_FIELDS entry: {e}")
+            continue
+        paths.append(path.strip().removeprefix("$."))
+    return paths
+
+
+class FieldExtractor:
+    """
+    Pulls scalar values at configured JSON paths out of payloads (writer thread only).
+    Numbers are stored as numbers, booleans as 0/1 and strings as text; missing paths,
+    nulls, objects and arrays store nothing. Non-JSON payloads are skipped cheaply.
+    """
+
+    MAX_TEXT = 256  # longer strings are not useful as filter values
+
+    def __init__(self, paths: list):
+        self.paths = [path.strip().removeprefix("$.") for path in paths]
+        self._keys = [parse_field_path(path) for path in self.paths]
+        self._stats = {"rows": 0, "values": 0, "cpu_secs": 0.0}
+
+    def extract(self, payload: str) -> list:
+        """[(path index, value), ...] for one payload."""
+        started = time.thread_time()
+        values = []
+        self._stats["rows"] += 1
+        text = payload.lstrip() if isinstance(payload, str) else ""
+        if text[:1] in ("{", "["):
+            try:
+                doc = json.loads(text)
+            except ValueError:
+                doc = None
+            for index, keys in enumerate(self._keys):
+                value = lookup_field(doc, keys)
+                if isinstance(value, bool):
+                    values.append((index, int(value)))
+                elif isinstance(value, (int, float)) and value == value and abs(value) != float("inf"):
+                    values.append((index, value))
+                elif isinstance(value, str) and len(value) <= self.MAX_TEXT:
+                    values.append((index, value))
+        self._stats["values"] += len(values)
+        self._stats["cpu_secs"] += time.thread_time() - started
+        return values
+
+    def field_ids(self, conn: sqlite3.Connection) -> list:
+        """Ids of the configured paths in this database (registered on first use)."""
+        known = dict(conn.execute("SELECT path, id FROM message_field_names"))
+        missing = [path for path in self.paths if path not in known]
+        if missing:
+            conn.executemany("INSERT OR IGNORE INTO message_field_names (path) VALUES (?)", [(p,) for p in missing])
+            known = dict(conn.execute("SELECT path, id FROM message_field_names"))
+        return [known[path] for path in self.paths]
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["paths"] = self.paths
+        stats["cpu_us_per_row"] = stats["cpu_secs"] * 1e6 / stats["rows"] if stats["rows"] else 0.0
+        return stats
+
+
+class FieldFilter:
+    """
+    One "field <op> value" condition on an extracted field, e.g. FieldFilter.parse("temperature > 80").
+    A value that parses as a number compares against numeric values only, anything else against
+    text values only, so the condition reads one range of idx_message_fields_value.
+    """
+    __slots__ = ("path", "op", "value")
+
+    OPERATORS = ("=", "!=", ">", ">=", "<", "<=")
+    _PATTERN = re.compile(r"^\s*(.+?)\s*(!=|>=|<=|=|>|<)\s*(.*?)\s*$")
+
+    def __init__(self, path: str, op: str, value):
+        if op not in self.OPERATORS:
+            raise ValueError(f"Unknown operator: {op}")
+        parse_field_path(path)
+        self.path = path.strip().removeprefix("$.")
+        self.op = op
+        if isinstance(value, str):
+            try:
+                number = float(value) if value.strip() else None
+            except ValueError:
+                number = None
+            # Only finite numbers: "nan"/"inf" would bind as NULL or overflow, so they stay text
+            if number is not None and math.isfinite(number):
+                value = number
+            elif len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]  # quoted: always text ("007")
+        self.value = value
+
+    @classmethod
+    def parse(cls, text: str) -> "FieldFilter":
+        match = cls._PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Expected '<field> <op> <value>', got {text!r}")
+        return cls(*match.groups())
+
+    def clause(self, schema: str = "main", alias: str = "", dense: bool = False) -> tuple:
+        """
+        (SQL condition on messages, params). The default collects the matching ids from the value
+        index (best when few messages match); dense probes each candidate message by primary key
+        instead, so a page ordered by ts stops early when most messages match (see is_dense).
+        """
+        condition, params = self._value_condition(schema)
+        if dense:
+            return (f"EXISTS (SELECT 1 FROM {schema}.message_fields WHERE message_id = {alias}id AND {condition})",
+                    params)
+        return f"{alias}id IN (SELECT message_id FROM {schema}.message_fields WHERE {condition})", params
+
+    def count(self, conn: sqlite3.Connection, schema: str = "main", limit: Optional[int] = None) -> int:
+        """Matching messages counted on the value index alone (up to limit)."""
+        condition, params = self._value_condition(schema)
+        sql = f"SELECT 1 FROM {schema}.message_fields WHERE {condition}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+    def is_dense(self, conn: sqlite3.Connection, schema: str, page_size: int) -> bool:
+        """
+        True if a page is found sooner by probing messages in ts order (about
+        page_size * total / matches lookups) than by collecting every match.
+        """
+        total = count_messages_in_range(conn, schema=schema)
+        cap = int(math.sqrt(page_size * total)) + 1
+        return self.count(conn, schema, cap) >= cap
+
+    def _value_condition(self, schema: str) -> tuple:
+        numeric = isinstance(self.value, (int, float))
+        # Numbers sort before all text in SQLite, so '' separates the two kinds of value
+        kind = "value < ''" if numeric else "value >= '' AND value < x''"
+        return (
+            f"field_id = (SELECT id FROM {schema}.message_field_names WHERE path = ?) "
+            f"AND value {self.op} ? AND {kind}",
+            [self.path, self.value],
+        )
+
+    def describe(self) -> str:
+        return f"{self.path} {self.op} {self.value:g}" if isinstance(self.value, float) else \
+            f"{self.path} {self.op} {self.value}"
+
+
+def list_fields(conn: sqlite3.Connection, schema: str = "main") -> list:
+    """Extracted field paths stored in a database."""
+    return [row[0] for row in conn.execute(f"SELECT path FROM {schema}.message_field_names ORDER BY path")]
+
+
+def backfill_fields(conn: sqlite3.Connection, extractor: FieldExtractor, batch_rows: int = 1000, on_progress=None) -> int:
+    """
+    Extract the configured fields from messages stored before they were configured, and add the
+    new numeric values to the field rollups. Runs in batch_rows transactions (so it can run next
+    to the writer); returns the values added.
+    """
+    decoder = PayloadDecoder(conn)
+    with conn:
+        field_ids = extractor.field_ids(conn)
+    added, after_id = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, topic, ts, payload FROM messages WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_rows)
+        ).fetchall()
+        if not rows:
+            return added
+        with conn:
+            existing = set(conn.execute(
+                "SELECT message_id, field_id FROM message_fields WHERE message_id BETWEEN ? AND ?",
+                (rows[0][0], rows[-1][0]),
+            ))
+            new_rows = []
+            for message_id, topic, ts, payload in rows:
+                values = [(field_ids[index], value) for index, value in extractor.extract(decoder.decode(payload))
+                          if (message_id, field_ids[index]) not in existing]
+                if values:
+                    new_rows.append((message_id, topic, ts, values))
+            conn.executemany(
+                "INSERT INTO message_fields (message_id, field_id, value) VALUES (?, ?, ?)",
+                [(message_id, field_id, value) for message_id, _, _, values in new_rows for field_id, value in values],
+            )
+            update_rollups(conn, [(topic, ts, 0, values) for _, topic, ts, values in new_rows], messages=False)
+            added += sum(len(values) for *_, values in new_rows)
+        after_id = rows[-1][0]
+        if on_progress:
+            on_progress(after_id, added)
+
+
+def _range_clause(
+    start_us: Optional[int],
+    end_us: Optional[int],
+    topic: Optional[str],
+    alias: str = "",
+) -> tuple:
+    conditions, params = [], []
+    if topic is not None:
+        conditions.append(f"{alias}topic = ?")
+        params.append(topic)
+    if start_us is not None:
+        conditions.append(f"{alias}ts >= ?")
+        params.append(start_us)
+    if end_us is not None:
+        conditions.append(f"{alias}ts < ?")
+        params.append(end_us)
+    return conditions, params
+
+
+def fetch_messages_page(
+    conn: sqlite3.Connection,
+    after_key: Optional[tuple] = None,
+    limit: int = 500,
+    schema: str = "main",
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    field_filter: Optional[FieldFilter] = None,
+    oldest_first: bool = False,
+) -> list:
+    """
+    One page of messages, newest first (or oldest_first), using keyset pagination on (ts, id).
+    Pass the (ts, id) of the last row of the previous page as after_key. start_us/end_us limit
+    the page to [start_us, end_us) and topic to one topic; both are answered from the ts and
+    (topic, ts) indexes. field_filter keeps messages whose extracted field matches.
+    schema selects an ATTACHed database (e.g. a shard). Rows are (id, ts, topic, payload, created_at).
+    """
+    conditions, params = _range_clause(start_us, end_us, topic)
+    if field_filter is not None:
+        condition, condition_params = field_filter.clause(schema, dense=field_filter.is_dense(conn, schema, limit))
+        conditions.append(condition)
+        params.extend(condition_params)
+    if after_key is not None:
+        conditions.append(f"(ts, id) {'>' if oldest_first else '<'} (?, ?)")
+        params.extend(after_key)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ts, id" if oldest_first else "ts DESC, id DESC"
+    return conn.execute(
+        f"""
+        SELECT id, ts, topic, payload, created_at FROM {schema}.messages
+        {where} ORDER BY {order} LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+
+
+def count_messages_in_range(
+    conn: sqlite3.Connection,
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    schema: str = "main",
+    field_filter: Optional[FieldFilter] = None,
+) -> int:
+    """Messages in [start_us, end_us) (optionally for one topic / matching field_filter), counted on the index."""
+    if start_us is None and end_us is None and topic is None and field_filter is None:
+        return get_message_count(conn) if schema == "main" else conn.execute(
+            f"SELECT total FROM {schema}.message_counts WHERE id = 1"
+        ).fetchone()[0]
+    if start_us is None and end_us is None and topic is None:
+        return field_filter.count(conn, schema)
+    conditions, params = _range_clause(start_us, end_us, topic)
+    if field_filter is not None:
+        condition, condition_params = field_filter.clause(schema)
+        conditions.append(condition)
+        params.extend(condition_params)
+    return conn.execute(
+        f"SELECT COUNT(*) FROM {schema}.messages WHERE {' AND '.join(conditions)}", params
+    ).fetchone()[0]
+
+
+def list_topics(conn: sqlite3.Connection, schema: str = "main") -> list:
+    """Distinct stored topics: one (topic, ts) index seek per topic instead of a full index scan."""
+    return [row[0] for row in conn.execute(
+        f"""
+        WITH RECURSIVE topics(topic) AS (
+            SELECT MIN(topic) FROM {schema}.messages
+            UNION ALL
+            SELECT (SELECT MIN(topic) FROM {schema}.messages WHERE topic > topics.topic)
+            FROM topics WHERE topics.topic IS NOT NULL
+        )
+        SELECT topic FROM topics WHERE topic IS NOT NULL
+        """
+    )]
+
+
+# Per-topic rollups, maintained by the message writer in the same transaction as the inserts:
+# one row per topic per minute, per hour and for all time (bucket_secs 0), with count, payload
+# bytes and first/last ts, plus count/sum/min/max of every numeric extracted field (IOT_DB_FIELDS).
+ROLLUP_BUCKETS = (60, 3600, 0)
+
+_ROLLUP_UPSERT = """
+    INSERT INTO message_rollups (bucket_secs, bucket_us, topic, count, bytes, first_ts, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket_secs, bucket_us, topic) DO UPDATE SET
+        count = count + excluded.count, bytes = bytes + excluded.bytes,
+        first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts)
+"""
+_FIELD_ROLLUP_UPSERT = """
+    INSERT INTO message_field_rollups (bucket_secs, bucket_us, topic, field_id, count, sum, min, max)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket_secs, bucket_us, topic, field_id) DO UPDATE SET
+        count = count + excluded.count, sum = sum + excluded.sum,
+        min = MIN(min, excluded.min), max = MAX(max, excluded.max)
+"""
+
+
+def get_rollup_settings() -> tuple:
+    """(enabled, days of minute rollups to keep) from IOT_DB_ROLLUPS and IOT_DB_ROLLUP_MINUTE_DAYS"""
+    enabled = os.environ.get("IOT_DB_ROLLUPS", "1").strip().lower() not in ("0", "false", "no")
+    days = os.environ.get("IOT_DB_ROLLUP_MINUTE_DAYS")
+    return enabled, float(days) if days else 7.0
+
+
+def update_rollups(conn: sqlite3.Connection, rows, messages: bool = True):
+    """
+    Add messages to the rollups (call inside the transaction that inserts them).
+    rows: (topic, ts_us, payload bytes, [(field_id, value), ...]); text values are ignored.
+    messages=False only adds the field values (for messages that are already counted).
+    """
+    # Aggregate rows into minutes, then minutes into hours and all time
+    totals, fields = {}, {}
+    for topic, ts, size, values in rows:
+        key = (60, ts - ts % 60_000_000, topic)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [1, size, ts, ts]
+        else:
+            total[0] += 1
+            total[1] += size
+            if ts < total[2]:
+                total[2] = ts
+            if ts > total[3]:
+                total[3] = ts
+        for field_id, value in values:
+            if isinstance(value, str):
+                continue
+            field = fields.get(key + (field_id,))
+            if field is None:
+                fields[key + (field_id,)] = [1, value, value, value]
+            else:
+                field[0] += 1
+                field[1] += value
+                if value < field[2]:
+                    field[2] = value
+                if value > field[3]:
+                    field[3] = value
+    for groups in (totals, fields):
+        for key, (count, total, low, high) in list(groups.items()):
+            for coarse in ((3600, key[1] - key[1] % 3_600_000_000), (0, 0)):
+                group = groups.get(coarse + key[2:])
+                if group is None:
+                    groups[coarse + key[2:]] = [count, total, low, high]
+                else:
+                    group[0] += count
+                    group[1] += total
+                    group[2] = min(group[2], low)
+                    group[3] = max(group[3], high)
+    if messages:
+        conn.executemany(_ROLLUP_UPSERT, [(*key, *total) for key, total in totals.items()])
+    if fields:
+        conn.executemany(_FIELD_ROLLUP_UPSERT, [(*key, *field) for key, field in fields.items()])
+
+
+def prune_minute_rollups(conn: sqlite3.Connection, keep_days: float) -> int:
+    """Delete minute rollups older than keep_days (hour and all-time rollups are kept)."""
+    cutoff = epoch_us(time.time() - keep_days * 86400)
+    deleted = conn.execute(
+        "DELETE FROM message_rollups WHERE bucket_secs = 60 AND bucket_us < ?", (cutoff,)
+    ).rowcount
+    return deleted + conn.execute(
+        "DELETE FROM message_field_rollups WHERE bucket_secs = 60 AND bucket_us < ?", (cutoff,)
+    ).rowcount
+
+
+def fetch_rollups(
+    conn: sqlite3.Connection,
+    bucket_secs: int = 60,
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    schema: str = "main",
+) -> list:
+    """Rollup rows (bucket_us, topic, count, bytes, first_ts, last_ts) for buckets starting in [start_us, end_us)."""
+    conditions, params = ["bucket_secs = ?"], [bucket_secs]
+    for condition, value in (("bucket_us >= ?", start_us), ("bucket_us < ?", end_us), ("topic = ?", topic)):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    return conn.execute(
+        f"""
+        SELECT bucket_us, topic, count, bytes, first_ts, last_ts FROM {schema}.message_rollups
+        WHERE {' AND '.join(conditions)} ORDER BY bucket_us, topic
+        """,
+        params,
+    ).fetchall()
+
+
+def fetch_field_rollups(
+    conn: sqlite3.Connection,
+    path: str,
+    bucket_secs: int = 60,
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    schema: str = "main",
+) -> list:
+    """Rollup rows (bucket_us, topic, count, avg, min, max) of one extracted field."""
+    conditions = ["r.bucket_secs = ?", f"r.field_id = (SELECT id FROM {schema}.message_field_names WHERE path = ?)"]
+    params = [bucket_secs, path.strip().removeprefix("$.")]
+    for condition, value in (("r.bucket_us >= ?", start_us), ("r.bucket_us < ?", end_us), ("r.topic = ?", topic)):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    return conn.execute(
+        f"""
+        SELECT r.bucket_us, r.topic, r.count, r.sum / r.count, r.min, r.max FROM {schema}.message_field_rollups AS r
+        WHERE {' AND '.join(conditions)} ORDER BY r.bucket_us, r.topic
+        """,
+        params,
+    ).fetchall()
+
+
+def topic_summary(conn: sqlite3.Connection, recent_secs: float = 3600, schema: str = "main") -> list:
+    """
+    Per topic: (topic, count, bytes, first_ts, last_ts, recent count, recent bytes), all time from
+    the all-time rollups plus the last recent_secs from minute rollups. Reads O(topics) rows
+    (x recent minutes), however many messages are stored.
+    """
+    since = epoch_us(time.time() - recent_secs)
+    since -= since % 60_000_000
+    return conn.execute(
+        f"""
+        SELECT a.topic, a.count, a.bytes, a.first_ts, a.last_ts, COALESCE(m.count, 0), COALESCE(m.bytes, 0)
+        FROM {schema}.message_rollups AS a
+        LEFT JOIN (
+            SELECT topic, SUM(count) AS count, SUM(bytes) AS bytes FROM {schema}.message_rollups
+            WHERE bucket_secs = 60 AND bucket_us >= ? GROUP BY topic
+        ) AS m ON m.topic = a.topic
+        WHERE a.bucket_secs = 0
+        ORDER BY a.topic
+        """,
+        (since,),
+    ).fetchall()
+
+
+def field_summary(conn: sqlite3.Connection, recent_secs: float = 3600, schema: str = "main") -> list:
+    """Per topic and numeric extracted field over the last recent_secs: (topic, path, count, avg, min, max)."""
+    since = epoch_us(time.time() - recent_secs)
+    since -= since % 60_000_000
+    return conn.execute(
+        f"""
+        SELECT r.topic, n.path, SUM(r.count), SUM(r.sum) / SUM(r.count), MIN(r.min), MAX(r.max)
+        FROM {schema}.message_field_rollups AS r JOIN {schema}.message_field_names AS n ON n.id = r.field_id
+        WHERE r.bucket_secs = 60 AND r.bucket_us >= ?
+        GROUP BY r.topic, n.path ORDER BY r.topic, n.path
+        """,
+        (since,),
+    ).fetchall()
+
+
+@functools.lru_cache(maxsize=2048)
+def format_payload(payload: str) -> str:
+    """Pretty-print a JSON payload for display; other text is returned unchanged."""
+    try:
+        return json.dumps(json.loads(payload), indent=2)
+    except (ValueError, TypeError):
+        return payload
+
+
+# Optional per-row payload compression (IOT_DB_COMPRESSION=zlib|zstd). A compressed payload is
+# stored as a BLOB: a 5-byte header (codec id, dictionary id; 0 = no dictionary) + compressed
+# bytes. Uncompressed payloads stay TEXT, so old rows and mixed databases read the same way.
+# Per-topic dictionaries live in payload_dictionaries in the main database (also for shards).
+PAYLOAD_CODECS = {"zlib": 1, "zstd": 2}
+_PAYLOAD_HEADER = struct.Struct("<BI")
+_ZLIB_WBITS = -13  # raw deflate, 8 KB window (the dictionary must fit in it)
+_ZLIB_MEMLEVEL = 6
+
+
+def get_compression_settings() -> tuple:
+    """
+    (codec or None, level or None, use_dictionaries) from IOT_DB_COMPRESSION (zlib|zstd),
+    IOT_DB_COMPRESSION_LEVEL and IOT_DB_COMPRESSION_DICT (0 disables per-topic dictionaries).
+    """
+    codec = (os.environ.get("IOT_DB_COMPRESSION") or "").strip().lower() or None
+    if codec and codec not in PAYLOAD_CODECS:
+        logger.warning("Ignoring invalid IOT_DB_COMPRESSION=%r (use zlib or zstd)", codec)
+        codec = None
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("IOT_DB_COMPRESSION=zstd needs the zstandard package (pip install zstandard); using zlib")
+        codec = "zlib"
+    level = os.environ.get("IOT_DB_COMPRESSION_LEVEL")
+    use_dictionaries = os.environ.get("IOT_DB_COMPRESSION_DICT", "1").strip() not in ("0", "false", "no")
+    return codec, int(level) if level else None, use_dictionaries
+
+
+class PayloadCompressor:
+    """
+    Compresses payloads for the message writer (writer thread only).
+    The first train_samples payloads of each topic are compressed without a dictionary and kept
+    as samples; then a dictionary is built from them (zstd: trained with zstandard; zlib: the most
+    recent samples as a preset dictionary), stored in payload_dictionaries and used for every
+    later payload of that topic. Payloads shorter than min_size, or that do not get smaller,
+    are stored as plain text. get_stats() reports the ratio and the CPU time spent.
+    """
+
+    def __init__(
+        self,
+        codec: str = "zlib",
+        level: Optional[int] = None,
+        use_dictionaries: bool = True,
+        train_samples: int = 200,
+        dict_size: int = 4096,
+        max_dictionaries: int = 256,
+        min_size: int = 64,
+    ):
+        if codec not in PAYLOAD_CODECS:
+            raise ValueError(f"Unknown payload codec: {codec}")
+        self.codec = codec
+        self.codec_id = PAYLOAD_CODECS[codec]
+        self.level = level if level is not None else (6 if codec == "zlib" else 3)
+        self.use_dictionaries = use_dictionaries
+        self.train_samples = train_samples
+        # zlib can only reference the last window of data (8 KB); zstd dictionaries are trained to dict_size
+        self.dict_size = 1 << -_ZLIB_WBITS if codec == "zlib" else dict_size
+        self.max_dictionaries = max_dictionaries
+        self.min_size = min_size
+        self._compressors = {}  # dictionary id (0 = none) -> primed compressor
+        self._topic_dicts = {}  # topic -> dictionary id
+        self._samples = {}  # topic -> payloads collected for training
+        self._loaded = False
+        self._stats = {"rows": 0, "compressed_rows": 0, "raw_bytes": 0, "stored_bytes": 0,
+                       "cpu_secs": 0.0, "dictionaries": 0}
+
+    def compress(self, conn: sqlite3.Connection, topic: str, payload: str):
+        """Stored value for `payload`: header + compressed bytes, or the text itself."""
+        started = time.thread_time()
+        if not self._loaded:
+            self._load_dictionaries(conn)
+        raw = payload.encode("utf-8")
+        value = payload
+        if len(raw) >= self.min_size:
+            dict_id = self._topic_dicts.get(topic) if self.use_dictionaries else 0
+            if dict_id is None:
+                dict_id = self._collect_sample(conn, topic, raw)
+            compressed = _PAYLOAD_HEADER.pack(self.codec_id, dict_id) + self._compress(dict_id, raw)
+            if len(compressed) < len(raw):
+                value = compressed
+        s = self._stats
+        s["rows"] += 1
+        s["raw_bytes"] += len(raw)
+        s["stored_bytes"] += len(value) if isinstance(value, bytes) else len(raw)
+        s["compressed_rows"] += isinstance(value, bytes)
+        s["cpu_secs"] += time.thread_time() - started
+        return value
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["codec"] = self.codec
+        stats["ratio"] = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 1.0
+        stats["cpu_us_per_row"] = stats["cpu_secs"] * 1e6 / stats["rows"] if stats["rows"] else 0.0
+        return stats
+
+    def _compress(self, dict_id: int, raw: bytes) -> bytes:
+        compressor = self._compressors.get(dict_id)
+        if compressor is None:
+            compressor = self._compressors[dict_id] = _make_compressor(self.codec, self.level, self._dict_data.get(dict_id))
+        if self.codec == "zlib":
+            c = compressor.copy()  # copying a primed compressobj is much cheaper than building one
+            return c.compress(raw) + c.flush()
+        return compressor.compress(raw)
+
+    def _load_dictionaries(self, conn):
+        self._loaded = True
+        self._dict_data = {}
+        for dict_id, topic, data in conn.execute(
+            "SELECT id, topic, data FROM payload_dictionaries WHERE codec = ? ORDER BY id", (self.codec_id,)
+        ):
+            self._dict_data[dict_id] = bytes(data)
+            self._topic_dicts[topic] = dict_id
+        self._stats["dictionaries"] = len(self._topic_dicts)
+
+    def _collect_sample(self, conn, topic: str, raw: bytes) -> int:
+        if len(self._topic_dicts) >= self.max_dictionaries:
+            return 0
+        samples = self._samples.setdefault(topic, [])
+        samples.append(raw)
+        if len(samples) < self.train_samples:
+            return 0
+        del self._samples[topic]
+        try:
+            data = self._train(samples)
+        except Exception as e:
+            logger.warning("Could not build a compression dictionary for %s: %s", topic, e)
+            self._topic_dicts[topic] = 0  # do not retry; compress this topic without a dictionary
+            return 0
+        with conn:
+            dict_id = conn.execute(
+                "INSERT INTO payload_dictionaries (topic, codec, created_at, data) VALUES (?, ?, ?, ?)",
+                (topic, self.codec_id, time.time(), data),
+            ).lastrowid
+        self._dict_data[dict_id] = data
+        self._topic_dicts[topic] = dict_id
+        self._stats["dictionaries"] = len(self._topic_dicts)
+        logger.info("Compression dictionary %d (%d bytes) created for topic %s", dict_id, len(data), topic)
+        return dict_id
+
+    def _train(self, samples: list) -> bytes:
+        if self.codec == "zstd":
+            import zstandard
+            return zstandard.train_dictionary(self.dict_size, samples).as_bytes()
+        # zlib: the most recent samples, newest last (deflate favours the nearest match)
+        return b"".join(samples)[-self.dict_size:]
+
+
+def _make_compressor(codec: str, level: int, dict_data: Optional[bytes]):
+    if codec == "zlib":
+        if dict_data:
+            return zlib.compressobj(level, zlib.DEFLATED, _ZLIB_WBITS, _ZLIB_MEMLEVEL, zdict=dict_data)
+        return zlib.compressobj(level, zlib.DEFLATED, _ZLIB_WBITS, _ZLIB_MEMLEVEL)
+    import zstandard
+    # Magicless frames without a dictionary id: the row header already identifies both
+    params = zstandard.ZstdCompressionParameters.from_level(
+        level, format=zstandard.FORMAT_ZSTD1_MAGICLESS, write_dict_id=False, write_content_size=True
+    )
+    return zstandard.ZstdCompressor(
+        dict_data=zstandard.ZstdCompressionDict(dict_data) if dict_data else None, compression_params=params
+    )
+
+
+class PayloadDecoder:
+    """
+    Turns stored payload values back into text for readers (viewer, exports).
+    Dictionaries are loaded on demand from payload_dictionaries on `conn` (the main database).
+    get_stats() reports the stored vs. decoded size and the CPU time spent decompressing.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._decompressors = {}  # (codec id, dictionary id) -> decompress(bytes) callable
+        self._stats = {"rows": 0, "compressed_rows": 0, "stored_bytes": 0, "raw_bytes": 0, "cpu_secs": 0.0}
+
+    def decode(self, value) -> str:
+        s = self._stats
+        s["rows"] += 1
+        if not isinstance(value, bytes):
+            size = len(value.encode("utf-8")) if value else 0
+            s["stored_bytes"] += size
+            s["raw_bytes"] += size
+            return value
+        started = time.thread_time()
+        try:
+            codec_id, dict_id = _PAYLOAD_HEADER.unpack_from(value)
+            text = self._decompressor(codec_id, dict_id)(value[_PAYLOAD_HEADER.size:]).decode("utf-8")
+        except Exception as e:
+            text = f"Error decoding stored payload: {e}"
+        s["cpu_secs"] += time.thread_time() - started
+        s["compressed_rows"] += 1
+        s["stored_bytes"] += len(value)
+        s["raw_bytes"] += len(text.encode("utf-8"))
+        return text
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["ratio"] = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 1.0
+        compressed = stats["compressed_rows"]
+        stats["cpu_us_per_row"] = stats["cpu_secs"] * 1e6 / compressed if compressed else 0.0
+        return stats
+
+    def _decompressor(self, codec_id: int, dict_id: int):
+        key = (codec_id, dict_id)
+        fn = self._decompressors.get(key)
+        if fn is not None:
+            return fn
+        dict_data = None
+        if dict_id:
+            row = self._conn.execute("SELECT data FROM payload_dictionaries WHERE id = ?", (dict_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"compression dictionary {dict_id} is missing")
+            dict_data = bytes(row[0])
+        if codec_id == PAYLOAD_CODECS["zlib"]:
+            def fn(data, zdict=dict_data):
+                d = zlib.decompressobj(_ZLIB_WBITS, zdict=zdict) if zdict else zlib.decompressobj(_ZLIB_WBITS)
+                return d.decompress(data) + d.flush()
+        elif codec_id == PAYLOAD_CODECS["zstd"]:
+            import zstandard
+            fn = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(dict_data) if dict_data else None,
+                format=zstandard.FORMAT_ZSTD1_MAGICLESS,
+            ).decompress
+        else:
+            raise ValueError(f"unknown payload codec {codec_id}")
+        self._decompressors[key] = fn
+        return fn
+
+
+def measure_compression(conn: sqlite3.Connection, limit: int = 10000, schema: str = "main",
+                        decoder: Optional[PayloadDecoder] = None) -> dict:
+    """Compression ratio and decode cost over the newest `limit` stored messages."""
+    decoder = decoder or PayloadDecoder(conn)
+    for (payload,) in conn.execute(
+        f"SELECT payload FROM {schema}.messages ORDER BY ts DESC, id DESC LIMIT ?", (limit,)
+    ):
+        decoder.decode(payload)
+    return decoder.get_stats()
+
+
+class MessageWriter:
+    """
+    Background persistence worker for received messages.
+    Owns one long-lived SQLite connection, drains a bounded queue and commits in batches
+    (every batch_size rows or flush_interval_ms, whichever comes first). With `shards`, rows go
+    to the shard file for their timestamp instead (the current shard's connection stays open).
+    With `compressor`, payloads are compressed on the writer thread before they are inserted.
+    With `extractor`, the configured JSON fields are stored in message_fields in the same transaction,
+    and with `rollups` the per-topic minute/hour/all-time rollups are updated there too (minute
+    rollups older than rollup_minute_days are pruned about once a minute).
+    submit() never blocks the caller: when the queue is full the message is dropped and counted.
+    """
+    _STOP = object()
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = 200,
+        flush_interval_ms: int = 250,
+        max_queue_size: int = 10000,
+        pragmas: Optional[dict] = None,
+        on_error=None,
+        shards: Optional["MessageShards"] = None,
+        compressor: Optional[PayloadCompressor] = None,
+        extractor: Optional[FieldExtractor] = None,
+        rollups: bool = False,
+        rollup_minute_days: float = 7.0,
+    ):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.shards = shards
+        self.compressor = compressor
+        self.extractor = extractor
+        self.rollups = rollups
+        self.rollup_minute_days = rollup_minute_days
+        self._next_rollup_prune = 0.0
+        self._shard_conns = {}  # shard key -> connection (writer thread only)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.on_error = on_error
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "rows_written": 0,
+            "batches_committed": 0,
+            "dropped": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+        }
+
+    def start(self):
+        """Start the writer thread (no-op if already running)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="MessageWriter", daemon=True)
+        self._thread.start()
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def submit(self, timestamp: str, topic: str, payload: str, ts_us: Optional[int] = None) -> bool:
+        """
+        Queue one message for writing. ts_us (epoch microseconds) defaults to the parsed timestamp.
+        Returns False if the queue is full (message dropped).
+        """
+        if ts_us is None:
+            ts_us = timestamp_to_epoch_us(timestamp) or epoch_us(time.time())
+        try:
+            self._queue.put_nowait((timestamp, topic, payload, ts_us))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+                dropped = self._stats["dropped"]
+            # Report the first drop and then every 1000th so a stalled disk does not flood the log
+            if dropped == 1 or dropped % 1000 == 0:
+                self._report_error(f"Message queue full, dropped {dropped} message(s) so far")
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued before this call is committed. Returns False on timeout."""
+        if not self.is_running():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending messages, close the connection and stop the thread."""
+        if not self.is_running():
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            self._report_error("Message queue full at shutdown; pending messages may be lost")
+            return
+        self._thread.join(timeout)
+        stats = self.get_stats()
+        logger.info(
+            "MessageWriter stopped: %d rows in %d batches, %d dropped, avg commit %.1f ms, max %.1f ms",
+            stats["rows_written"], stats["batches_committed"], stats["dropped"],
+            stats["avg_commit_ms"], stats["max_commit_ms"],
+        )
+
+    def get_stats(self) -> dict:
+        """Snapshot of writer counters (queue depth, batch sizes, commit latency)."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats["batches_committed"]
+        stats["avg_commit_ms"] = stats["total_commit_ms"] / batches if batches else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        if self.compressor is not None:
+            stats["compression"] = self.compressor.get_stats()
+        if self.extractor is not None:
+            stats["fields"] = self.extractor.get_stats()
+        return stats
+
+    def _report_error(self, message: str):
+        logger.error(message)
+        if self.on_error:
+            try:
+                self.on_error(message)
+            except Exception:
+                pass
+
+    def _run(self):
+        try:
+            conn = open_database(self.db_path, self.pragmas)
+        except Exception as e:
+            self._report_error(f"Message writer could not open database: {e}")
+            return
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is self._STOP:
+                        stopping = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                    if stopping or waiters or len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if stopping:
+                    # Drain whatever is left so shutdown loses nothing that was accepted
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if isinstance(item, threading.Event):
+                            waiters.append(item)
+                        elif item is not self._STOP:
+                            batch.append(item)
+                for start in range(0, len(batch), self.batch_size):
+                    self._write_batch(conn, batch[start:start + self.batch_size])
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            conn.close()
+            for shard_conn in self._shard_conns.values():
+                shard_conn.close()
+            self._shard_conns.clear()
+
+    def _has_extras(self) -> bool:
+        return self.extractor is not None or self.rollups
+
+    def _write_batch(self, conn, batch):
+        if self._has_extras():
+            # Before compression: extracted values ride along as element 5
+            extract = self.extractor.extract if self.extractor is not None else lambda payload: ()
+            batch = [(*row, extract(row[2])) for row in batch]
+        if self.compressor is not None:
+            try:
+                batch = [(t, topic, self.compressor.compress(conn, topic, payload), ts, *extras)
+                         for t, topic, payload, ts, *extras in batch]
+            except Exception as e:
+                self._report_error(f"Payload compression failed, storing {len(batch)} message(s) uncompressed: {e}")
+        if self._has_extras():
+            # After compression: the stored size (as migration 8 backfills it) rides along as element 6
+            batch = [(*row, len(row[2]) if isinstance(row[2], bytes) else len(row[2].encode("utf-8")))
+                     for row in batch]
+        if self.shards is None:
+            self._commit_batch(conn, batch)
+            return
+        for key, rows in itertools.groupby(batch, key=lambda row: self.shards.key_for_epoch(row[3] / 1_000_000)):
+            try:
+                shard_conn = self._shard_connection(key)
+            except Exception as e:
+                rows = list(rows)
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+                self._report_error(f"Error opening shard {key}, {len(rows)} message(s) not saved: {e}")
+                continue
+            self._commit_batch(shard_conn, list(rows))
+
+    def _shard_connection(self, key: str) -> sqlite3.Connection:
+        conn = self._shard_conns.pop(key, None) or self.shards.open(key)
+        # Keep the two most recently used shards open (late messages around a rollover)
+        self._shard_conns[key] = conn
+        while len(self._shard_conns) > 2:
+            self._shard_conns.pop(next(iter(self._shard_conns))).close()
+        return conn
+
+    def _commit_batch(self, conn, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (timestamp, topic, payload, ts) VALUES (?, ?, ?, ?)",
+                    [row[:4] for row in batch] if self._has_extras() else batch,
+                )
+                if self._has_extras():
+                    self._insert_extras(conn, batch)
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            self._report_error(f"Error inserting {len(batch)} message(s) to database: {e}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._stats_lock:
+            s = self._stats
+            s["rows_written"] += len(batch)
+            s["batches_committed"] += 1
+            s["last_batch_size"] = len(batch)
+            s["max_batch_size"] = max(s["max_batch_size"], len(batch))
+            s["last_commit_ms"] = elapsed_ms
+            s["max_commit_ms"] = max(s["max_commit_ms"], elapsed_ms)
+            s["total_commit_ms"] += elapsed_ms
+
+    def _insert_extras(self, conn, batch):
+        field_ids = []
+        if self.extractor is not None:
+            # The batch was inserted in this write transaction (no other writer in between): consecutive ids.
+            # Read before field_ids(), which may insert into message_field_names.
+            first_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0] - len(batch) + 1
+            field_ids = self.extractor.field_ids(conn)
+            conn.executemany(
+                "INSERT INTO message_fields (message_id, field_id, value) VALUES (?, ?, ?)",
+                [(first_id + i, field_ids[index], value) for i, row in enumerate(batch) for index, value in row[4]],
+            )
+        if self.rollups:
+            update_rollups(conn, [(row[1], row[3], row[5], [(field_ids[index], value) for index, value in row[4]])
+                                  for row in batch])
+            if time.monotonic() >= self._next_rollup_prune:
+                self._next_rollup_prune = time.monotonic() + 60
+                prune_minute_rollups(conn, self.rollup_minute_days)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter match: + matches one level, # the remaining levels."""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _TrieNode:
+    __slots__ = ("children", "entry")
+
+    def __init__(self):
+        self.children = {}  # level -> _TrieNode ("+" and "#" are ordinary keys)
+        self.entry = None  # (insertion order, filter, value) if a filter ends here
+
+
+class TopicFilterTrie:
+    """
+    MQTT topic filters mapped to values, matched against concrete topics in O(topic depth).
+    match() walks one level at a time following the exact child and the "+" child and
+    collecting "#" children, so its cost depends on the topic and on how many filters match,
+    not on how many are registered. Same semantics as topic_matches() ("a/#" also matches "a").
+    Also works as a set of filters (add, discard, clear, difference_update, in, iteration),
+    which is how ConnectionManager.subscribed_topics uses it. Thread-safe.
+    """
+
+    def __init__(self, filters=()):
+        self._root = _TrieNode()
+        self._order = {}  # filter -> insertion order (iteration order)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        for topic_filter in filters:
+            self.add(topic_filter)
+
+    def add(self, topic_filter: str, value=None):
+        """Register a filter (or replace its value)"""
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                node = node.children.setdefault(level, _TrieNode())
+            if node.entry is None:
+                self._order[topic_filter] = next(self._seq)
+            node.entry = (self._order[topic_filter], topic_filter, value)
+
+    def discard(self, topic_filter: str):
+        with self._lock:
+            if self._order.pop(topic_filter, None) is None:
+                return
+            path = [self._root]
+            levels = topic_filter.split("/")
+            for level in levels:
+                path.append(path[-1].children[level])
+            path[-1].entry = None
+            # Drop nodes that no longer lead to any filter
+            for level, parent, node in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+                if node.entry is not None or node.children:
+                    break
+                del parent.children[level]
+
+    def difference_update(self, filters):
+        for topic_filter in list(filters):
+            self.discard(topic_filter)
+
+    def clear(self):
+        with self._lock:
+            self._root = _TrieNode()
+            self._order.clear()
+
+    def get(self, topic_filter: str, default=None):
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                node = node.children.get(level)
+                if node is None:
+                    return default
+            return node.entry[2] if node.entry is not None else default
+
+    def __contains__(self, topic_filter) -> bool:
+        with self._lock:
+            return topic_filter in self._order
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def match(self, topic: str) -> list:
+        """[(filter, value), ...] of the filters matching topic, in the order they were added"""
+        found = []
+        with self._lock:
+            nodes = [self._root]
+            for level in topic.split("/"):
+                next_nodes = []
+                for node in nodes:
+                    children = node.children
+                    if "#" in children and children["#"].entry is not None:
+                        found.append(children["#"].entry)
+                    if level in children:
+                        next_nodes.append(children[level])
+                    if "+" in children:
+                        next_nodes.append(children["+"])
+                nodes = next_nodes
+                if not nodes:
+                    break
+            for node in nodes:
+                if node.entry is not None:
+                    found.append(node.entry)
+                if "#" in node.children and node.children["#"].entry is not None:
+                    found.append(node.children["#"].entry)
+        if len(found) > 1:
+            found.sort()
+        return [(topic_filter, value) for _, topic_filter, value in found]
+
+
+class RetentionPolicy:
+    """Limits for stored messages; None means no limit."""
+    __slots__ = ("max_age_secs", "max_rows", "max_bytes")
+
+    def __init__(self, max_age_secs: Optional[float] = None, max_rows: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_age_secs = max_age_secs
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RetentionPolicy":
+        """From {"max_age_days"|"max_age_hours"|"max_age_secs", "max_rows", "max_mb"|"max_bytes"}."""
+        max_age = data.get("max_age_secs")
+        if data.get("max_age_hours") is not None:
+            max_age = float(data["max_age_hours"]) * 3600
+        if data.get("max_age_days") is not None:
+            max_age = float(data["max_age_days"]) * 86400
+        max_bytes = data.get("max_bytes")
+        if data.get("max_mb") is not None:
+            max_bytes = float(data["max_mb"]) * 1024 * 1024
+        return cls(
+            float(max_age) if max_age else None,
+            int(data["max_rows"]) if data.get("max_rows") else None,
+            int(max_bytes) if max_bytes else None,
+        )
+
+    def is_unlimited(self) -> bool:
+        return self.max_age_secs is None and self.max_rows is None and self.max_bytes is None
+
+    def describe(self) -> str:
+        parts = []
+        if self.max_age_secs is not None:
+            parts.append(f"{self.max_age_secs / 86400:g} days")
+        if self.max_rows is not None:
+            parts.append(f"{self.max_rows} rows")
+        if self.max_bytes is not None:
+            parts.append(f"{self.max_bytes / (1024 * 1024):g} MB")
+        return ", ".join(parts) or "unlimited"
+
+
+def get_retention_policies() -> tuple:
+    """
+    (default policy, {topic filter: policy}) from the environment:
+    IOT_RETENTION_MAX_AGE_DAYS, IOT_RETENTION_MAX_ROWS, IOT_RETENTION_MAX_MB and
+    IOT_RETENTION_TOPICS, a JSON object such as {"devices/+/debug": {"max_age_days": 1}}.
+    """
+    default = RetentionPolicy.from_dict({
+        "max_age_days": os.environ.get("IOT_RETENTION_MAX_AGE_DAYS") or None,
+        "max_rows": os.environ.get("IOT_RETENTION_MAX_ROWS") or None,
+        "max_mb": os.environ.get("IOT_RETENTION_MAX_MB") or None,
+    })
+    overrides = {}
+    raw = os.environ.get("IOT_RETENTION_TOPICS")
+    if raw:
+        try:
+            for topic_filter, data in json.loads(raw).items():
+                overrides[topic_filter] = RetentionPolicy.from_dict(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring invalid IOT_RETENTION_TOPICS: %s", e)
+    return default, overrides
+
+
+class RetentionManager:
+    """
+    Background job that keeps the message store within its retention policies.
+    The default policy's max_age applies to every topic without an override; its max_rows and
+    max_bytes cap the whole store (oldest messages go first, whatever the topic). A per-topic
+    override (keyed by topic filter, first match wins) replaces the age limit for matching topics,
+    and its max_rows caps each matching topic separately.
+    Rows are deleted in chunks of chunk_rows, each in its own short transaction with a pause in
+    between, so the message writer never waits long for the lock. Freed pages are returned to the
+    filesystem with PRAGMA incremental_vacuum (databases created with auto_vacuum=INCREMENTAL).
+    With `shards`, shard files entirely older than the longest age limit, and the oldest shards
+    while the store is over max_rows/max_bytes, are unlinked instead of deleted row by row.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        default_policy: Optional[RetentionPolicy] = None,
+        topic_policies: Optional[dict] = None,
+        interval_secs: float = 300.0,
+        chunk_rows: int = 500,
+        chunk_pause_secs: float = 0.05,
+        vacuum_pages: int = 256,
+        pragmas: Optional[dict] = None,
+        on_log=None,
+        shards: Optional["MessageShards"] = None,
+    ):
+        self.db_path = db_path
+        self.shards = shards
+        self.default_policy = default_policy or RetentionPolicy()
+        self.topic_policies = dict(topic_policies or {})
+        self._policy_trie = TopicFilterTrie()
+        for topic_filter, policy in self.topic_policies.items():
+            self._policy_trie.add(topic_filter, policy)
+        self.interval_secs = interval_secs
+        self.chunk_rows = max(1, chunk_rows)
+        self.chunk_pause_secs = chunk_pause_secs
+        self.vacuum_pages = max(1, vacuum_pages)
+        self.pragmas = pragmas
+        self.on_log = on_log
+        self._stop_event = threading.Event()
+        self._run_now = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._warned_no_auto_vacuum = False
+        self._stats = {
+            "runs": 0,
+            "rows_deleted": 0,
+            "shards_dropped": 0,
+            "pages_vacuumed": 0,
+            "last_run_at": None,
+            "last_run_secs": 0.0,
+            "last_rows_deleted": 0,
+            "errors": 0,
+        }
+
+    def is_enabled(self) -> bool:
+        return not self.default_policy.is_unlimited() or any(
+            not policy.is_unlimited() for policy in self.topic_policies.values()
+        )
+
+    def start(self, initial_delay_secs: float = 30.0):
+        """Start the periodic job (first run after initial_delay_secs)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(initial_delay_secs,), name="RetentionManager", daemon=True
+        )
+        self._thread.start()
+        summary = "; ".join(f"{f}: {p.describe()}" for f, p in self.topic_policies.items())
+        self._log(f"Retention: {self.default_policy.describe()}" + (f" (overrides {summary})" if summary else ""))
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the job; a run in progress stops after its current chunk."""
+        self._stop_event.set()
+        self._run_now.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_now(self):
+        """Wake the background job for an immediate run."""
+        self._run_now.set()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _run(self, initial_delay_secs: float):
+        delay = initial_delay_secs
+        while not self._stop_event.is_set():
+            self._run_now.wait(delay)
+            self._run_now.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.enforce()
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                self._log(f"Retention run failed: {e}", logging.ERROR)
+            delay = self.interval_secs
+
+    def enforce(self) -> int:
+        """Apply all policies and vacuum freed pages. Returns the number of rows deleted."""
+        started = time.perf_counter()
+        deleted = pages = dropped = 0
+        conn = open_database(self.db_path, self.pragmas)
+        try:
+            if self.shards is not None:
+                dropped = self._drop_expired_shards() + self._drop_shards_over_limits(conn)
+                for key in self.shards.keys():
+                    if self._stop_event.is_set():
+                        break
+                    shard_conn = self.shards.open(key)
+                    try:
+                        deleted += self._enforce_age_and_topic_rows(shard_conn)
+                        pages += self._incremental_vacuum(shard_conn)
+                    finally:
+                        shard_conn.close()
+            deleted += self._enforce_age_and_topic_rows(conn)
+            deleted += self._enforce_total_rows(conn)
+            deleted += self._enforce_total_bytes(conn)
+            pages += self._incremental_vacuum(conn)
+        finally:
+            conn.close()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            s = self._stats
+            s["runs"] += 1
+            s["rows_deleted"] += deleted
+            s["shards_dropped"] += dropped
+            s["pages_vacuumed"] += pages
+            s["last_run_at"] = time.time()
+            s["last_run_secs"] = elapsed
+            s["last_rows_deleted"] = deleted
+        if deleted or pages or dropped:
+            self._log(
+                f"Retention: deleted {deleted} message(s), dropped {dropped} shard file(s), "
+                f"released {pages} page(s) in {elapsed:.1f} s"
+            )
+        return deleted
+
+    def _drop_expired_shards(self) -> int:
+        """Unlink shards whose whole period is older than every topic's age limit."""
+        ages = [self.default_policy.max_age_secs] + [p.max_age_secs for p in self.topic_policies.values()]
+        if any(age is None for age in ages):
+            return 0
+        cutoff_key = self.shards.key_for_epoch(time.time() - max(ages))
+        expired = [key for key in self.shards.keys() if key < cutoff_key]
+        for key in expired:
+            self.shards.drop(key)
+        return len(expired)
+
+    def _drop_shards_over_limits(self, main_conn) -> int:
+        """Unlink the oldest shards while the store is over max_rows/max_bytes (never the newest)."""
+        max_rows, max_bytes = self.default_policy.max_rows, self.default_policy.max_bytes
+        if max_rows is None and max_bytes is None:
+            return 0
+        keys = self.shards.keys()
+        rows = self.shards.total_count() + get_message_count(main_conn)
+        size = sum(self.shards.size_bytes(key) for key in keys)
+        dropped = 0
+        while len(keys) > 1 and ((max_rows is not None and rows > max_rows) or
+                                 (max_bytes is not None and size > max_bytes)):
+            key = keys.pop(0)
+            conn = sqlite3.connect(f"file:{self.shards.path(key)}?mode=ro", uri=True)
+            try:
+                rows -= get_message_count(conn)
+            finally:
+                conn.close()
+            size -= self.shards.size_bytes(key)
+            self.shards.drop(key)
+            dropped += 1
+        return dropped
+
+    def _policy_for(self, topic: str) -> Optional[RetentionPolicy]:
+        """The policy of the first configured filter matching topic"""
+        matches = self._policy_trie.match(topic)
+        return matches[0][1] if matches else None
+
+    def _delete_chunks(self, conn, where: str, params: tuple = (), limit: Optional[int] = None) -> int:
+        """Delete matching rows oldest first, chunk_rows per transaction, at most `limit` rows."""
+        deleted = 0
+        while not self._stop_event.is_set():
+            size = self.chunk_rows if limit is None else min(self.chunk_rows, limit - deleted)
+            if size <= 0:
+                break
+            with conn:
+                count = conn.execute(
+                    f"""
+                    DELETE FROM messages WHERE id IN (
+                        SELECT id FROM messages WHERE {where} ORDER BY ts, id LIMIT ?
+                    )
+                    """,
+                    (*params, size),
+                ).rowcount
+            deleted += count
+            if count < size:
+                break
+            self._stop_event.wait(self.chunk_pause_secs)
+        return deleted
+
+    @staticmethod
+    def _cutoff(max_age_secs: float) -> int:
+        return epoch_us(time.time() - max_age_secs)
+
+    def _enforce_age_and_topic_rows(self, conn) -> int:
+        default_age = self.default_policy.max_age_secs
+        if not self.topic_policies:
+            if default_age is None:
+                return 0
+            return self._delete_chunks(conn, "ts < ?", (self._cutoff(default_age),))
+        deleted = 0
+        topics = list_topics(conn)
+        for topic in topics:
+            policy = self._policy_for(topic)
+            max_age = default_age if policy is None else policy.max_age_secs
+            if max_age is not None:
+                deleted += self._delete_chunks(conn, "topic = ? AND ts < ?", (topic, self._cutoff(max_age)))
+            if policy is not None and policy.max_rows is not None:
+                count = conn.execute("SELECT COUNT(*) FROM messages WHERE topic = ?", (topic,)).fetchone()[0]
+                if count > policy.max_rows:
+                    deleted += self._delete_chunks(conn, "topic = ?", (topic,), limit=count - policy.max_rows)
+        return deleted
+
+    def _enforce_total_rows(self, conn) -> int:
+        max_rows = self.default_policy.max_rows
+        if max_rows is None:
+            return 0
+        excess = get_message_count(conn) - max_rows
+        return self._delete_chunks(conn, "1", limit=excess) if excess > 0 else 0
+
+    def _enforce_total_bytes(self, conn) -> int:
+        max_bytes = self.default_policy.max_bytes
+        if max_bytes is None:
+            return 0
+        deleted = 0
+        # Freed space only shows up as whole free pages, so re-measure after each estimated batch
+        for _ in range(10):
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            used_pages = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            excess = used_pages * page_size - max_bytes
+            rows = get_message_count(conn)
+            if excess <= 0 or rows == 0 or self._stop_event.is_set():
+                break
+            bytes_per_row = used_pages * page_size / rows
+            deleted += self._delete_chunks(conn, "1", limit=max(self.chunk_rows, int(excess / bytes_per_row)))
+        return deleted
+
+    def _incremental_vacuum(self, conn) -> int:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free_pages:
+            return 0
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if not self._warned_no_auto_vacuum:
+                self._warned_no_auto_vacuum = True
+                self._log(
+                    f"Database has {free_pages} free page(s) that are reused but not returned to the disk; "
+                    "run with --compact-db once to enable incremental vacuum",
+                    logging.WARNING,
+                )
+            return 0
+        released = 0
+        while free_pages and not self._stop_event.is_set():
+            # executescript steps the pragma to completion; execute() would release only one page
+            conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free_pages:
+                break
+            released += free_pages - remaining
+            free_pages = remaining
+            self._stop_event.wait(self.chunk_pause_secs)
+        return released
+
+
+_FTS_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fts_query(text: str) -> str:
+    """
+    Viewer search text -> FTS5 MATCH expression: every word (or "quoted phrase") must match;
+    a trailing * makes a word a prefix search. Operators are not interpreted, so any input is safe.
+    """
+    terms = []
+    for phrase, word in _FTS_TOKEN.findall(text):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith("*")
+        term = term.rstrip("*") if prefix else term
+        if re.search(r"\w", term):  # punctuation-only terms have no tokens and would match nothing
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " AND ".join(terms)
+
+
+def search_terms_pattern(text: str) -> Optional["re.Pattern"]:
+    """Case-insensitive regex matching the search words (for highlighting displayed text)."""
+    parts = []
+    for phrase, word in _FTS_TOKEN.findall(text):
+        term = phrase or word
+        if term.endswith("*") and not phrase:
+            parts.append(re.escape(term.rstrip("*")) + r"\w*")
+        elif re.search(r"\w", term):
+            parts.append(re.escape(term))
+    return re.compile("|".join(sorted(parts, key=len, reverse=True)), re.IGNORECASE) if parts else None
+
+
+def _search_clause(
+    schema: str,
+    start_us: Optional[int],
+    end_us: Optional[int],
+    topic: Optional[str],
+    field_filter: Optional["FieldFilter"],
+) -> tuple:
+    """(conditions on the messages row aliased m, params) narrowing full-text matches."""
+    conditions, params = _range_clause(start_us, end_us, topic, alias="m.")
+    if field_filter is not None:
+        condition, condition_params = field_filter.clause(schema, alias="m.")
+        conditions.append(condition)
+        params.extend(condition_params)
+    return conditions, params
+
+
+def search_messages_page(
+    conn: sqlite3.Connection,
+    query: str,
+    after_id: Optional[int] = None,
+    limit: int = 500,
+    schema: str = "main",
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    field_filter: Optional[FieldFilter] = None,
+) -> list:
+    """
+    One page of full-text matches (query as built by fts_query), newest first by id.
+    Pass the id of the last row of the previous page as after_id. Rows are
+    (id, ts, topic, payload, created_at) like fetch_messages_page.
+    """
+    conditions, params = _search_clause(schema, start_us, end_us, topic, field_filter)
+    if after_id is not None:
+        conditions.append("messages_fts.rowid < ?")
+        params.append(after_id)
+    extra = "".join(f" AND {c}" for c in conditions)
+    return conn.execute(
+        f"""
+        SELECT m.id, m.ts, m.topic, m.payload, m.created_at
+        FROM {schema}.messages_fts JOIN {schema}.messages AS m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ?{extra}
+        ORDER BY messages_fts.rowid DESC LIMIT ?
+        """,
+        (query, *params, limit),
+    ).fetchall()
+
+
+def count_search_matches(
+    conn: sqlite3.Connection,
+    query: str,
+    schema: str = "main",
+    limit: int = 10000,
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    topic: Optional[str] = None,
+    field_filter: Optional[FieldFilter] = None,
+) -> int:
+    """
+    Number of full-text matches within the same range/topic/field conditions as
+    search_messages_page, counted up to limit + 1 (more means "over limit").
+    """
+    conditions, params = _search_clause(schema, start_us, end_us, topic, field_filter)
+    if not conditions:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {schema}.messages_fts WHERE messages_fts MATCH ? LIMIT ?)",
+            (query, limit + 1),
+        ).fetchone()[0]
+    extra = "".join(f" AND {c}" for c in conditions)
+    return conn.execute(
+        f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM {schema}.messages_fts JOIN {schema}.messages AS m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?{extra} LIMIT ?
+        )
+        """,
+        (query, *params, limit + 1),
+    ).fetchone()[0]
+
+
+def search_index_backlog(conn: sqlite3.Connection, schema: str = "main") -> int:
+    """Messages not yet in the full-text index."""
+    row = conn.execute(f"SELECT last_id FROM {schema}.search_index_state WHERE id = 1").fetchone()
+    return conn.execute(f"SELECT COUNT(*) FROM {schema}.messages WHERE id > ?", (row[0] if row else 0,)).fetchone()[0]
+
+
+class SearchIndexer:
+    """
+    Keeps the FTS5 index (messages_fts over topic and payload) up to date in the background.
+    Each pass indexes messages with id above search_index_state.last_id, batch_rows per
+    transaction (payloads are decoded first, so compressed rows are searchable), which covers
+    both new messages and a one-time backfill of an existing database. Deleted messages leave
+    the index through a trigger. With shards, every shard has its own index; shards that are
+    caught up and no longer written are skipped.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        shards: Optional["MessageShards"] = None,
+        interval_secs: float = 1.0,
+        batch_rows: int = 1000,
+        pragmas: Optional[dict] = None,
+        on_log=None,
+    ):
+        self.db_path = db_path
+        self.shards = shards
+        self.interval_secs = interval_secs
+        self.batch_rows = max(1, batch_rows)
+        self.pragmas = pragmas
+        self.on_log = on_log
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._complete_shards = set()
+        self._lock = threading.Lock()
+        self._stats = {"indexed_rows": 0, "batches": 0, "last_batch_ms": 0.0, "max_batch_ms": 0.0, "errors": 0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="SearchIndexer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _run(self):
+        try:
+            conn = open_database(self.db_path, self.pragmas)
+        except Exception as e:
+            self._log(f"Search indexer could not open database: {e}", logging.ERROR)
+            return
+        decoder = PayloadDecoder(conn)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    indexed = self.index_pending(conn, decoder)
+                except Exception as e:
+                    indexed = 0
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    self._log(f"Search indexing failed: {e}", logging.ERROR)
+                # Keep going without a pause while there is a backlog (backfill), but let writers in
+                self._stop_event.wait(0.05 if indexed >= self.batch_rows else self.interval_secs)
+        finally:
+            conn.close()
+
+    def index_pending(self, conn: sqlite3.Connection, decoder: PayloadDecoder) -> int:
+        """Index one batch from each database that has unindexed messages. Returns rows indexed."""
+        indexed = self._index_batch(conn, decoder, "main")
+        keys = self.shards.keys() if self.shards else []
+        for key in keys:
+            if key in self._complete_shards or self._stop_event.is_set():
+                continue
+            self.shards.attach(conn, key, "shard")
+            try:
+                count = self._index_batch(conn, decoder, "shard")
+            finally:
+                conn.execute("DETACH DATABASE shard")
+            indexed += count
+            if count < self.batch_rows and key != keys[-1]:
+                self._complete_shards.add(key)
+        return indexed
+
+    def _index_batch(self, conn, decoder: PayloadDecoder, schema: str) -> int:
+        started = time.perf_counter()
+        row = conn.execute(f"SELECT last_id FROM {schema}.search_index_state WHERE id = 1").fetchone()
+        last_id = row[0] if row else 0
+        rows = conn.execute(
+            f"SELECT id, topic, payload FROM {schema}.messages WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, self.batch_rows),
+        ).fetchall()
+        if not rows:
+            return 0
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {schema}.messages_fts (rowid, topic, payload) VALUES (?, ?, ?)",
+                ((msg_id, topic, decoder.decode(payload)) for msg_id, topic, payload in rows),
+            )
+            conn.execute(
+                f"INSERT OR REPLACE INTO {schema}.search_index_state (id, last_id) VALUES (1, ?)", (rows[-1][0],)
+            )
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            s = self._stats
+            s["indexed_rows"] += len(rows)
+            s["batches"] += 1
+            s["last_batch_ms"] = elapsed_ms
+            s["max_batch_ms"] = max(s["max_batch_ms"], elapsed_ms)
+        return len(rows)
+
+
+# Message export (GUI "Export..." in the message viewer, or --export on the command line)
+EXPORT_FORMATS = ("csv", "ndjson", "parquet", "arrow")
+_EXPORT_SUFFIXES = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "ndjson",
+                    ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+
+def export_format_for(path: str) -> Optional[str]:
+    """Export format implied by a file name (".csv", ".ndjson.gz", ".parquet", ...); None if unknown."""
+    suffixes = Path(path).suffixes
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return _EXPORT_SUFFIXES.get(suffixes[-1].lower()) if suffixes else None
+
+
+def _export_time(ts_us: int) -> str:
+    """ISO 8601 UTC ("2026-10-18T07:24:25.190Z"), like the Parquet/Arrow ts column"""
+    return datetime.fromtimestamp(ts_us / 1_000_000, timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+class _CsvSink:
+    COLUMNS = ["id", "ts_us", "time", "topic", "payload", "created_at"]
+
+    def __init__(self, f):
+        self._writer = csv.writer(f)
+        self._writer.writerow(self.COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows((i, ts, _export_time(ts), topic, payload, created) for i, ts, topic, payload, created in rows)
+
+    def close(self):
+        pass
+
+
+class _NdjsonSink:
+    """One JSON object per line; JSON payloads are embedded as objects, anything else as a string."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, rows):
+        lines = []
+        for message_id, ts, topic, payload, created in rows:
+            try:
+                value = json.loads(payload)
+            except ValueError:
+                value = payload
+            lines.append(json.dumps({"id": message_id, "ts_us": ts, "time": _export_time(ts), "topic": topic,
+                                     "payload": value, "created_at": created}, ensure_ascii=False))
+        if lines:
+            self._f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        pass
+
+
+class _ArrowSink:
+    """Parquet (zstd, one row group per row_group_rows) or Arrow IPC file; needs pyarrow."""
+
+    def __init__(self, path: str, fmt: str, row_group_rows: int = 65536):
+        import pyarrow
+        self._pa = pyarrow
+        self.schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("ts", pyarrow.timestamp("us", tz="UTC")),
+            ("topic", pyarrow.string()),
+            ("payload", pyarrow.string()),
+            ("created_at", pyarrow.string()),
+        ])
+        if fmt == "parquet":
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            import pyarrow.ipc
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+        self.row_group_rows = row_group_rows
+        self._pending = []
+
+    def write(self, rows):
+        self._pending.extend(rows)
+        if len(self._pending) >= self.row_group_rows:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        columns = list(zip(*self._pending))
+        self._pending = []
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        self._writer.write_table(table)
+
+
+class MessageExporter:
+    """
+    Streams stored messages to a CSV, NDJSON, Parquet or Arrow file, oldest first, optionally
+    limited to [start_us, end_us), one topic and/or a FieldFilter. Rows are read in keyset chunks
+    of chunk_rows, each its own short read (a long export never holds a snapshot that stops WAL
+    checkpoints), payloads are decoded and each chunk is written before the next is read, so
+    memory use does not grow with the table. CSV/NDJSON are gzipped when the path ends in .gz.
+    With shards, the main database (messages from before sharding) is exported first, then the
+    shard files oldest first. The file is written as "<path>.part" and renamed when complete;
+    cancel() (from any thread) stops between chunks and removes the partial file.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        path: str,
+        fmt: Optional[str] = None,
+        start_us: Optional[int] = None,
+        end_us: Optional[int] = None,
+        topic: Optional[str] = None,
+        field_filter: Optional[FieldFilter] = None,
+        shards: Optional["MessageShards"] = None,
+        pragmas: Optional[dict] = None,
+        chunk_rows: int = 5000,
+        on_log=None,
+    ):
+        fmt = fmt or export_format_for(path)
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format for {path} (use one of: {', '.join(EXPORT_FORMATS)})")
+        if fmt in ("parquet", "arrow") and not PYARROW_AVAILABLE:
+            raise ValueError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+        self.db_path = db_path
+        self.path = str(path)
+        self.fmt = fmt
+        self.filters = (start_us, end_us, topic, field_filter)
+        self.shards = shards
+        self.pragmas = pragmas
+        self.chunk_rows = max(1, chunk_rows)
+        self.on_log = on_log
+        self._cancelled = threading.Event()
+        self._stats = {"format": fmt, "rows": 0, "total": None, "bytes": 0, "elapsed_secs": 0.0,
+                       "done": False, "cancelled": False, "error": None}
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def get_stats(self) -> dict:
+        return dict(self._stats)
+
+    def run(self) -> dict:
+        """Export everything (blocking; the GUI runs this on a worker thread). Returns get_stats()."""
+        started = time.perf_counter()
+        part = self.path + ".part"
+        conn = open_database(self.db_path, self.pragmas)
+        try:
+            decoder = PayloadDecoder(conn)
+            start_us, end_us, topic, field_filter = self.filters
+            sources = [None] + (self.shards.keys_in_range(start_us, end_us) if self.shards else [])
+            self._stats["total"] = sum(self._in_source(conn, key, lambda schema: count_messages_in_range(
+                conn, start_us, end_us, topic, schema, field_filter)) for key in sources)
+            self._write(conn, decoder, sources, part)
+            if self._cancelled.is_set():
+                self._stats["cancelled"] = True
+                self._log(f"Export to {self.path} cancelled after {self._stats['rows']} messages")
+            else:
+                os.replace(part, self.path)
+                self._stats["bytes"] = os.path.getsize(self.path)
+                self._log(f"Exported {self._stats['rows']} messages to {self.path} "
+                          f"({self._stats['bytes'] / 1048576:.1f} MB, {time.perf_counter() - started:.1f} s)")
+        except Exception as e:
+            self._stats["error"] = str(e)
+            self._log(f"Export to {self.path} failed: {e}", logging.ERROR)
+        finally:
+            conn.close()
+            if os.path.exists(part):
+                os.remove(part)
+            self._stats["elapsed_secs"] = time.perf_counter() - started
+            self._stats["done"] = True
+        return self.get_stats()
+
+    def _write(self, conn, decoder, sources, part):
+        if self.fmt in ("parquet", "arrow"):
+            f, sink = None, _ArrowSink(part, self.fmt)
+        else:
+            opener = gzip.open if self.path.endswith(".gz") else open
+            f = opener(part, "wt", newline="" if self.fmt == "csv" else None, encoding="utf-8")
+            sink = _CsvSink(f) if self.fmt == "csv" else _NdjsonSink(f)
+        try:
+            for key in sources:
+                self._in_source(conn, key, lambda schema: self._write_source(conn, decoder, schema, sink))
+                if self._cancelled.is_set():
+                    break
+            sink.close()
+        finally:
+            if f is not None:
+                f.close()
+
+    def _write_source(self, conn, decoder, schema, sink):
+        start_us, end_us, topic, field_filter = self.filters
+        after_key = None
+        while not self._cancelled.is_set():
+            rows = fetch_messages_page(conn, after_key, self.chunk_rows, schema, start_us, end_us, topic,
+                                       field_filter, oldest_first=True)
+            if not rows:
+                return
+            after_key = (rows[-1][1], rows[-1][0])
+            sink.write([(i, ts, t, decoder.decode(payload), created) for i, ts, t, payload, created in rows])
+            self._stats["rows"] += len(rows)
+
+    def _in_source(self, conn, key, fn):
+        """fn(schema) for the main database (key None) or a shard ATTACHed as "shard"."""
+        if key is None:
+            return fn("main")
+        self.shards.attach(conn, key, "shard")
+        try:
+            return fn("shard")
+        finally:
+            conn.execute("DETACH DATABASE shard")
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+
+def compact_database(db_path: str, pragmas: Optional[dict] = None) -> tuple:
+    """
+    Rebuild the database with VACUUM and switch it to auto_vacuum=INCREMENTAL (needed once for
+    databases created before retention existed). Locks the database while it runs; use with the
+    app stopped. Returns (bytes before, bytes after).
+    """
+    before = os.path.getsize(db_path)
+    conn = open_database(db_path, pragmas)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return before, os.path.getsize(db_path)
+
+
+def get_shard_granularity() -> Optional[str]:
+    """IOT_DB_SHARDS=day|hour stores messages in per-day/per-hour files; unset keeps one database."""
+    value = (os.environ.get("IOT_DB_SHARDS") or "").strip().lower()
+    if value and value not in MessageShards.KEY_LENGTHS:
+        logger.warning("Ignoring invalid IOT_DB_SHARDS=%r (use day or hour)", value)
+        return None
+    return value or None
+
+
+class MessageShards:
+    """
+    Time-partitioned message storage: one SQLite file per day or hour, named
+    messages-<YYYY-MM-DD>.db or messages-<YYYY-MM-DDTHH>.db in `directory`.
+    Each shard has the full schema (migrations run when it is created), so the usual queries
+    work on a shard connection or on a shard ATTACHed to another connection. Dropping old data
+    is an unlink of whole files.
+    """
+    KEY_LENGTHS = {"day": 10, "hour": 13}  # prefix of the "%Y-%m-%d %H:%M:%S" timestamp
+
+    def __init__(self, directory: str, granularity: str = "day", pragmas: Optional[dict] = None):
+        if granularity not in self.KEY_LENGTHS:
+            raise ValueError(f"Unknown shard granularity: {granularity}")
+        self.directory = Path(directory)
+        self.granularity = granularity
+        self.pragmas = pragmas
+        self._key_length = self.KEY_LENGTHS[granularity]
+
+    def key_for(self, timestamp: str) -> str:
+        """Shard key for a stored timestamp ("2026-10-18 07:15:02" -> "2026-10-18" or "2026-10-18T07")."""
+        return timestamp[:self._key_length].replace(" ", "T")
+
+    def key_for_epoch(self, epoch_secs: float) -> str:
+        return self.key_for(datetime.fromtimestamp(epoch_secs).strftime("%Y-%m-%d %H:%M:%S"))
+
+    def keys_in_range(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> list:
+        """Existing shard keys that can hold messages in [start_us, end_us), oldest first."""
+        first = self.key_for_epoch(start_us / 1_000_000) if start_us is not None else None
+        last = self.key_for_epoch((end_us - 1) / 1_000_000) if end_us is not None else None
+        return [key for key in self.keys() if (first is None or key >= first) and (last is None or key <= last)]
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"messages-{key}.db"
+
+    def keys(self) -> list:
+        """Existing shard keys, oldest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(p.name[len("messages-"):-len(".db")] for p in self.directory.glob("messages-*.db"))
+
+    def open(self, key: str) -> sqlite3.Connection:
+        """Open (creating and migrating if needed) the shard for `key`."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = open_database(str(self.path(key)), self.pragmas)
+        try:
+            migrate_database(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def attach(self, conn: sqlite3.Connection, key: str, alias: str = "shard"):
+        """ATTACH an existing shard to `conn` as `alias` (read its rows as <alias>.messages)."""
+        conn.execute("ATTACH DATABASE ? AS " + alias, (str(self.path(key)),))
+
+    def total_count(self) -> int:
+        """Messages across all shards, from each shard's counter."""
+        total = 0
+        for key in self.keys():
+            conn = sqlite3.connect(f"file:{self.path(key)}?mode=ro", uri=True)
+            try:
+                total += get_message_count(conn)
+            except sqlite3.Error:
+                pass
+            finally:
+                conn.close()
+        return total
+
+    def size_bytes(self, key: str) -> int:
+        return sum(
+            os.path.getsize(p) for p in (str(self.path(key)) + suffix for suffix in ("", "-wal"))
+            if os.path.exists(p)
+        )
+
+    def drop(self, key: str):
+        """Delete a shard file (and its -wal/-shm)."""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(str(self.path(key)) + suffix)
+            except FileNotFoundError:
+                pass
+
+
+class ReceivedMessage:
+    """One decoded MQTT message as produced by the ingest pipeline."""
+    __slots__ = ("timestamp", "received_at", "topic", "payload", "data", "display_text", "size", "filters")
+
+    def __init__(self, timestamp: str, received_at: float, topic: str, payload: str, data=None, display_text: str = "",
+                 size: int = 0, filters: tuple = ()):
+        self.timestamp = timestamp  # local time string stored in the database
+        self.received_at = received_at  # epoch seconds (time.time()) at callback time
+        self.topic = topic
+        self.payload = payload
+        self.data = data  # parsed JSON payload, or None if the payload is not JSON
+        self.display_text = display_text
+        self.size = size  # payload size in bytes as received
+        self.filters = filters  # subscription filters the topic matches (IngestPipeline router)
+
+
+class IngestPipeline:
+    """
+    Moves received-message handling off the GUI thread.
+    submit() is called from the MQTT callback thread and only enqueues raw bytes. A worker thread
+    decodes, parses and pretty-prints each message, hands it to persist() and to any listeners,
+    and appends it to a bounded display buffer. The GUI drains the buffer on a fixed frame tick
+    with drain_display(); entries beyond max_per_frame (or pushed out of the buffer while the
+    display falls behind) are counted as coalesced instead of being shown.
+    With a router (a TopicFilterTrie of filter -> handler or None), each message is tagged with
+    the filters it matches and handed to those filters' handlers after the listeners.
+    """
+    _STOP = object()
+
+    def __init__(self, persist=None, max_queue_size: int = 20000, display_buffer_size: int = 500, on_error=None,
+                 router: Optional["TopicFilterTrie"] = None):
+        self.persist = persist  # callable(timestamp, topic, payload, ts_us), called on the worker thread
+        self.on_error = on_error
+        self.router = router
+        self._listeners = []
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._display = collections.deque()
+        self._display_limit = max(1, display_buffer_size)
+        self._display_lock = threading.Lock()
+        self._coalesced_pending = 0
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"received": 0, "processed": 0, "dropped": 0, "coalesced": 0, "errors": 0}
+
+    def add_listener(self, callback):
+        """Register callable(ReceivedMessage) invoked on the worker thread for every message."""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="IngestPipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Process what is already queued, then stop the worker thread."""
+        if not (self._thread and self._thread.is_alive()):
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def submit(self, topic: str, payload, timestamp: Optional[str] = None) -> bool:
+        """Enqueue a raw message (bytes or str). Never blocks; returns False if dropped."""
+        with self._stats_lock:
+            self._stats["received"] += 1
+        try:
+            self._queue.put_nowait((time.time(), timestamp, topic, payload))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+                dropped = self._stats["dropped"]
+            if dropped == 1 or dropped % 1000 == 0:
+                self._report_error(f"Ingest queue full, dropped {dropped} message(s) so far")
+            return False
+
+    def drain_display(self, max_items: int):
+        """
+        Called from the GUI frame tick. Returns (messages, coalesced): at most max_items of the
+        newest buffered messages, plus how many were skipped since the previous drain.
+        """
+        with self._display_lock:
+            coalesced = self._coalesced_pending
+            self._coalesced_pending = 0
+            if not self._display:
+                items = []
+            elif len(self._display) <= max_items:
+                items = list(self._display)
+                self._display.clear()
+            else:
+                coalesced += len(self._display) - max_items
+                items = list(self._display)[-max_items:]
+                self._display.clear()
+        if coalesced:
+            with self._stats_lock:
+                self._stats["coalesced"] += coalesced
+        return items, coalesced
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+    def _report_error(self, message: str):
+        logger.error(message)
+        if self.on_error:
+            try:
+                self.on_error(message)
+            except Exception:
+                pass
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            try:
+                self._process(*item)
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+                self._report_error(f"Error processing received message: {e}")
+
+    def _process(self, received_at: float, timestamp: Optional[str], topic: str, payload):
+        received_text = datetime.fromtimestamp(received_at).strftime("%Y-%m-%d %H:%M:%S")
+        if timestamp is None or timestamp == received_text:
+            timestamp, ts_us = received_text, epoch_us(received_at)
+        else:
+            ts_us = timestamp_to_epoch_us(timestamp) or epoch_us(received_at)
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            size = len(payload)
+            try:
+                payload = bytes(payload).decode("utf-8")
+            except UnicodeDecodeError as e:
+                payload = f"Error decoding payload: {e}"
+        else:
+            size = len(payload.encode("utf-8"))
+        data = None
+        try:
+            data = json.loads(payload)
+            formatted_payload = json.dumps(data, indent=2)
+        except (ValueError, TypeError):
+            formatted_payload = payload
+        routes = self.router.match(topic) if self.router is not None else []
+        filters = tuple(topic_filter for topic_filter, _ in routes)
+        # Overlapping subscriptions: say which filters delivered it
+        via = f" (filters: {', '.join(filters)})" if len(filters) > 1 else ""
+        message = ReceivedMessage(
+            timestamp, received_at, topic, payload, data,
+            f"Received on '{topic}'{via}: {formatted_payload}", size, filters,
+        )
+        if self.persist:
+            self.persist(timestamp, topic, payload, ts_us)
+        for listener in self._listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                self._report_error(f"Message listener error: {e}")
+        for topic_filter, handler in routes:
+            if handler is None:
+                continue
+            try:
+                handler(message)
+            except Exception as e:
+                self._report_error(f"Message handler for '{topic_filter}' failed: {e}")
+        with self._display_lock:
+            self._display.append(message)
+            if len(self._display) > self._display_limit:
+                self._display.popleft()
+                self._coalesced_pending += 1
+        with self._stats_lock:
+            self._stats["processed"] += 1
+
+
+class _TopicCounters:
+    """
+    Per-second message/byte counters of one topic (a ring of history_secs + 1 slots: the complete
+    seconds plus the one still filling up).
+    """
+    __slots__ = ("second", "counts", "sizes", "total", "total_bytes", "last_seen")
+
+    def __init__(self, history_secs: int, second: int):
+        self.second = second  # newest second recorded; slot = second % len(counts)
+        self.counts = [0] * (history_secs + 1)
+        self.sizes = [0] * (history_secs + 1)
+        self.total = 0
+        self.total_bytes = 0
+        self.last_seen = 0.0
+
+    def add(self, second: int, size: int, received_at: float):
+        n = len(self.counts)
+        if second > self.second:
+            for s in range(max(self.second + 1, second - n + 1), second + 1):
+                self.counts[s % n] = 0
+                self.sizes[s % n] = 0
+            self.second = second
+        if second > self.second - n:
+            self.counts[second % n] += 1
+            self.sizes[second % n] += size
+        self.total += 1
+        self.total_bytes += size
+        if received_at > self.last_seen:
+            self.last_seen = received_at
+
+    def series(self, end_second: int) -> tuple:
+        """
+        (counts, sizes) per second for the history_secs seconds up to end_second (inclusive), oldest
+        first; (None, None) if the topic had no messages in that window
+        """
+        n = len(self.counts)
+        history = n - 1
+        if self.second <= end_second - history:
+            return None, None
+        start = (end_second - history + 1) % n
+        counts = (self.counts[start:] + self.counts[:start])[:history]
+        sizes = (self.sizes[start:] + self.sizes[:start])[:history]
+        if self.second < end_second:  # seconds after the newest record: still older values
+            stale = end_second - self.second
+            counts[-stale:] = sizes[-stale:] = [0] * stale
+        elif self.second > end_second + 1:  # clock stepped back: drop the overwritten seconds
+            stale = min(self.second - end_second - 1, history)
+            counts[:stale] = sizes[:stale] = [0] * stale
+        return counts, sizes
+
+
+class TopicActivity:
+    """
+    Live per-topic message and byte rates for the statistics panel (and get_stats()).
+    record() costs O(1) per message: each topic keeps per-second counters in a small ring.
+    All aggregation happens in snapshot(), which a reader calls on a throttled timer, so its cost
+    depends on the number of topics, not on the message rate. Per-filter rows are summed from the
+    topics matching each subscription filter (a TopicFilterTrie lookup per new topic, cached). At
+    most max_topics topics are tracked; a new topic beyond that evicts the one seen least recently.
+    """
+
+    def __init__(self, history_secs: int = 60, max_topics: int = 2000):
+        self.history_secs = max(2, history_secs)
+        self.max_topics = max(1, max_topics)
+        self._lock = threading.Lock()
+        self._topics = collections.OrderedDict()  # topic -> _TopicCounters, least recently seen first
+        self._evicted = 0
+        self._match_filters = ()
+        self._filter_trie = TopicFilterTrie()
+        self._matches = {}  # topic -> filters it matches (for _match_filters)
+
+    def on_message(self, message: ReceivedMessage):
+        """IngestPipeline listener"""
+        self.record(message.topic, message.size, message.received_at)
+
+    def record(self, topic: str, size: int, received_at: Optional[float] = None):
+        received_at = time.time() if received_at is None else received_at
+        second = int(received_at)
+        with self._lock:
+            counters = self._topics.get(topic)
+            if counters is None:
+                counters = self._topics[topic] = _TopicCounters(self.history_secs, second)
+                if len(self._topics) > self.max_topics:
+                    self._topics.popitem(last=False)
+                    self._evicted += 1
+            else:
+                self._topics.move_to_end(topic)
+            counters.add(second, size, received_at)
+
+    def clear(self):
+        with self._lock:
+            self._topics.clear()
+            self._matches = {}
+            self._evicted = 0
+
+    def snapshot(self, filters=(), rate_secs: int = 5, now: Optional[float] = None) -> dict:
+        """
+        {"topics": [row, ...], "filters": [row, ...], "evicted": n} with one row per topic (most
+        recently seen first) and per filter (in the given order). A row is a dict: name,
+        msgs_per_sec and bytes_per_sec (over the last rate_secs complete seconds), last_seen
+        (epoch seconds, 0 = never), total, total_bytes, history (messages per second over the
+        last history_secs complete seconds, oldest first) and, for filters, topics (matching names).
+        """
+        now = time.time() if now is None else now
+        end_second = int(now) - 1  # the current second is still filling up
+        rate_secs = max(1, min(rate_secs, self.history_secs))
+        filters = tuple(filters)
+        with self._lock:
+            if filters != self._match_filters:
+                self._match_filters = filters
+                self._filter_trie = TopicFilterTrie(filters)
+                self._matches = {}
+            elif len(self._matches) > 2 * self.max_topics:
+                self._matches = {}
+            matches, trie = self._matches, self._filter_trie
+            entries = []
+            for topic, counters in reversed(self._topics.items()):
+                counts, sizes = counters.series(end_second)
+                entries.append((topic, counts, sizes, counters.last_seen, counters.total, counters.total_bytes))
+            evicted = self._evicted
+        idle = [0] * self.history_secs
+        topics, by_filter = [], {topic_filter: [] for topic_filter in filters}
+        for topic, counts, sizes, last_seen, total, total_bytes in entries:
+            row = {
+                "name": topic,
+                "msgs_per_sec": sum(counts[-rate_secs:]) / rate_secs if counts else 0.0,
+                "bytes_per_sec": sum(sizes[-rate_secs:]) / rate_secs if sizes else 0.0,
+                "last_seen": last_seen,
+                "total": total,
+                "total_bytes": total_bytes,
+                "history": counts or idle,
+            }
+            topics.append(row)
+            matched = matches.get(topic)
+            if matched is None:
+                matched = matches[topic] = [topic_filter for topic_filter, _ in trie.match(topic)]
+            for topic_filter in matched:
+                by_filter[topic_filter].append(row)
+        filter_rows = []
+        for topic_filter, members in by_filter.items():
+            row = self.combine(members, len(idle))
+            row["name"] = topic_filter
+            row["topics"] = [member["name"] for member in members]
+            filter_rows.append(row)
+        return {"topics": topics, "filters": filter_rows, "evicted": evicted}
+
+    @staticmethod
+    def combine(rows, history_secs: int = 60) -> dict:
+        """One row summing snapshot rows (rates, totals and history add up; last_seen is the latest)"""
+        active = [row["history"] for row in rows if any(row["history"])]
+        return {
+            "name": "",
+            "msgs_per_sec": sum(row["msgs_per_sec"] for row in rows),
+            "bytes_per_sec": sum(row["bytes_per_sec"] for row in rows),
+            "last_seen": max((row["last_seen"] for row in rows), default=0.0),
+            "total": sum(row["total"] for row in rows),
+            "total_bytes": sum(row["total_bytes"] for row in rows),
+            "history": [sum(column) for column in zip(*active)] if active else [0] * history_secs,
+        }
+
+    def get_stats(self) -> dict:
+        """Compact per-topic rates for headless stats lines"""
+        snapshot = self.snapshot()
+        busiest = sorted(snapshot["topics"], key=lambda row: row["msgs_per_sec"], reverse=True)[:20]
+        return {
+            "topics": len(snapshot["topics"]),
+            "evicted": snapshot["evicted"],
+            "msgs_per_sec": {row["name"]: round(row["msgs_per_sec"], 1) for row in busiest if row["msgs_per_sec"]},
+        }
+
+
+class SeriesBuffer:
+    """
+    Fixed-capacity ring of (time, value) samples in two NumPy float64 arrays (oldest samples are
+    overwritten). append() is called per sample on the ingest worker and only adds to a pending
+    list; window() folds the pending samples into the ring with one vectorized copy.
+    """
+
+    def __init__(self, capacity: int = 200_000):
+        import numpy
+        self.capacity = max(2, capacity)
+        self._times = numpy.zeros(self.capacity)
+        self._values = numpy.zeros(self.capacity)
+        self._written = 0  # samples ever written; the next one goes to _written % capacity
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return min(self._written + len(self._pending), self.capacity)
+
+    def append(self, t: float, value: float):
+        with self._lock:
+            self._pending.append((t, value))
+            if len(self._pending) >= self.capacity:  # nobody is reading: keep memory bounded
+                self._flush()
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self._written = 0
+
+    def _flush(self):
+        import numpy
+        if not self._pending:
+            return
+        samples = numpy.array(self._pending[-self.capacity:], dtype=numpy.float64)
+        self._written += len(self._pending) - len(samples)
+        self._pending = []
+        start = self._written % self.capacity
+        head = min(len(samples), self.capacity - start)
+        self._times[start:start + head] = samples[:head, 0]
+        self._values[start:start + head] = samples[:head, 1]
+        self._times[:len(samples) - head] = samples[head:, 0]
+        self._values[:len(samples) - head] = samples[head:, 1]
+        self._written += len(samples)
+
+    def window(self, since: Optional[float] = None) -> tuple:
+        """(times, values) copies of the samples at or after `since` (all if None), oldest first"""
+        import numpy
+        with self._lock:
+            self._flush()
+            count = min(self._written, self.capacity)
+            start = (self._written - count) % self.capacity
+            # The ring is two time-ordered runs: [start:] and [:start] (when it has wrapped)
+            runs = [(start, min(start + count, self.capacity)), (0, start if self._written > self.capacity else 0)]
+            times, values = [], []
+            for first, last in runs:
+                if since is not None and first < last:
+                    first += int(numpy.searchsorted(self._times[first:last], since))
+                times.append(self._times[first:last])
+                values.append(self._values[first:last])
+            return numpy.concatenate(times), numpy.concatenate(values)
+
+
+def decimate_minmax(times, values, start: float, end: float, buckets: int) -> tuple:
+    """
+    Min/max decimation of time-ordered samples for a plot `buckets` pixels wide: each pixel column
+    in [start, end) keeps its minimum and maximum (in that order), so spikes survive and the
+    output has at most 2 * buckets points however many samples there are. Returns (x, y) arrays.
+    """
+    import numpy
+    if len(times) <= 2 * buckets or end <= start:
+        return times, values
+    edges = numpy.linspace(start, end, buckets + 1)
+    firsts = numpy.searchsorted(times, edges[:-1])
+    lasts = numpy.append(firsts[1:], numpy.searchsorted(times, end))
+    occupied = lasts > firsts
+    firsts = firsts[occupied]
+    x = numpy.repeat((edges[:-1] + (end - start) / (2 * buckets))[occupied], 2)
+    y = numpy.empty(len(x))
+    y[0::2] = numpy.minimum.reduceat(values, firsts)
+    y[1::2] = numpy.maximum.reduceat(values, firsts)
+    return x, y
+
+
+class FieldSeriesFeed:
+    """
+    Live numeric series of JSON payload fields for charts (IngestPipeline listener).
+    watch(topic_filter, path) returns a SeriesBuffer that gets one sample (received time, value)
+    per message on a matching topic with a number or boolean at the path; a wildcard filter merges
+    its topics into one series. The latest decoded payload of recent topics is kept so a chart UI
+    can offer the numeric fields a topic actually sends.
+    """
+
+    def __init__(self, capacity: int = 200_000, max_series: int = 8, max_recent_topics: int = 200):
+        self.capacity = capacity
+        self.max_series = max_series
+        self.max_recent_topics = max_recent_topics
+        self._lock = threading.Lock()
+        self._watched = {}  # (topic filter, path) -> (path keys, SeriesBuffer)
+        self._routes = TopicFilterTrie()  # topic filter -> ((path keys, SeriesBuffer), ...)
+        self._latest = collections.OrderedDict()  # topic -> decoded payload
+
+    def watch(self, topic_filter: str, path: str) -> SeriesBuffer:
+        """Start a series (or return the existing one); ValueError for a bad path or too many series"""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("Live charts need NumPy (pip install numpy)")
+        path = path.strip().removeprefix("$.")
+        keys = parse_field_path(path)
+        with self._lock:
+            key = (topic_filter, path)
+            if key in self._watched:
+                return self._watched[key][1]
+            if len(self._watched) >= self.max_series:
+                raise ValueError(f"At most {self.max_series} series can be charted at once")
+            buffer = SeriesBuffer(self.capacity)
+            self._watched[key] = (keys, buffer)
+            self._rebuild_routes()
+            return buffer
+
+    def unwatch(self, topic_filter: str, path: str):
+        with self._lock:
+            self._watched.pop((topic_filter, path.strip().removeprefix("$.")), None)
+            self._rebuild_routes()
+
+    def _rebuild_routes(self):
+        # Swapped in whole so on_message() never sees a half-updated trie
+        routes = TopicFilterTrie()
+        for (topic_filter, _), series in self._watched.items():
+            routes.add(topic_filter, routes.get(topic_filter, ()) + (series,))
+        self._routes = routes
+
+    def series(self) -> list:
+        """[(topic filter, path, SeriesBuffer), ...] in the order they were added"""
+        with self._lock:
+            return [(topic_filter, path, buffer) for (topic_filter, path), (_, buffer) in self._watched.items()]
+
+    def recent_topics(self) -> list:
+        with self._lock:
+            return list(reversed(self._latest))
+
+    def fields_for(self, topic: str) -> list:
+        """Numeric field paths in the latest payload received on topic"""
+        with self._lock:
+            doc = self._latest.get(topic)
+        return numeric_paths(doc) if doc is not None else []
+
+    def on_message(self, message: ReceivedMessage):
+        data = message.data
+        if not isinstance(data, (dict, list)):
+            return
+        with self._lock:
+            self._latest[message.topic] = data
+            self._latest.move_to_end(message.topic)
+            if len(self._latest) > self.max_recent_topics:
+                self._latest.popitem(last=False)
+        for _, series in self._routes.match(message.topic):
+            for keys, buffer in series:
+                value = lookup_field(data, keys)
+                if isinstance(value, (int, float)) and value == value and abs(value) != float("inf"):
+                    buffer.append(message.received_at, float(value))
+
+
+class ConnectionState:
+    """States reported by ConnectionManager."""
+    DISCONNECTED = "Disconnected"
+    CONNECTING = "Connecting"
+    CONNECTED = "Connected"
+    INTERRUPTED = "Interrupted"
+    RESUMING = "Resuming"
+    DISCONNECTING = "Disconnecting"
+
+
+class ConnectionManager:
+    """
+    Non-blocking MQTT connection lifecycle for AWS IoT Core (mTLS).
+    connect() and disconnect() return immediately; progress is driven by awscrt future
+    callbacks and the on_connection_interrupted/resumed events, and reported through
+    on_state_changed(state, detail) and on_log(message). Both are called from awscrt or
+    timer threads, so GUI callers must marshal them (the main window uses Qt signals).
+    subscribed_topics survives interruptions: when a session is lost the filters are restored
+    (Resuming state) before the connection reports Connected again.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        client_id: str,
+        cert_path: str,
+        key_path: str,
+        ca_path: str,
+        keep_alive_secs: int = 30,
+        reconnect_min_timeout_secs: int = 1,
+        reconnect_max_timeout_secs: int = 32,
+        connect_timeout_secs: float = 10.0,
+        disconnect_timeout_secs: float = 5.0,
+        operation_timeout_ms: int = 15000,
+        on_state_changed=None,
+        on_log=None,
+    ):
+        self.endpoint = endpoint
+        self.client_id = client_id
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.ca_path = ca_path
+        self.keep_alive_secs = keep_alive_secs
+        # Backoff caps for the SDK's own reconnect loop after an interruption
+        self.reconnect_min_timeout_secs = reconnect_min_timeout_secs
+        self.reconnect_max_timeout_secs = reconnect_max_timeout_secs
+        self.connect_timeout_secs = connect_timeout_secs
+        self.disconnect_timeout_secs = disconnect_timeout_secs
+        # Publish/subscribe futures fail after this instead of waiting forever for an ACK
+        self.operation_timeout_ms = operation_timeout_ms
+        self.on_state_changed = on_state_changed
+        self.on_log = on_log
+        self.connection = None
+        self.state = ConnectionState.DISCONNECTED
+        self.last_error = ""
+        self.subscribed_topics = TopicFilterTrie()  # filter -> per-filter handler (or None)
+        self.subscription_qos = mqtt.QoS.AT_LEAST_ONCE
+        self.message_callback = None  # callback(topic, payload, **kwargs) used when restoring subscriptions
+        self._state_listeners = []
+        self._lock = threading.RLock()
+        self._disconnected = threading.Event()
+        self._disconnected.set()
+        # Bumped on every connect/disconnect so late callbacks from an abandoned attempt are ignored
+        self._generation = 0
+        self._timer = None
+
+    # -- public API -------------------------------------------------------------------------
+
+    def is_connected(self) -> bool:
+        return self.state == ConnectionState.CONNECTED
+
+    def add_state_listener(self, callback):
+        """Register an extra callback(state, detail), called in order after on_state_changed."""
+        self._state_listeners.append(callback)
+
+    def connect(self) -> bool:
+        """Start connecting in the background. Returns False if not currently disconnected."""
+        with self._lock:
+            if self.state != ConnectionState.DISCONNECTED:
+                return False
+            self._generation += 1
+            generation = self._generation
+            self.last_error = ""
+            self._disconnected.clear()
+            self._set_state(ConnectionState.CONNECTING)
+        try:
+            self._start_connect(generation)
+        except Exception as e:
+            self._log(f"Full traceback:\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+            self._fail(generation, "Unexpected Error", f"Unexpected error during connection: {e}")
+        return True
+
+    def disconnect(self) -> bool:
+        """Unsubscribe all topics and disconnect in the background. Returns False if already idle."""
+        with self._lock:
+            if self.state in (ConnectionState.DISCONNECTED, ConnectionState.DISCONNECTING):
+                return False
+            self._generation += 1
+            generation = self._generation
+            self._cancel_timer()
+            connection = self.connection
+            self._set_state(ConnectionState.DISCONNECTING)
+        if connection is None:
+            self._finish_disconnect(generation, "")
+            return True
+        for topic in list(self.subscribed_topics):
+            try:
+                # Unsubscribe (returns tuple: (future, packet_id)); DISCONNECT is queued after it
+                unsubscribe_future, packet_id = connection.unsubscribe(topic)
+                unsubscribe_future.add_done_callback(functools.partial(self._on_unsubscribe_done, topic))
+            except Exception as e:
+                self._log(f"Error unsubscribing from {topic}: {e}")
+        self.subscribed_topics.clear()
+        try:
+            disconnect_future = connection.disconnect()
+            disconnect_future.add_done_callback(functools.partial(self._on_disconnect_done, generation))
+            self._start_timer(self.disconnect_timeout_secs, self._on_disconnect_timeout, generation)
+        except Exception as e:
+            self._finish_disconnect(generation, f"Disconnect error: {e}")
+        return True
+
+    def abandon(self, reason: str) -> bool:
+        """
+        Drop the current connection without unsubscribing (e.g. when the SDK's own reconnect
+        has stalled) so a fresh connect() can restore subscribed_topics on a new connection.
+        """
+        with self._lock:
+            if self.state in (ConnectionState.DISCONNECTED, ConnectionState.DISCONNECTING):
+                return False
+            self._generation += 1
+            self._cancel_timer()
+            connection, self.connection = self.connection, None
+            self._log(f"Abandoning connection: {reason}")
+            self._set_state(ConnectionState.DISCONNECTED, reason)
+        if connection is not None:
+            try:
+                connection.disconnect()
+            except Exception:
+                pass
+        return True
+
+    def wait_until_disconnected(self, timeout: float) -> bool:
+        return self._disconnected.wait(timeout)
+
+    # -- internals --------------------------------------------------------------------------
+
+    def _log(self, message: str):
+        logger.info(message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _set_state(self, state: str, detail: str = ""):
+        with self._lock:
+            self.state = state
+            if state == ConnectionState.DISCONNECTED:
+                self._disconnected.set()
+            # Called under the lock so listeners see transitions in order
+            for listener in [self.on_state_changed] + self._state_listeners:
+                if listener is None:
+                    continue
+                try:
+                    listener(state, detail)
+                except Exception:
+                    logger.exception("Connection state listener failed")
+
+    def _start_timer(self, seconds: float, callback, generation: int):
+        self._cancel_timer()
+        self._timer = threading.Timer(seconds, callback, args=(generation,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start_connect(self, generation: int):
+        # Step 1: Verify certificate files exist
+        self._log("Step 1: Verifying certificate files...")
+        missing_files = []
+        for name, path in (("CA Root", self.ca_path), ("Certificate", self.cert_path), ("Private Key", self.key_path)):
+            if os.path.exists(path):
+                self._log(f"  ✓ {name}: {path} (Size: {os.path.getsize(path)} bytes)")
+            else:
+                missing_files.append(f"{name}: {path}")
+                self._log(f"  ✗ {name}: NOT FOUND - {path}")
+        if missing_files:
+            self._fail(generation, "Missing Files", "Certificate files not found:\n" + "\n".join(missing_files))
+            return
+
+        # Step 2: Build MQTT connection
+        self._log("Step 2: Building MQTT connection with mTLS...")
+        try:
+            connection = mqtt_connection_builder.mtls_from_path(
+                endpoint=self.endpoint,
+                cert_filepath=self.cert_path,
+                pri_key_filepath=self.key_path,
+                ca_filepath=self.ca_path,
+                client_id=self.client_id,
+                clean_session=False,
+                keep_alive_secs=self.keep_alive_secs,
+                reconnect_min_timeout_secs=self.reconnect_min_timeout_secs,
+                reconnect_max_timeout_secs=self.reconnect_max_timeout_secs,
+                protocol_operation_timeout_ms=self.operation_timeout_ms,
+                on_connection_interrupted=self._on_connection_interrupted,
+                on_connection_resumed=self._on_connection_resumed,
+            )
+            self._log("  ✓ MQTT connection object created successfully")
+        except Exception as e:
+            self._log(f"Exception type: {type(e).__name__}")
+            self._log(f"Traceback:\n{''.join(traceback.format_tb(e.__traceback__))}")
+            self._fail(generation, "Build Error", f"Failed to create MQTT connection object: {e}")
+            return
+
+        # Step 3: Establish connection (completion arrives on an awscrt thread)
+        self._log("Step 3: Establishing connection to AWS IoT Core...")
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.connection = connection
+            self._start_timer(self.connect_timeout_secs, self._on_connect_timeout, generation)
+        self._log(f"  → Waiting for connection (timeout: {self.connect_timeout_secs:g} seconds)...")
+        connect_future = connection.connect()
+        connect_future.add_done_callback(functools.partial(self._on_connect_done, generation))
+
+    def _fail(self, generation: int, reason: str, error_msg: str):
+        """Abandon a connect attempt and report DISCONNECTED with the failure reason as detail."""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._generation += 1
+            self._cancel_timer()
+            connection, self.connection = self.connection, None
+            self.last_error = error_msg
+            self._log(f"ERROR: {error_msg}")
+            self._set_state(ConnectionState.DISCONNECTED, reason)
+        if connection is not None:
+            try:
+                connection.disconnect()
+            except Exception:
+                pass
+
+    def _log_connect_diagnostics(self):
+        self._log("\nDiagnostics:")
+        self._log(f"  - Check if endpoint is correct: {self.endpoint}")
+        self._log("  - Check if certificate policy allows iot:Connect")
+        self._log("  - Check if client ID is unique and not already in use")
+        self._log("  - Check network connectivity to AWS IoT endpoint")
+
+    def _on_connect_done(self, generation: int, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._log(f"Exception type: {type(e).__name__}")
+            self._log_connect_diagnostics()
+            self._fail(generation, "", f"Connection timeout or failed: {e}")
+            return
+        with self._lock:
+            if generation != self._generation or self.state != ConnectionState.CONNECTING:
+                return
+            self._cancel_timer()
+            session_present = bool(result.get("session_present")) if isinstance(result, dict) else False
+            self._log("  ✓ Connection established successfully!")
+            if not self.subscribed_topics:
+                self._set_state(ConnectionState.CONNECTED, f"session present: {session_present}")
+                return
+            # New connection object after a reconnect: callbacks live per connection, so every
+            # filter must be subscribed again even if the broker kept the session
+            self._set_state(ConnectionState.RESUMING, f"session present: {session_present}")
+            self._subscribe_each(generation, self.connection, sorted(self.subscribed_topics))
+
+    def _on_connect_timeout(self, generation: int):
+        with self._lock:
+            if generation != self._generation or self.state != ConnectionState.CONNECTING:
+                return
+        self._log_connect_diagnostics()
+        self._fail(generation, "", f"Connection timeout or failed: no CONNACK within {self.connect_timeout_secs:g} seconds")
+
+    def _on_unsubscribe_done(self, topic: str, future):
+        try:
+            future.result()
+            self._log(f"Unsubscribed from: {topic}")
+        except Exception as e:
+            self._log(f"Error unsubscribing from {topic}: {e}")
+
+    def _on_disconnect_done(self, generation: int, future):
+        try:
+            future.result()
+            error = ""
+        except Exception as e:
+            error = f"Disconnect error: {e}"
+        self._finish_disconnect(generation, error)
+
+    def _on_disconnect_timeout(self, generation: int):
+        self._finish_disconnect(generation, f"Disconnect error: no response within {self.disconnect_timeout_secs:g} seconds")
+
+    def _finish_disconnect(self, generation: int, error: str):
+        with self._lock:
+            if generation != self._generation or self.state != ConnectionState.DISCONNECTING:
+                return
+            self._cancel_timer()
+            self.connection = None
+            self.last_error = error
+            if error:
+                self._log(f"ERROR: {error}")
+            self._set_state(ConnectionState.DISCONNECTED, "with errors" if error else "")
+
+    def _on_connection_interrupted(self, connection, error, **kwargs):
+        """awscrt event: link lost; the SDK keeps retrying in the background."""
+        with self._lock:
+            if connection is not self.connection or self.state != ConnectionState.CONNECTED:
+                return
+            self._log(f"Connection interrupted: {error}")
+            self._set_state(ConnectionState.INTERRUPTED, str(error))
+
+    def _on_connection_resumed(self, connection, return_code, session_present, **kwargs):
+        """awscrt event: link re-established after an interruption."""
+        with self._lock:
+            if connection is not self.connection or self.state not in (
+                ConnectionState.INTERRUPTED, ConnectionState.CONNECTED
+            ):
+                return
+            self._set_state(ConnectionState.RESUMING, f"return code: {return_code}, session present: {session_present}")
+            self._log(f"Connection resumed (return code: {return_code}, session present: {session_present})")
+            if session_present or not self.subscribed_topics:
+                self._set_state(ConnectionState.CONNECTED, "resumed")
+                return
+            generation = self._generation
+            topics = sorted(self.subscribed_topics)
+        # Session lost: the SDK still knows every filter and callback, so restore them all
+        # with a single SUBSCRIBE packet and fall back to per-filter subscribes on rejection
+        self._log(f"Session not present; re-subscribing {len(topics)} topic filter(s) in one SUBSCRIBE")
+        try:
+            resubscribe_future, packet_id = connection.resubscribe_existing_topics()
+            resubscribe_future.add_done_callback(
+                functools.partial(self._on_resubscribe_done, generation, connection, topics)
+            )
+        except Exception as e:
+            self._log(f"Re-subscribe failed ({e}); subscribing filters individually")
+            self._subscribe_each(generation, connection, topics)
+
+    def _on_resubscribe_done(self, generation: int, connection, topics: list, future):
+        try:
+            result = future.result()
+            granted = {topic: qos for topic, qos in (result or {}).get("topics") or []}
+            failed = [t for t in topics if granted.get(t) is None]
+        except Exception as e:
+            self._log(f"Re-subscribe failed ({e}); subscribing filters individually")
+            failed = topics
+        if failed:
+            self._subscribe_each(generation, connection, failed)
+        else:
+            self._finish_restore(generation, len(topics), [])
+
+    def _subscribe_each(self, generation: int, connection, topics: list):
+        """Issue one SUBSCRIBE per filter concurrently; report Connected once all have completed."""
+        if not topics:
+            self._finish_restore(generation, 0, [])
+            return
+        pending = {"count": len(topics), "failed": []}
+        pending_lock = threading.Lock()
+
+        def on_done(topic, future):
+            try:
+                future.result()
+            except Exception as e:
+                self._log(f"Error re-subscribing to {topic}: {e}")
+                with pending_lock:
+                    pending["failed"].append(topic)
+            with pending_lock:
+                pending["count"] -= 1
+                finished = pending["count"] == 0
+            if finished:
+                self._finish_restore(generation, len(topics), pending["failed"])
+
+        for topic in topics:
+            try:
+                subscribe_future, packet_id = connection.subscribe(
+                    topic=topic, qos=self.subscription_qos, callback=self.message_callback
+                )
+                subscribe_future.add_done_callback(functools.partial(on_done, topic))
+            except Exception as e:
+                failed_future = concurrent.futures.Future()
+                failed_future.set_exception(e)
+                on_done(topic, failed_future)
+
+    def _finish_restore(self, generation: int, count: int, failed: list):
+        with self._lock:
+            if generation != self._generation or self.state != ConnectionState.RESUMING:
+                return
+            if failed:
+                self._log(f"Could not restore {len(failed)} subscription(s): {', '.join(failed)}")
+                self.subscribed_topics.difference_update(failed)
+            self._log(f"Restored {count - len(failed)} subscription(s)")
+            self._set_state(ConnectionState.CONNECTED, "resumed")
+
+
+class ReconnectSupervisor:
+    """
+    Keeps the link up once the user has connected.
+    While the SDK retries an interrupted connection itself (bounded by the manager's
+    reconnect_min/max_timeout_secs), the supervisor only measures the outage; if the link
+    stays interrupted past resume_timeout_secs, or a reconnect attempt fails, it abandons the
+    connection and reconnects from scratch with capped exponential backoff and jitter.
+    User-initiated disconnects (Disconnecting state) stop supervision.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        initial_delay_secs: float = 1.0,
+        max_delay_secs: float = 60.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+        resume_timeout_secs: float = 90.0,
+        on_log=None,
+    ):
+        self.manager = manager
+        self.initial_delay_secs = initial_delay_secs
+        self.max_delay_secs = max_delay_secs
+        self.multiplier = multiplier
+        self.jitter = min(max(jitter, 0.0), 1.0)  # 0 = fixed delays, 1 = full jitter
+        self.resume_timeout_secs = resume_timeout_secs
+        self.on_log = on_log
+        self.active = False
+        self.next_attempt_at = None  # epoch seconds of the scheduled reconnect, if any
+        self._attempt = 0
+        self._outage_started = None
+        self._link_restored_at = None
+        self._timer = None
+        self._lock = threading.RLock()
+        self._stats = {
+            "interruptions": 0,
+            "reconnect_attempts": 0,
+            "recoveries": 0,
+            "total_downtime_secs": 0.0,
+            "last_downtime_secs": 0.0,
+            "last_time_to_recover_secs": 0.0,
+            "max_time_to_recover_secs": 0.0,
+        }
+        manager.add_state_listener(self._on_state_changed)
+
+    def stop(self):
+        """Stop supervising (user disconnect); cancels any scheduled reconnect."""
+        with self._lock:
+            self.active = False
+            self._cancel_timer()
+            self.next_attempt_at = None
+            self._attempt = 0
+            self._outage_started = None
+
+    def is_reconnecting(self) -> bool:
+        return self.active and self._outage_started is not None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            if self._outage_started is not None:
+                stats["current_downtime_secs"] = time.time() - self._outage_started
+            return stats
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Delay before reconnect attempt number `attempt` (1-based)."""
+        capped = min(self.max_delay_secs, self.initial_delay_secs * (self.multiplier ** max(0, attempt - 1)))
+        return capped * (1.0 - self.jitter * random.random())
+
+    def _log(self, message: str):
+        logger.info(message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start_timer(self, seconds: float, callback):
+        self._cancel_timer()
+        self._timer = threading.Timer(seconds, callback)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_state_changed(self, state: str, detail: str):
+        # Runs on awscrt/timer threads under the manager lock: never call back into the
+        # manager synchronously here, always go through a timer
+        with self._lock:
+            now = time.time()
+            if state == ConnectionState.DISCONNECTING:
+                self.stop()
+            elif state == ConnectionState.CONNECTED:
+                if self._outage_started is not None:
+                    self._record_recovery(now)
+                self.active = True
+                self._attempt = 0
+                self._cancel_timer()
+                self.next_attempt_at = None
+            elif state == ConnectionState.INTERRUPTED and self.active:
+                if self._outage_started is None:
+                    self._outage_started = now
+                    self._link_restored_at = None
+                    self._stats["interruptions"] += 1
+                self._start_timer(self.resume_timeout_secs, self._on_resume_timeout)
+            elif state == ConnectionState.RESUMING and self._outage_started is not None:
+                self._link_restored_at = now
+            elif state == ConnectionState.DISCONNECTED and self.active:
+                if self._outage_started is None:
+                    self._outage_started = now
+                    self._link_restored_at = None
+                    self._stats["interruptions"] += 1
+                self._attempt += 1
+                delay = self.backoff_delay(self._attempt)
+                self.next_attempt_at = now + delay
+                self._log(f"Reconnect attempt {self._attempt} in {delay:.1f} s")
+                self._start_timer(delay, self._on_reconnect_due)
+
+    def _record_recovery(self, now: float):
+        time_to_recover = now - self._outage_started
+        downtime = (self._link_restored_at or now) - self._outage_started
+        s = self._stats
+        s["recoveries"] += 1
+        s["total_downtime_secs"] += downtime
+        s["last_downtime_secs"] = downtime
+        s["last_time_to_recover_secs"] = time_to_recover
+        s["max_time_to_recover_secs"] = max(s["max_time_to_recover_secs"], time_to_recover)
+        self._log(
+            f"Connection recovered: downtime {downtime:.1f} s, time to recover {time_to_recover:.1f} s, "
+            f"{self._attempt} reconnect attempt(s); {s['recoveries']} recovery(ies) so far"
+        )
+        self._outage_started = None
+        self._link_restored_at = None
+
+    def _on_resume_timeout(self):
+        with self._lock:
+            if not self.active or self.manager.state != ConnectionState.INTERRUPTED:
+                return
+        self.manager.abandon(f"still interrupted after {self.resume_timeout_secs:g} s")
+
+    def _on_reconnect_due(self):
+        with self._lock:
+            if not self.active or self.manager.state != ConnectionState.DISCONNECTED:
+                return
+            self.next_attempt_at = None
+            self._stats["reconnect_attempts"] += 1
+        self._log(f"Reconnecting to AWS IoT Core (attempt {self._attempt})...")
+        self.manager.connect()
+
+
+def validate_topic_filter(topic_filter: str):
+    """Raise ValueError unless topic_filter is a valid MQTT subscription filter."""
+    if not topic_filter:
+        raise ValueError("Topic filter is empty")
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            raise ValueError(f"'#' must be the whole last level: {topic_filter}")
+        if "+" in level and level != "+":
+            raise ValueError(f"'+' must be a whole level: {topic_filter}")
+
+
+def list_subscription_sets(conn: sqlite3.Connection) -> list:
+    """Saved subscription sets as [(name, enabled, [filters in saved order])], by name."""
+    filters = collections.defaultdict(list)
+    for name, topic_filter in conn.execute(
+        "SELECT set_name, topic_filter FROM subscription_set_filters ORDER BY set_name, position"
+    ):
+        filters[name].append(topic_filter)
+    return [
+        (name, bool(enabled), filters[name])
+        for name, enabled in conn.execute("SELECT name, enabled FROM subscription_sets ORDER BY name")
+    ]
+
+
+def save_subscription_set(conn: sqlite3.Connection, name: str, filters: list, enabled: bool = True):
+    """Create or replace a subscription set (one transaction)."""
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO subscription_sets (name, enabled) VALUES (?, ?)", (name, int(enabled)))
+        conn.execute("DELETE FROM subscription_set_filters WHERE set_name = ?", (name,))
+        conn.executemany(
+            "INSERT INTO subscription_set_filters (set_name, topic_filter, position) VALUES (?, ?, ?)",
+            [(name, topic_filter, i) for i, topic_filter in enumerate(filters)],
+        )
+
+
+def delete_subscription_set(conn: sqlite3.Connection, name: str):
+    with conn:
+        conn.execute("DELETE FROM subscription_set_filters WHERE set_name = ?", (name,))
+        conn.execute("DELETE FROM subscription_sets WHERE name = ?", (name,))
+
+
+class SubscriptionState:
+    PENDING = "Pending"  # wanted, waiting for a connection
+    SUBSCRIBING = "Subscribing"  # SUBSCRIBE sent, waiting for the SUBACK
+    SUBSCRIBED = "Subscribed"
+    FAILED = "Failed"
+    UNSUBSCRIBING = "Unsubscribing"
+
+
+class FilterSubscription:
+    """One topic filter tracked by SubscriptionManager, from wanted until unsubscribed."""
+    __slots__ = ("topic_filter", "sets", "manual", "handler", "state", "granted_qos", "sent_at", "latency_secs",
+                 "error", "waiters", "batch")
+
+    def __init__(self, topic_filter: str):
+        self.topic_filter = topic_filter
+        self.sets = ()  # enabled subscription sets that include this filter
+        self.manual = False  # subscribed one-off through subscribe() (not saved)
+        self.handler = None  # per-filter handler for the ingest router (manual subscriptions only)
+        self.state = SubscriptionState.PENDING
+        self.granted_qos = None
+        self.sent_at = 0.0  # perf_counter() when the SUBSCRIBE was issued
+        self.latency_secs = None  # SUBSCRIBE -> SUBACK of the last attempt
+        self.error = ""
+        self.waiters = []  # concurrent.futures.Future objects resolved by the SUBACK
+        self.batch = None
+
+
+class SubscriptionManager:
+    """
+    Named subscription sets (saved in the subscription_sets tables) plus one-off filters, kept
+    subscribed across connects. Whenever the connection manager reports Connected, every wanted
+    filter that is not subscribed yet gets its SUBSCRIBE issued at once and the SUBACKs are
+    collected by future callbacks, so N filters cost one round trip instead of N blocking waits.
+    Saving, enabling or disabling a set subscribes/unsubscribes the difference immediately.
+    Per-filter state and SUBACK latency are exposed through snapshot() and get_stats();
+    on_changed() is called (from awscrt or caller threads) whenever they change.
+    """
+
+    def __init__(self, manager: ConnectionManager, db_path: str, pragmas: Optional[dict] = None,
+                 on_changed=None, on_log=None):
+        self.manager = manager
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.on_changed = on_changed
+        self.on_log = on_log
+        self._sets = {}  # name -> (enabled, [filters], persisted)
+        self._filters = {}  # topic filter -> FilterSubscription
+        self._lock = threading.RLock()
+        self._stats = {
+            "subscribes": 0,
+            "subacks": 0,
+            "rejected": 0,
+            "total_suback_secs": 0.0,
+            "max_suback_secs": 0.0,
+            "last_batch_filters": 0,
+            "last_batch_secs": 0.0,
+        }
+        manager.add_state_listener(self._on_state_changed)
+
+    # -- subscription sets ------------------------------------------------------------------
+
+    def load(self):
+        """Read the saved sets (after migrate_database); subscribes them if already connected."""
+        conn = open_database(self.db_path, self.pragmas)
+        try:
+            rows = list_subscription_sets(conn)
+        finally:
+            conn.close()
+        with self._lock:
+            for name, enabled, filters in rows:
+                self._sets[name] = (enabled, filters, True)
+            self._reconcile()
+        if rows:
+            self._log("Subscription sets: " + ", ".join(
+                f"{name} ({len(filters)} filter(s){'' if enabled else ', disabled'})" for name, enabled, filters in rows
+            ))
+        self._changed()
+
+    def sets(self) -> list:
+        """[(name, enabled, [filters], persisted)] by name"""
+        with self._lock:
+            return [(name, enabled, list(filters), persisted)
+                    for name, (enabled, filters, persisted) in sorted(self._sets.items())]
+
+    def save_set(self, name: str, filters, enabled: bool = True, persist: bool = True):
+        """
+        Create or replace a set. persist=False keeps it for this run only (e.g. --subscribe).
+        Raises ValueError for an empty name or an invalid filter.
+        """
+        name = name.strip()
+        if not name:
+            raise ValueError("Subscription set needs a name")
+        filters = list(dict.fromkeys(f.strip() for f in filters if f.strip()))
+        for topic_filter in filters:
+            validate_topic_filter(topic_filter)
+        if persist:
+            conn = open_database(self.db_path, self.pragmas)
+            try:
+                save_subscription_set(conn, name, filters, enabled)
+            finally:
+                conn.close()
+        with self._lock:
+            self._sets[name] = (bool(enabled), filters, persist)
+            self._reconcile()
+        self._changed()
+
+    def set_enabled(self, name: str, enabled: bool):
+        with self._lock:
+            _, filters, persisted = self._sets[name]
+        self.save_set(name, filters, enabled, persisted)
+
+    def delete_set(self, name: str):
+        with self._lock:
+            entry = self._sets.pop(name, None)
+            self._reconcile()
+        if entry is None or entry[2]:
+            conn = open_database(self.db_path, self.pragmas)
+            try:
+                delete_subscription_set(conn, name)
+            finally:
+                conn.close()
+        self._changed()
+
+    # -- one-off filters --------------------------------------------------------------------
+
+    def subscribe(self, topic_filter: str, handler=None) -> concurrent.futures.Future:
+        """
+        Subscribe one filter outside any set (not saved). Returns a Future that resolves to True
+        on SUBACK, False if the filter was already subscribed, or raises if it was rejected.
+        """
+        validate_topic_filter(topic_filter)
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self.manager.connection is None:
+                raise RuntimeError("Not connected")
+            sub = self._filters.get(topic_filter)
+            if sub is None:
+                sub = self._filters[topic_filter] = FilterSubscription(topic_filter)
+            sub.manual = True
+            if topic_filter in self.manager.subscribed_topics:
+                future.set_result(False)
+                return future
+            sub.handler = handler
+            sub.waiters.append(future)
+            if sub.state != SubscriptionState.SUBSCRIBING:
+                self._issue([sub])
+        self._changed()
+        return future
+
+    def unsubscribe(self, topic_filter: str) -> concurrent.futures.Future:
+        """
+        Unsubscribe a filter (one-off or from a set; sets bring theirs back on the next connect).
+        Returns a Future that resolves once the UNSUBACK arrives.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            connection = self.manager.connection
+            if connection is None:
+                raise RuntimeError("Not connected")
+            sub = self._filters.pop(topic_filter, None)
+            if sub is not None:
+                self._fail_waiters(sub, "Unsubscribed")
+            try:
+                unsubscribe_future, packet_id = connection.unsubscribe(topic_filter)
+            except Exception as e:
+                future.set_exception(e)
+                return future
+        unsubscribe_future.add_done_callback(functools.partial(self._on_unsuback, topic_filter, future))
+        self._changed()
+        return future
+
+    # -- state ------------------------------------------------------------------------------
+
+    def snapshot(self) -> list:
+        """Per-filter rows (dicts) by filter: filter, sets, manual, state, qos, suback_ms, error"""
+        with self._lock:
+            subs = sorted(self._filters.values(), key=lambda s: s.topic_filter)
+            return [
+                {
+                    "filter": sub.topic_filter,
+                    "sets": sub.sets,
+                    "manual": sub.manual,
+                    "state": sub.state,
+                    "qos": sub.granted_qos,
+                    "suback_ms": None if sub.latency_secs is None else sub.latency_secs * 1000,
+                    "error": sub.error,
+                }
+                for sub in subs
+            ]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sets"] = len(self._sets)
+            stats["filters"] = len(self._filters)
+            for state in (SubscriptionState.PENDING, SubscriptionState.SUBSCRIBING,
+                          SubscriptionState.SUBSCRIBED, SubscriptionState.FAILED):
+                stats[state.lower()] = sum(1 for sub in self._filters.values() if sub.state == state)
+        stats["avg_suback_secs"] = stats["total_suback_secs"] / stats["subacks"] if stats["subacks"] else 0.0
+        return stats
+
+    # -- internals --------------------------------------------------------------------------
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _changed(self):
+        if self.on_changed:
+            try:
+                self.on_changed()
+            except Exception:
+                pass
+
+    def _reconcile(self):
+        """Match the tracked filters to the enabled sets, then subscribe whatever is missing."""
+        wanted = {}
+        for name, (enabled, filters, _) in sorted(self._sets.items()):
+            if enabled:
+                for topic_filter in filters:
+                    wanted.setdefault(topic_filter, []).append(name)
+        for topic_filter, sub in list(self._filters.items()):
+            sub.sets = tuple(wanted.pop(topic_filter, ()))
+            if not sub.sets and not sub.manual:
+                self._release(sub)
+        for topic_filter, names in wanted.items():
+            sub = self._filters[topic_filter] = FilterSubscription(topic_filter)
+            sub.sets = tuple(names)
+        self._subscribe_missing()
+
+    def _release(self, sub: FilterSubscription):
+        """A filter no longer wanted by any set: unsubscribe it (or forget it if never subscribed)."""
+        if sub.state == SubscriptionState.SUBSCRIBING:
+            return  # unsubscribed by _on_suback once the SUBACK arrives
+        del self._filters[sub.topic_filter]
+        connection = self.manager.connection
+        if sub.topic_filter not in self.manager.subscribed_topics or connection is None:
+            return
+        try:
+            unsubscribe_future, packet_id = connection.unsubscribe(sub.topic_filter)
+        except Exception as e:
+            self._log(f"Error unsubscribing from {sub.topic_filter}: {e}", logging.ERROR)
+            return
+        unsubscribe_future.add_done_callback(
+            functools.partial(self._on_unsuback, sub.topic_filter, concurrent.futures.Future())
+        )
+
+    def _subscribe_missing(self):
+        if not self.manager.is_connected():
+            return
+        subscribed = self.manager.subscribed_topics
+        missing = []
+        for sub in self._filters.values():
+            if sub.state == SubscriptionState.SUBSCRIBING:
+                continue
+            if sub.topic_filter in subscribed:
+                sub.state = SubscriptionState.SUBSCRIBED  # restored by the connection manager
+            else:
+                missing.append(sub)
+        if missing:
+            self._log(f"Subscribing {len(missing)} topic filter(s)")
+            self._issue(missing)
+
+    def _issue(self, subs: list):
+        """Send one SUBSCRIBE per filter without waiting; _on_suback collects the results."""
+        connection = self.manager.connection
+        batch = {"started": time.perf_counter(), "filters": len(subs), "outstanding": len(subs)}
+        for sub in subs:
+            sub.state = SubscriptionState.SUBSCRIBING
+            sub.error = ""
+            sub.batch = batch
+            sub.sent_at = time.perf_counter()
+            self._stats["subscribes"] += 1
+            try:
+                subscribe_future, packet_id = connection.subscribe(
+                    topic=sub.topic_filter, qos=self.manager.subscription_qos, callback=self.manager.message_callback
+                )
+                subscribe_future.add_done_callback(functools.partial(self._on_suback, connection, sub, batch))
+            except Exception as e:
+                failed_future = concurrent.futures.Future()
+                failed_future.set_exception(e)
+                self._on_suback(connection, sub, batch, failed_future)
+
+    def _on_suback(self, connection, sub: FilterSubscription, batch: dict, future):
+        latency = time.perf_counter() - sub.sent_at
+        try:
+            result = future.result()
+            qos = getattr(result.get("qos"), "value", result.get("qos")) if isinstance(result, dict) else None
+            # awscrt reports a rejected filter (SUBACK return code 0x80) as qos None
+            error = "" if qos is not None and qos < 0x80 else "Rejected by broker"
+        except Exception as e:
+            qos, error = None, str(e) or type(e).__name__
+        with self._lock:
+            # Ignore SUBACKs for attempts that were reset (link lost) or superseded since
+            if self._filters.get(sub.topic_filter) is not sub or sub.batch is not batch:
+                return
+            sub.batch = None
+            if connection is not self.manager.connection:
+                # Connection replaced while waiting; subscribed again once the new one is up
+                sub.state = SubscriptionState.PENDING
+                self._fail_waiters(sub, "Connection lost")
+                self._subscribe_missing()
+            else:
+                sub.latency_secs = latency
+                sub.granted_qos = qos
+                if error:
+                    self._stats["rejected"] += 1
+                    sub.state = SubscriptionState.FAILED
+                    sub.error = error
+                    self._log(f"Subscribe to '{sub.topic_filter}' failed: {error}", logging.ERROR)
+                    self._fail_waiters(sub, error)
+                else:
+                    self._stats["subacks"] += 1
+                    self._stats["total_suback_secs"] += latency
+                    self._stats["max_suback_secs"] = max(self._stats["max_suback_secs"], latency)
+                    sub.state = SubscriptionState.SUBSCRIBED
+                    self.manager.subscribed_topics.add(sub.topic_filter, sub.handler)
+                    self._log(f"Subscribed to topic filter: {sub.topic_filter} ({latency * 1000:.0f} ms)")
+                    for waiter in sub.waiters:
+                        waiter.set_result(True)
+                    sub.waiters = []
+                    if not sub.sets and not sub.manual:
+                        self._release(sub)
+            batch["outstanding"] -= 1
+            if batch["outstanding"] == 0 and batch["filters"] > 1:
+                elapsed = time.perf_counter() - batch["started"]
+                self._stats["last_batch_filters"] = batch["filters"]
+                self._stats["last_batch_secs"] = elapsed
+                self._log(f"SUBACKs for {batch['filters']} topic filter(s) received in {elapsed * 1000:.0f} ms")
+        self._changed()
+
+    def _on_unsuback(self, topic_filter: str, future: concurrent.futures.Future, unsubscribe_future):
+        try:
+            unsubscribe_future.result()
+        except Exception as e:
+            self._log(f"Error unsubscribing from {topic_filter}: {e}", logging.ERROR)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self.manager.subscribed_topics.discard(topic_filter)
+            sub = self._filters.get(topic_filter)
+            if sub is not None and sub.state == SubscriptionState.SUBSCRIBED:
+                # Wanted again while the UNSUBSCRIBE was in flight
+                sub.state = SubscriptionState.PENDING
+                self._subscribe_missing()
+        self._log(f"Unsubscribed from: {topic_filter}")
+        future.set_result(None)
+        self._changed()
+
+    def _fail_waiters(self, sub: FilterSubscription, error: str):
+        for waiter in sub.waiters:
+            waiter.set_exception(RuntimeError(error))
+        sub.waiters = []
+
+    def _on_state_changed(self, state: str, detail: str):
+        # Runs under the connection manager's lock; subscribe futures never block
+        with self._lock:
+            if state == ConnectionState.CONNECTED:
+                self._reconcile()
+            elif state == ConnectionState.DISCONNECTING:
+                # User disconnect unsubscribes everything: one-off filters are dropped,
+                # set filters wait for the next connect
+                for topic_filter, sub in list(self._filters.items()):
+                    self._fail_waiters(sub, "Disconnected")
+                    if not sub.sets:
+                        del self._filters[topic_filter]
+                        continue
+                    sub.manual = False
+                    sub.handler = None
+                    sub.state = SubscriptionState.PENDING
+                    sub.granted_qos = None
+                    sub.batch = None
+            elif state in (ConnectionState.INTERRUPTED, ConnectionState.DISCONNECTED):
+                # Link lost: nothing counts as subscribed until Connected again, when the
+                # filters are either restored by the connection manager or sent again
+                for sub in self._filters.values():
+                    if sub.state in (SubscriptionState.SUBSCRIBED, SubscriptionState.SUBSCRIBING):
+                        sub.state = SubscriptionState.PENDING
+                        sub.batch = None
+            else:
+                return
+        self._changed()
+
+
+class PendingPublish:
+    """A publish tracked by PublishEngine from submission until PUBACK (or final failure)."""
+    __slots__ = ("publish_id", "outbox_id", "topic", "payload", "qos", "attempts", "sent_at")
+
+    def __init__(self, publish_id: int, topic: str, payload: str, qos: int, outbox_id: Optional[int] = None):
+        self.publish_id = publish_id
+        self.outbox_id = outbox_id
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.attempts = 0
+        self.sent_at = 0.0
+
+
+class PublishEngine:
+    """
+    Fire-and-track publishing with an in-flight window and a persistent outbox.
+    publish() returns immediately. A worker thread records each publish in the outbox table,
+    keeps at most max_in_flight publishes awaiting PUBACK, and deletes outbox rows once
+    acknowledged. While the connection is down publishes wait in the outbox (surviving
+    restarts) and drain automatically when the manager reports Connected again.
+    on_complete(publish_id, topic, payload, error, latency_secs) is called on the worker
+    thread; error is "" on success.
+    """
+    _STOP = object()
+    _PUMP = object()
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        db_path: str,
+        pragmas: Optional[dict] = None,
+        max_in_flight: int = 10,
+        max_attempts: int = 3,
+        on_complete=None,
+        on_log=None,
+    ):
+        self.manager = manager
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_attempts = max(1, max_attempts)
+        self.on_complete = on_complete
+        self.on_log = on_log
+        self._commands = queue.Queue()
+        self._ids = itertools.count(1)
+        self._waiting = collections.deque()
+        self._in_flight = {}
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "acked": 0,
+            "failed": 0,
+            "retried": 0,
+            "restored_from_outbox": 0,
+            "total_latency_secs": 0.0,
+            "max_latency_secs": 0.0,
+        }
+        manager.add_state_listener(self._on_state_changed)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="PublishEngine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker; anything not yet acknowledged stays in the outbox for next start."""
+        if not (self._thread and self._thread.is_alive()):
+            return
+        self._commands.put(self._STOP)
+        self._thread.join(timeout)
+
+    def publish(self, topic: str, payload: str, qos: int = 1) -> int:
+        """Queue a publish (never blocks). Returns its publish id for on_complete matching."""
+        item = PendingPublish(next(self._ids), topic, payload, int(qos))
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        self._commands.put(("publish", item))
+        return item.publish_id
+
+    def pending_count(self) -> int:
+        """Publishes submitted but not yet acknowledged or failed (waiting + in flight)."""
+        with self._stats_lock:
+            s = self._stats
+            return s["submitted"] + s["restored_from_outbox"] - s["acked"] - s["failed"]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["in_flight"] = len(self._in_flight)
+        stats["waiting"] = len(self._waiting)
+        stats["avg_latency_secs"] = stats["total_latency_secs"] / stats["acked"] if stats["acked"] else 0.0
+        return stats
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _on_state_changed(self, state: str, detail: str):
+        if state == ConnectionState.CONNECTED:
+            self._commands.put(self._PUMP)
+
+    def _on_publish_done(self, item: PendingPublish, future):
+        try:
+            future.result()
+            error = ""
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        self._commands.put(("done", item, error))
+
+    def _run(self):
+        try:
+            conn = open_database(self.db_path, self.pragmas)
+        except Exception as e:
+            self._log(f"Publish engine could not open database: {e}", logging.ERROR)
+            return
+        try:
+            self._restore_outbox(conn)
+            while True:
+                commands = [self._commands.get()]
+                # Handle everything already queued in one transaction
+                while len(commands) < 500:
+                    try:
+                        commands.append(self._commands.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = any(command is self._STOP for command in commands)
+                completed = self._handle_commands(conn, [
+                    command for command in commands if command is not self._STOP and command is not self._PUMP
+                ])
+                for args in completed:
+                    if self.on_complete:
+                        try:
+                            self.on_complete(*args)
+                        except Exception:
+                            logger.exception("Publish completion callback failed")
+                if stopping:
+                    break
+                self._pump()
+        finally:
+            conn.close()
+
+    def _restore_outbox(self, conn):
+        rows = conn.execute("SELECT id, topic, payload, qos FROM outbox ORDER BY id").fetchall()
+        for outbox_id, topic, payload, qos in rows:
+            self._waiting.append(PendingPublish(next(self._ids), topic, payload, qos, outbox_id))
+        if rows:
+            with self._stats_lock:
+                self._stats["restored_from_outbox"] += len(rows)
+            self._log(f"{len(rows)} unacknowledged publish(es) restored from outbox")
+
+    def _handle_commands(self, conn, commands: list) -> list:
+        """
+        Apply publish/done commands to the outbox in one transaction with a savepoint per command,
+        so a failing command is rolled back alone. Queues and stats change only after the
+        commit; commands whose writes did not survive are reported through _command_failed.
+        Returns the on_complete argument tuples.
+        """
+        if not commands:
+            return []
+        staged = []  # (command, result of _write) awaiting the commit
+        failures = []  # (command, exception)
+        try:
+            conn.execute("BEGIN")
+            for command in commands:
+                try:
+                    conn.execute("SAVEPOINT outbox_command")
+                    result = self._write(conn, command)
+                    conn.execute("RELEASE outbox_command")
+                    staged.append((command, result))
+                except Exception as e:
+                    failures.append((command, e))
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK TO outbox_command")
+                        conn.execute("RELEASE outbox_command")
+                    else:
+                        # SQLite rolled back the whole transaction (e.g. disk full)
+                        failures.extend((c, e) for c, _ in staged)
+                        staged = []
+                        conn.execute("BEGIN")
+            conn.commit()
+        except Exception as e:
+            self._log(f"Publish outbox error: {e}", logging.ERROR)
+            if conn.in_transaction:
+                conn.rollback()
+            handled = {id(command) for command, _ in failures}
+            failures.extend((c, e) for c in commands if id(c) not in handled)
+            staged = []
+        completed = []
+        for command, result in staged:
+            completed.append(self._apply(command, result))
+        for command, error in failures:
+            completed.append(self._command_failed(command, error))
+        return [args for args in completed if args]
+
+    def _write(self, conn, command):
+        """Outbox SQL for one command; returns what _apply needs once it is committed."""
+        if command[0] == "publish":
+            item = command[1]
+            cursor = conn.execute(
+                "INSERT INTO outbox (topic, payload, qos, created_at) VALUES (?, ?, ?, ?)",
+                (item.topic, item.payload, item.qos, time.time()),
+            )
+            return cursor.lastrowid
+        item, error = command[1], command[2]
+        outcome = self._done_outcome(item, error)
+        if outcome != "retry":
+            conn.execute("DELETE FROM outbox WHERE id = ?", (item.outbox_id,))
+        return outcome
+
+    def _done_outcome(self, item: PendingPublish, error: str) -> str:
+        if not error:
+            return "acked"
+        if self.manager.state != ConnectionState.CONNECTED or item.attempts < self.max_attempts:
+            # Link dropped (or transient failure): keep it in the outbox and send again later
+            return "retry"
+        return "failed"
+
+    def _apply(self, command, result) -> Optional[tuple]:
+        item = command[1]
+        if command[0] == "publish":
+            item.outbox_id = result
+            self._waiting.append(item)
+            return None
+        return self._finish(item, command[2], result)
+
+    def _finish(self, item: PendingPublish, error: str, outcome: str) -> Optional[tuple]:
+        self._in_flight.pop(item.publish_id, None)
+        latency = time.perf_counter() - item.sent_at
+        if outcome == "retry":
+            self._waiting.appendleft(item)
+            with self._stats_lock:
+                self._stats["retried"] += 1
+            return None
+        with self._stats_lock:
+            s = self._stats
+            if outcome == "acked":
+                s["acked"] += 1
+                s["total_latency_secs"] += latency
+                s["max_latency_secs"] = max(s["max_latency_secs"], latency)
+            else:
+                s["failed"] += 1
+        return (item.publish_id, item.topic, item.payload, error, latency)
+
+    def _command_failed(self, command, error: Exception) -> Optional[tuple]:
+        item = command[1]
+        if command[0] == "publish":
+            # Never stored, so never sent: report it instead of dropping it silently
+            self._log(f"Publish to '{item.topic}' could not be stored in the outbox: {error}", logging.ERROR)
+            with self._stats_lock:
+                self._stats["failed"] += 1
+            return (item.publish_id, item.topic, item.payload, f"Outbox error: {error}", 0.0)
+        # The PUBACK (or final failure) already happened; only the outbox row is left behind,
+        # so that publish is sent again after a restart
+        self._log(f"Publish #{item.publish_id} could not be removed from the outbox: {error}", logging.ERROR)
+        return self._finish(item, command[2], self._done_outcome(item, command[2]))
+
+    def _pump(self):
+        """Send waiting publishes while connected and the in-flight window has room."""
+        connection = self.manager.connection
+        if connection is None or self.manager.state != ConnectionState.CONNECTED:
+            return
+        while self._waiting and len(self._in_flight) < self.max_in_flight:
+            item = self._waiting.popleft()
+            item.attempts += 1
+            item.sent_at = time.perf_counter()
+            try:
+                # Publish (returns tuple: (future, packet_id))
+                publish_future, packet_id = connection.publish(
+                    topic=item.topic, payload=item.payload, qos=mqtt.QoS(item.qos)
+                )
+            except Exception as e:
+                self._waiting.appendleft(item)
+                self._log(f"Publish to '{item.topic}' could not be sent: {e}", logging.ERROR)
+                return
+            self._in_flight[item.publish_id] = item
+            publish_future.add_done_callback(functools.partial(self._on_publish_done, item))
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies in microseconds: constant memory, about 1.5%
+    relative precision (64 sub-buckets per power of two). Safe to record from several threads.
+    """
+    SUB_BUCKET_BITS = 6
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._buckets = collections.Counter()
+            self.count = 0
+            self.total_us = 0
+            self.min_us = 0
+            self.max_us = 0
+
+    def _bucket(self, value_us: int) -> int:
+        shift = value_us.bit_length() - 1 - self.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value_us
+        return (value_us >> shift) << shift
+
+    def record(self, latency_secs: float):
+        value_us = max(1, int(latency_secs * 1_000_000))
+        bucket = self._bucket(value_us)
+        with self._lock:
+            self._buckets[bucket] += 1
+            self.min_us = value_us if not self.count else min(self.min_us, value_us)
+            self.max_us = max(self.max_us, value_us)
+            self.count += 1
+            self.total_us += value_us
+
+    def percentile(self, percent: float) -> int:
+        """Latency (microseconds) at or below which `percent` of the recorded values fall."""
+        with self._lock:
+            if not self.count:
+                return 0
+            target = max(1, int(round(self.count * percent / 100.0)))
+            seen = 0
+            for bucket in sorted(self._buckets):
+                seen += self._buckets[bucket]
+                if seen >= target:
+                    return min(bucket, self.max_us)
+            return self.max_us
+
+    def buckets(self) -> list:
+        """(bucket lower bound in microseconds, count) pairs in ascending order."""
+        with self._lock:
+            return sorted(self._buckets.items())
+
+    def summary(self) -> dict:
+        """count plus min/mean/p50/p90/p99/max in milliseconds."""
+        return {
+            "count": self.count,
+            "min_ms": self.min_us / 1000.0,
+            "mean_ms": (self.total_us / self.count / 1000.0) if self.count else 0.0,
+            "p50_ms": self.percentile(50) / 1000.0,
+            "p90_ms": self.percentile(90) / 1000.0,
+            "p99_ms": self.percentile(99) / 1000.0,
+            "max_ms": self.max_us / 1000.0,
+        }
+
+
+DEFAULT_LOAD_TEMPLATE = '{"seq": {seq}, "ts": "{ts}", "temperature": {rand:20:30}, "topic": "{topic}"}'
+
+# {seq}, {ts}, {epoch_ms}, {topic}, {rand}, {rand:LO:HI}, {randint:LO:HI}; other braces are left alone (JSON)
+_LOAD_PLACEHOLDER = re.compile(r"\{(seq|ts|epoch_ms|topic|rand|randint)(?::(-?[\d.]+):(-?[\d.]+))?\}")
+
+
+def render_load_payload(template: str, seq: int, topic: str) -> str:
+    """Fill the load-test placeholders in a payload template for message number `seq`."""
+    def replace(match):
+        name, low, high = match.groups()
+        if name == "seq":
+            return str(seq)
+        if name == "ts":
+            now = time.time()
+            return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+        if name == "epoch_ms":
+            return str(int(time.time() * 1000))
+        if name == "topic":
+            return topic
+        if name == "randint":
+            return str(random.randint(int(float(low or 0)), int(float(high or 100))))
+        return f"{random.uniform(float(low or 0), float(high or 1)):.4f}"
+    return _LOAD_PLACEHOLDER.sub(replace, template)
+
+
+def load_test_topics(prefix: str, count: int) -> list:
+    return [f"{prefix}/{i}" for i in range(max(1, count))]
+
+
+class LoadGenerator:
+    """
+    Publishes templated payloads for throughput testing, round-robin across `topics`, either at
+    `rate` messages/s or as fast as the in-flight window allows (rate <= 0). Stops after `count`
+    messages and/or `duration_secs`, or on stop(). Load messages go straight to the connection
+    (not through the PublishEngine outbox) so nothing is persisted or replayed after the test.
+    on_finished(report) is called on the generator thread.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        topics,
+        payload_template: str,
+        rate: float = 0.0,
+        count: Optional[int] = None,
+        duration_secs: Optional[float] = None,
+        qos: int = 1,
+        max_in_flight: int = 100,
+        on_finished=None,
+        on_log=None,
+    ):
+        self.manager = manager
+        self.topics = list(topics) or ["loadtest"]
+        self.payload_template = payload_template
+        self.rate = float(rate or 0.0)
+        self.count = count or None
+        self.duration_secs = duration_secs or None
+        self.qos = int(qos)
+        self.max_in_flight = max(1, max_in_flight)
+        self.on_finished = on_finished
+        self.on_log = on_log
+        self.latency = LatencyHistogram()
+        self._window = threading.BoundedSemaphore(self.max_in_flight)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._errors = collections.Counter()
+        self._sent = 0
+        self._acked = 0
+        self._failed = 0
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="LoadGenerator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread:
+            self._thread.join(timeout)
+        return not self.is_running()
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def get_report(self) -> dict:
+        with self._lock:
+            sent, acked, failed = self._sent, self._acked, self._failed
+            errors = dict(self._errors)
+        end = self._finished_at or time.perf_counter()
+        elapsed = (end - self._started_at) if self._started_at else 0.0
+        return {
+            "topics": len(self.topics),
+            "target_rate": self.rate,
+            "qos": self.qos,
+            "sent": sent,
+            "acked": acked,
+            "failed": failed,
+            "in_flight": sent - acked - failed,
+            "elapsed_secs": elapsed,
+            "achieved_rate": acked / elapsed if elapsed > 0 else 0.0,
+            "puback_latency": self.latency.summary(),
+            "errors": errors,
+        }
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _record_error(self, error: str):
+        with self._lock:
+            self._failed += 1
+            self._errors[error] += 1
+
+    def _on_publish_done(self, sent_at: float, future):
+        latency = time.perf_counter() - sent_at
+        try:
+            future.result()
+        except Exception as e:
+            self._record_error(type(e).__name__)
+        else:
+            self.latency.record(latency)
+            with self._lock:
+                self._acked += 1
+        finally:
+            self._window.release()
+
+    def _should_continue(self, seq: int) -> bool:
+        if self._stop_event.is_set():
+            return False
+        if self.count is not None and seq >= self.count:
+            return False
+        if self.duration_secs is not None and time.perf_counter() - self._started_at >= self.duration_secs:
+            return False
+        return True
+
+    def _run(self):
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+        self._log(
+            f"Load test started: {len(self.topics)} topic(s), "
+            f"{'max rate' if self.rate <= 0 else f'{self.rate:g} msg/s'}, QoS {self.qos}"
+        )
+        qos = mqtt.QoS(self.qos)
+        seq = 0
+        while self._should_continue(seq):
+            connection = self.manager.connection
+            if connection is None or self.manager.state != ConnectionState.CONNECTED:
+                # Pause while the link is down instead of counting every attempt as an error
+                self._stop_event.wait(0.1)
+                continue
+            if not self._window.acquire(timeout=0.5):
+                continue
+            if self.rate > 0:
+                delay = self._started_at + seq / self.rate - time.perf_counter()
+                if delay > 0 and self._stop_event.wait(delay):
+                    self._window.release()
+                    break
+            topic = self.topics[seq % len(self.topics)]
+            payload = render_load_payload(self.payload_template, seq, topic)
+            sent_at = time.perf_counter()
+            try:
+                publish_future, packet_id = connection.publish(topic=topic, payload=payload, qos=qos)
+            except Exception as e:
+                self._window.release()
+                with self._lock:
+                    self._sent += 1
+                self._record_error(type(e).__name__)
+                seq += 1
+                continue
+            with self._lock:
+                self._sent += 1
+            seq += 1
+            # QoS 1 completes on PUBACK; QoS 0 as soon as the packet is written
+            publish_future.add_done_callback(functools.partial(self._on_publish_done, sent_at))
+        # Let outstanding publishes complete so the latency figures cover everything sent
+        drain_deadline = time.monotonic() + 10.0
+        while self.get_report()["in_flight"] > 0 and time.monotonic() < drain_deadline:
+            time.sleep(0.05)
+        self._finished_at = time.perf_counter()
+        report = self.get_report()
+        self._log(format_load_report(report))
+        if self.on_finished:
+            try:
+                self.on_finished(report)
+            except Exception:
+                logger.exception("Load test completion callback failed")
+
+
+def format_load_report(report: dict) -> str:
+    latency = report["puback_latency"]
+    errors = ", ".join(f"{name} x{n}" for name, n in report["errors"].items()) or "none"
+    return (
+        f"Load test: {report['acked']}/{report['sent']} acked in {report['elapsed_secs']:.1f}s "
+        f"({report['achieved_rate']:.1f} msg/s), failed {report['failed']}; "
+        f"PUBACK p50 {latency['p50_ms']:.1f} ms, p90 {latency['p90_ms']:.1f} ms, "
+        f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms; errors: {errors}"
+    )
+
+
+class LatencyProbe:
+    """
+    End-to-end round-trip probe. Publishes sequence-numbered, timestamped messages to `topic`
+    (which the app is also subscribed to) every `interval_secs`, matches them as they come back
+    through the subscribe callback (on_message) and records publish-to-receive latency in a
+    LatencyHistogram. Messages not back within `loss_timeout_secs` count as lost (and as late if
+    they turn up afterwards); arrivals with a lower sequence number than one already seen count
+    as reordered. on_finished(report) is called on the probe thread.
+    """
+    MAX_SAMPLES = 100000
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        topic: str,
+        interval_secs: float = 1.0,
+        count: Optional[int] = None,
+        qos: int = 1,
+        loss_timeout_secs: float = 5.0,
+        on_finished=None,
+        on_log=None,
+    ):
+        self.manager = manager
+        self.topic = topic
+        self.interval_secs = max(0.001, float(interval_secs))
+        self.count = count or None
+        self.qos = int(qos)
+        self.loss_timeout_secs = loss_timeout_secs
+        self.on_finished = on_finished
+        self.on_log = on_log
+        self.run_id = f"{os.getpid():x}-{int(time.time() * 1000):x}"
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pending = {}  # seq -> (perf_counter_ns at publish, wall-clock send time)
+        self._expired = {}  # seq -> wall-clock send time, for messages already counted lost
+        self._samples = collections.deque(maxlen=self.MAX_SAMPLES)
+        self._highest_seq = -1
+        self._counts = collections.Counter()
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="LatencyProbe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread:
+            self._thread.join(timeout)
+        return not self.is_running()
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def on_message(self, topic: str, payload) -> bool:
+        """Subscribe-callback hook. Returns True if the message was one of this probe's own."""
+        received_ns = time.perf_counter_ns()
+        if topic != self.topic:
+            return False
+        try:
+            message = json.loads(payload)
+            if message.get("probe") != self.run_id:
+                return False
+            seq = int(message["seq"])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return False
+        with self._lock:
+            counts = self._counts
+            sent = self._pending.pop(seq, None)
+            if sent is not None:
+                status = "ok"
+            elif seq in self._expired:
+                # Counted lost at the timeout, but it did arrive
+                sent = (None, self._expired.pop(seq))
+                status = "late"
+                counts["lost"] -= 1
+                counts["late"] += 1
+            else:
+                counts["duplicates"] += 1
+                return True
+            if seq < self._highest_seq:
+                counts["reordered"] += 1
+                if status == "ok":
+                    status = "reordered"
+            self._highest_seq = max(self._highest_seq, seq)
+            counts["received"] += 1
+            sent_ns, sent_wall = sent
+            latency_us = (received_ns - sent_ns) // 1000 if sent_ns is not None else None
+            self._samples.append((seq, sent_wall, latency_us, status))
+        if latency_us is not None:
+            self.latency.record(latency_us / 1_000_000)
+        return True
+
+    def get_report(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            waiting = len(self._pending)
+        sent = counts.get("sent", 0)
+        lost = counts.get("lost", 0)
+        end = self._finished_at or time.perf_counter()
+        return {
+            "topic": self.topic,
+            "run_id": self.run_id,
+            "interval_secs": self.interval_secs,
+            "qos": self.qos,
+            "elapsed_secs": (end - self._started_at) if self._started_at else 0.0,
+            "sent": sent,
+            "received": counts.get("received", 0),
+            "waiting": waiting,
+            "lost": lost,
+            "loss_percent": 100.0 * lost / sent if sent else 0.0,
+            "late": counts.get("late", 0),
+            "reordered": counts.get("reordered", 0),
+            "duplicates": counts.get("duplicates", 0),
+            "publish_errors": counts.get("publish_errors", 0),
+            "latency": self.latency.summary(),
+        }
+
+    def export_json(self, path):
+        """Write the report plus the latency histogram buckets as JSON."""
+        report = self.get_report()
+        report["histogram_us"] = [{"from_us": lower, "count": n} for lower, n in self.latency.buckets()]
+        Path(path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    def export_csv(self, path):
+        """Write one row per probe message (seq, send time, latency, status) as CSV."""
+        with self._lock:
+            samples = list(self._samples)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seq", "sent_at", "latency_ms", "status"])
+            for seq, sent_wall, latency_us, status in samples:
+                writer.writerow([
+                    seq,
+                    datetime.fromtimestamp(sent_wall).isoformat(timespec="milliseconds"),
+                    "" if latency_us is None else f"{latency_us / 1000:.3f}",
+                    status,
+                ])
+
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+
+    def _expire(self, now_ns: int):
+        cutoff = now_ns - int(self.loss_timeout_secs * 1_000_000_000)
+        with self._lock:
+            for seq in [seq for seq, (sent_ns, _) in self._pending.items() if sent_ns < cutoff]:
+                sent_wall = self._pending.pop(seq)[1]
+                self._expired[seq] = sent_wall
+                self._counts["lost"] += 1
+                self._samples.append((seq, sent_wall, None, "lost"))
+
+    def _run(self):
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+        self._log(f"Latency probe started on '{self.topic}' (every {self.interval_secs:g} s)")
+        qos = mqtt.QoS(self.qos)
+        seq = 0
+        next_send = time.perf_counter()
+        while not self._stop_event.is_set() and (self.count is None or seq < self.count):
+            delay = next_send - time.perf_counter()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            next_send += self.interval_secs
+            self._expire(time.perf_counter_ns())
+            connection = self.manager.connection
+            if connection is None or self.manager.state != ConnectionState.CONNECTED:
+                continue
+            sent_wall = time.time()
+            payload = json.dumps({"probe": self.run_id, "seq": seq, "sent_at": sent_wall})
+            with self._lock:
+                self._pending[seq] = (time.perf_counter_ns(), sent_wall)
+                self._counts["sent"] += 1
+            try:
+                connection.publish(topic=self.topic, payload=payload, qos=qos)
+            except Exception as e:
+                with self._lock:
+                    self._pending.pop(seq, None)
+                    self._counts["sent"] -= 1
+                    self._counts["publish_errors"] += 1
+                self._log(f"Latency probe publish failed: {e}", logging.ERROR)
+            seq += 1
+        # Give the last messages until the loss timeout to come back
+        deadline = time.perf_counter() + self.loss_timeout_secs
+        while self._pending and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        self._expire(time.perf_counter_ns() + int(self.loss_timeout_secs * 1_000_000_000))
+        self._finished_at = time.perf_counter()
+        report = self.get_report()
+        self._log(format_probe_report(report))
+        if self.on_finished:
+            try:
+                self.on_finished(report)
+            except Exception:
+                logger.exception("Latency probe completion callback failed")
+
+
+def format_probe_report(report: dict) -> str:
+    latency = report["latency"]
+    return (
+        f"Latency probe: {report['received']}/{report['sent']} received, "
+        f"lost {report['lost']} ({report['loss_percent']:.1f}%), late {report['late']}, "
+        f"reordered {report['reordered']}, duplicates {report['duplicates']}; "
+        f"RTT p50 {latency['p50_ms']:.1f} ms, p90 {latency['p90_ms']:.1f} ms, "
+        f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms"
+    )
+
+
+def run_load_test_cli(argv) -> int:
+    """Headless load test (no window): python iot_pubsub_gui.py --load-test [options]"""
+    parser = argparse.ArgumentParser(
+        prog="iot_pubsub_gui.py --load-test",
+        description="Publish load test against AWS IoT Core; prints a JSON report.",
+    )
+    parser.add_argument("--load-test", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--topic-prefix", default=f"devices/{IOT_THING_NAME}/loadtest")
+    parser.add_argument("--topics", type=int, default=1, help="number of topics (prefix/0..N-1)")
+    parser.add_argument("--rate", type=float, default=0.0, help="target msg/s (0 = as fast as possible)")
+    parser.add_argument("--count", type=int, default=1000, help="messages to send (0 = no limit)")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds to run (0 = no limit)")
+    parser.add_argument("--in-flight", type=int, default=100, help="max publishes awaiting PUBACK")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=1)
+    parser.add_argument("--payload", default=DEFAULT_LOAD_TEMPLATE, help="payload template")
+    parser.add_argument("--client-id", default=IOT_CLIENT_ID,
+                        help="MQTT client ID (disconnects any GUI session using the same ID)")
+    parser.add_argument("--report", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+    if not args.count and not args.duration:
+        parser.error("--count 0 needs a --duration")
+
+    script_dir = Path(__file__).parent.absolute()
+    manager = ConnectionManager(
+        IOT_ENDPOINT,
+        args.client_id,
+        str(script_dir / IOT_CERT_FILE),
+        str(script_dir / IOT_KEY_FILE),
+        str(script_dir / IOT_CA_FILE),
+    )
+    settled = threading.Event()
+    manager.add_state_listener(
+        lambda state, detail: settled.set()
+        if state in (ConnectionState.CONNECTED, ConnectionState.DISCONNECTED) else None
+    )
+    manager.connect()
+    settled.wait(manager.connect_timeout_secs + 5)
+    if manager.state != ConnectionState.CONNECTED:
+        logger.error(f"Load test aborted: could not connect ({manager.last_error or manager.state})")
+        manager.abandon("load test aborted")
+        return 1
+
+    generator = LoadGenerator(
+        manager,
+        load_test_topics(args.topic_prefix.rstrip("/"), args.topics),
+        args.payload,
+        rate=args.rate,
+        count=args.count,
+        duration_secs=args.duration,
+        qos=args.qos,
+        max_in_flight=args.in_flight,
+    )
+    generator.start()
+    try:
+        while not generator.wait(1.0):
+            progress = generator.get_report()
+            print(
+                f"sent {progress['sent']} acked {progress['acked']} failed {progress['failed']} "
+                f"({progress['achieved_rate']:.1f} msg/s)",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        generator.stop()
+        generator.wait()
+
+    report = generator.get_report()
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if args.report:
+        Path(args.report).write_text(report_json + "\n", encoding="utf-8")
+    if manager.disconnect():
+        manager.wait_until_disconnected(3.0)
+    return 0 if report["failed"] == 0 else 2
+
+
+# In-app / daemon updates: releases are Release/<version> branches of the repository
+UPDATE_BRANCHES_URL = "https://api.github.com/repos/thienanlktl/Pideployment/branches"
+# Files replaced by an update (nothing else in the install directory is touched)
+UPDATE_FILES = ("iot_pubsub_gui.py", "iot_engine.py", "VERSION")
+
+
+def compare_versions(v1: str, v2: str) -> int:
+    """Compare two version strings. Returns -1 if v1 < v2, 0 if equal, 1 if v1 > v2"""
+    try:
+        # Split version strings into parts
+        parts1 = [int(x) for x in v1.split('.')]
+        parts2 = [int(x) for x in v2.split('.')]
+        
+        # Pad with zeros to make same length
+        max_len = max(len(parts1), len(parts2))
+        parts1.extend([0] * (max_len - len(parts1)))
+        parts2.extend([0] * (max_len - len(parts2)))
+        
+        # Compare
+        for p1, p2 in zip(parts1, parts2):
+            if p1 < p2:
+                return -1
+            elif p1 > p2:
+                return 1
+        return 0
+    except Exception:
+        # If version comparison fails, do string comparison
+        if v1 < v2:
+            return -1
+        elif v1 > v2:
+            return 1
+        return 0
+
+
+def find_latest_release_version(timeout: float = 10) -> Optional[str]:
+    """Newest version among the Release/* branches on GitHub, or None if there are none. Raises on errors."""
+    if not REQUESTS_AVAILABLE:
+        raise RuntimeError("requests library not installed")
+    import requests
+    # Get all branches from GitHub
+    response = requests.get(UPDATE_BRANCHES_URL, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"GitHub API returned status {response.status_code}")
+    branches_data = response.json()
+    logger.info(f"Found {len(branches_data)} branches")
+    
+    # Filter Release/* branches and extract versions
+    release_versions = []
+    for branch in branches_data:
+        branch_name = branch.get('name', '')
+        if branch_name.startswith('Release/'):
+            # Extract version from branch name (Release/1.0.2 -> 1.0.2)
+            version_str = branch_name.replace('Release/', '').strip()
+            if version_str:
+                release_versions.append(version_str)
+                logger.info(f"Found Release branch: {branch_name} (version: {version_str})")
+    if not release_versions:
+        return None
+    
+    # Find the latest version by comparing all release versions
+    latest_release_version = release_versions[0]
+    for version in release_versions:
+        if compare_versions(latest_release_version, version) < 0:
+            latest_release_version = version
+    return latest_release_version
+
+
+def get_git_env_with_ssh():
+    """
+    Find .ssh in the current user's home directory: home/{user}/.ssh (e.g. /home/pi/.ssh).
+    Use public/private key from that folder only; never from the iot pubsub app folder.
+    IOT_SSH_DIR overrides the path; else id_ed25519, id_rsa, id_ecdsa or any PRIVATE KEY file.
+    """
+    env = os.environ.copy()
+    # home/{user}/.ssh — current user's home directory (e.g. /home/pi/.ssh on Pi)
+    user_home = Path.home()
+    default_ssh = user_home / ".ssh"
+    ssh_dir = Path(os.environ["IOT_SSH_DIR"]).expanduser().resolve() if os.environ.get("IOT_SSH_DIR") else default_ssh
+    key_file = None
+    if os.environ.get("IOT_SSH_KEY"):
+        k = Path(os.environ["IOT_SSH_KEY"]).expanduser().resolve()
+        if k.is_file():
+            key_file = k
+    if not key_file and ssh_dir.is_dir():
+        for name in ("id_ed25519", "id_rsa", "id_ecdsa"):
+            p = ssh_dir / name
+            if p.is_file():
+                key_file = p
+                break
+        if not key_file:
+            for f in ssh_dir.iterdir():
+                if not f.is_file():
+                    continue
+                if f.suffix == ".pub" or f.name in ("config", "known_hosts", "authorized_keys"):
+                    continue
+                try:
+                    if "PRIVATE KEY" in f.read_text(encoding="utf-8", errors="ignore"):
+                        key_file = f
+                        break
+                except Exception:
+                    continue
+    if key_file:
+        key_path = str(key_file.resolve())
+        env["GIT_SSH_COMMAND"] = f"ssh -i '{key_path}' -o StrictHostKeyChecking=accept-new -o BatchMode=yes"
+        return env, key_path
+    return env, None
+
+
+def apply_release_update(
+    script_dir: str,
+    target_version: str,
+    on_status=None,
+    on_log=None,
+    cancel_event: Optional[threading.Event] = None,
+) -> tuple:
+    """
+    Fetch Release/<target_version> and update only the UPDATE_FILES (app modules and VERSION).
+    No clean, no remove, no reset, no branch change - only these files are replaced.
+    All other files (desktop launcher, install.sh, etc.) are left unchanged.
+    Uses SSH key from ~/.ssh. Blocking; call from a background thread.
+    on_status(text) gets one-line progress, on_log(text) details. Returns (success, message).
+    """
+    status = on_status or (lambda text: None)
+    log_line = on_log or (lambda text: None)
+    cancel_event = cancel_event or threading.Event()
+    try:
+        status("Checking repository...")
+        if cancel_event.is_set():
+            return False, "Update cancelled."
+
+        git_env, ssh_key_path = get_git_env_with_ssh()
+        if ssh_key_path:
+            log_line(f"Using SSH key from user home .ssh: {ssh_key_path}")
+
+        if not GITPYTHON_AVAILABLE:
+            log_line("ERROR: GitPython not installed.")
+            return False, "GitPython not installed. Run: pip install gitpython"
+
+        import git  # type: ignore[import-untyped]
+        try:
+            repo = git.Repo(script_dir)
+        except Exception as e:
+            log_line(f"ERROR: {e}")
+            return False, "Not a git repository or access denied."
+
+        if repo.bare:
+            log_line("ERROR: Repository is bare.")
+            return False, "Not a git repository (bare)."
+
+        file_list = ", ".join(UPDATE_FILES)
+        log_line(f"Repository OK. No clean/remove/reset - only {file_list} will be updated.")
+
+        # Use SSH remote so GIT_SSH_COMMAND (and SSH key) is used; avoid permission denied
+        try:
+            origin_url = repo.remotes.origin.url
+            if origin_url.startswith("https://github.com/"):
+                path = origin_url.replace("https://github.com/", "").strip("/").replace(".git", "")
+                ssh_url = f"git@github.com:{path}.git"
+                if ssh_url != origin_url:
+                    repo.remotes.origin.set_url(ssh_url)
+                    log_line(f"Using SSH remote for update: {ssh_url}")
+            elif origin_url.startswith("https://gitlab.com/"):
+                path = origin_url.replace("https://gitlab.com/", "").strip("/").replace(".git", "")
+                ssh_url = f"git@gitlab.com:{path}.git"
+                if ssh_url != origin_url:
+                    repo.remotes.origin.set_url(ssh_url)
+                    log_line(f"Using SSH remote for update: {ssh_url}")
+        except Exception as e:
+            log_line(f"Note: Could not switch to SSH remote: {e}")
+
+        release_branch = f"Release/{target_version}"
+        # Fetch only the release branch (faster than full fetch) with timeout
+        status("Fetching from remote...")
+        if cancel_event.is_set():
+            return False, "Update cancelled."
+        try:
+            # Fetch only latest commit (depth=1); use SSH key to avoid permission denied
+            subprocess.run(
+                ["git", "fetch", "origin", release_branch, "--depth=1"],
+                cwd=script_dir,
+                timeout=60,
+                capture_output=True,
+                check=True,
+                text=True,
+                env=git_env,
+            )
+            log_line("Fetch completed (latest only).")
+        except subprocess.TimeoutExpired:
+            log_line("ERROR (fetch): Timeout after 60 seconds.")
+            return False, "Fetch timed out. Check network and try again."
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or e.stdout or "").strip() or "Fetch failed."
+            log_line(f"ERROR (fetch): {err}")
+            if "permission denied" in err.lower() or "access denied" in err.lower() or "publickey" in err.lower():
+                log_line("Tip: Ensure SSH key is in ~/.ssh (id_ed25519 or id_rsa) and public key is added to GitHub/GitLab. Remote should use SSH URL (git@github.com:...).")
+            return False, f"Fetch failed: {err}"
+        except Exception as e:
+            logger.exception("Git fetch failed")
+            err = str(e).strip() or "Network or permission error."
+            log_line(f"ERROR (fetch): {err}")
+            return False, f"Fetch failed: {err}"
+
+        # Update only these files from the Release branch (no pull, no reset, no clean)
+        ref = f"origin/{release_branch}"
+        status("Updating application files...")
+        log_line(f"Checking out latest {file_list} only (no other changes).")
+        if cancel_event.is_set():
+            return False, "Update cancelled."
+        try:
+            subprocess.run(
+                ["git", "checkout", ref, "--", *UPDATE_FILES],
+                cwd=script_dir,
+                timeout=30,
+                capture_output=True,
+                check=True,
+                text=True,
+                env=git_env,
+            )
+            log_line(f"Updated {file_list} from release branch.")
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or e.stdout or "").strip() or str(e)
+            # If VERSION is missing on release branch, try only the .py files
+            if "VERSION" in err or "did not match any file" in err:
+                py_files = [name for name in UPDATE_FILES if name.endswith(".py")]
+                try:
+                    subprocess.run(
+                        ["git", "checkout", ref, "--", *py_files],
+                        cwd=script_dir,
+                        timeout=30,
+                        capture_output=True,
+                        check=True,
+                        text=True,
+                        env=git_env,
+                    )
+                    log_line(f"Updated {', '.join(py_files)} (VERSION not on release branch).")
+                except subprocess.CalledProcessError as e2:
+                    err2 = (e2.stderr or e2.stdout or "").strip() or str(e2)
+                    log_line(f"ERROR (checkout): {err2}")
+                    return False, f"Update failed: {err2}"
+            else:
+                log_line(f"ERROR (checkout): {err}")
+                return False, f"Update failed: {err}"
+        except subprocess.TimeoutExpired:
+            log_line("ERROR: Timeout updating files.")
+            return False, "Update timed out."
+        except Exception as e:
+            logger.exception("Checkout files failed")
+            log_line(f"ERROR: {e}")
+            return False, f"Update failed: {e}"
+
+        logger.info("In-app update completed successfully")
+        log_line("Update completed successfully.")
+        return True, "Update complete. Restart the application to apply changes."
+    except Exception as e:
+        logger.exception("Update failed")
+        err_msg = str(e).strip() or type(e).__name__
+        log_line(f"ERROR: {err_msg}")
+        for line in traceback.format_exc().splitlines()[-5:]:
+            if line.strip():
+                log_line(f"  {line.strip()}")
+        return False, f"Update failed: {err_msg}"
+
+
+class IoTEngine:
+    """
+    The app without a window: connection manager + reconnect supervisor, ingest pipeline,
+    batched SQLite writer and publish engine, wired together for one AWS IoT client.
+    Callbacks are plain callables invoked on worker/awscrt threads:
+    on_log(message), on_state_changed(state, detail) and
+    on_publish_complete(publish_id, topic, payload, error, latency_secs).
+    """
+
+    def __init__(
+        self,
+        script_dir=None,
+        client_id: str = IOT_CLIENT_ID,
+        db_path: Optional[str] = None,
+        on_log=None,
+        on_state_changed=None,
+        on_publish_complete=None,
+    ):
+        script_dir = Path(script_dir or Path(__file__).parent).absolute()
+        self.script_dir = script_dir
+        self.on_log = on_log
+        
+        # AWS IoT Configuration
+        self.endpoint = IOT_ENDPOINT
+        self.thing_name = IOT_THING_NAME
+        self.client_id = client_id
+        self.ca_path = str(script_dir / IOT_CA_FILE)
+        self.cert_path = str(script_dir / IOT_CERT_FILE)
+        self.key_path = str(script_dir / IOT_KEY_FILE)
+        
+        # SQLite Database (writes go through a batched background writer)
+        self.db_path = db_path or os.environ.get("IOT_DB_PATH") or str(script_dir / "iot_messages.db")
+        self.db_batch_size = 200
+        self.db_flush_interval_ms = 250
+        self.db_max_queue_size = 10000
+        self.db_pragmas = get_db_pragmas()
+        self.message_writer = None
+        # Optional per-day/per-hour shard files for messages (IOT_DB_SHARDS); the outbox stays in db_path
+        granularity = get_shard_granularity()
+        self.db_shards = None
+        if granularity:
+            shard_dir = os.environ.get("IOT_DB_SHARD_DIR") or str(Path(self.db_path).with_suffix("")) + "_shards"
+            self.db_shards = MessageShards(shard_dir, granularity, self.db_pragmas)
+        # Optional payload compression in the writer (IOT_DB_COMPRESSION); readers decode transparently
+        self.db_compression = get_compression_settings()
+        # Optional JSON fields extracted into the indexed message_fields table (IOT_DB_FIELDS)
+        self.db_fields = get_extracted_fields()
+        # Per-topic minute/hour rollups updated with every insert batch (IOT_DB_ROLLUPS=0 turns them off)
+        self.db_rollups, self.db_rollup_minute_days = get_rollup_settings()
+        # Full-text search index, built in the background (IOT_DB_FTS=0 turns it off)
+        self.search_indexer = None
+        if os.environ.get("IOT_DB_FTS", "1").strip().lower() not in ("0", "false", "no"):
+            self.search_indexer = SearchIndexer(self.db_path, self.db_shards, pragmas=self.db_pragmas, on_log=on_log)
+        
+        # Retention: chunked deletes + incremental vacuum in the background (IOT_RETENTION_* settings)
+        default_policy, topic_policies = get_retention_policies()
+        self.retention = RetentionManager(
+            self.db_path,
+            default_policy,
+            topic_policies,
+            pragmas=self.db_pragmas,
+            on_log=on_log,
+            shards=self.db_shards,
+        )
+        
+        # MQTT Connection (non-blocking; state changes arrive via on_state_changed)
+        self.connection_manager = ConnectionManager(
+            self.endpoint,
+            self.client_id,
+            self.cert_path,
+            self.key_path,
+            self.ca_path,
+            on_state_changed=on_state_changed,
+            on_log=on_log,
+        )
+        self.subscribed_topics = self.connection_manager.subscribed_topics
+        self.connection_manager.message_callback = self.on_mqtt_message
+        # Reconnect with capped exponential backoff + jitter if the link stays down
+        self.reconnect_supervisor = ReconnectSupervisor(self.connection_manager, on_log=on_log)
+        # Saved subscription sets and one-off filters, subscribed concurrently on every connect
+        self.subscriptions = SubscriptionManager(
+            self.connection_manager, self.db_path, pragmas=self.db_pragmas, on_log=on_log
+        )
+        # Hooks that see raw messages first (MQTT thread); returning True consumes the message
+        self.message_taps = []
+        
+        # Ingest pipeline: decode/parse/persist on a worker thread
+        self.ingest_pipeline = IngestPipeline(
+            persist=self.insert_message, on_error=on_log, router=self.subscribed_topics
+        )
+        # Live per-topic rates for the statistics panel, fed from the ingest worker
+        self.topic_activity = TopicActivity()
+        self.ingest_pipeline.add_listener(self.topic_activity.on_message)
+        # Numeric payload fields for the live chart (series exist only while a chart watches them)
+        self.field_series = FieldSeriesFeed()
+        self.ingest_pipeline.add_listener(self.field_series.on_message)
+        
+        # Publishing: in-flight window over the connection, unacknowledged publishes kept in the outbox
+        self.publish_max_in_flight = 10
+        self.publish_engine = PublishEngine(
+            self.connection_manager,
+            self.db_path,
+            pragmas=self.db_pragmas,
+            max_in_flight=self.publish_max_in_flight,
+            on_complete=on_publish_complete,
+            on_log=on_log,
+        )
+    
+    def _log(self, message: str, level: int = logging.INFO):
+        logger.log(level, message)
+        if self.on_log:
+            try:
+                self.on_log(message)
+            except Exception:
+                pass
+    
+    def start(self):
+        """Prepare the database and start the writer, ingest and publish workers"""
+        self.init_database()
+        self.load_subscription_sets()
+        self.start_message_writer()
+        self.ingest_pipeline.start()
+        self.publish_engine.start()
+        if self.retention.is_enabled():
+            self.retention.start()
+        if self.search_indexer:
+            self.search_indexer.start()
+    
+    def stop(self, disconnect_timeout: float = 3.0):
+        """Disconnect (waiting briefly for the DISCONNECT to go out) and stop all workers"""
+        self.reconnect_supervisor.stop()
+        if self.connection_manager.disconnect():
+            self.connection_manager.wait_until_disconnected(disconnect_timeout)
+        self.stop_workers()
+    
+    def stop_workers(self):
+        """Drain the ingest pipeline, then flush and stop the database writer"""
+        self.retention.stop()
+        if self.search_indexer:
+            self.search_indexer.stop()
+        self.publish_engine.stop()  # unacknowledged publishes stay in the outbox
+        self.ingest_pipeline.stop()
+        self.stop_message_writer()
+    
+    def init_database(self):
+        """Open the SQLite database (WAL + tuned pragmas) and apply pending schema migrations"""
+        try:
+            conn = open_database(self.db_path, self.db_pragmas)
+            try:
+                previous, current = migrate_database(conn)
+                journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            finally:
+                conn.close()
+            if previous != current:
+                self._log(f"Database schema migrated: version {previous} -> {current}")
+            self._log(f"SQLite database initialized: {self.db_path} (schema v{current}, {journal_mode})")
+            if self.db_shards is not None:
+                self._log(f"Messages stored in per-{self.db_shards.granularity} shards in {self.db_shards.directory}")
+        except Exception as e:
+            self._log(f"Error initializing database: {e}", logging.ERROR)
+    
+    def load_subscription_sets(self):
+        try:
+            self.subscriptions.load()
+        except Exception as e:
+            self._log(f"Error loading subscription sets: {e}", logging.ERROR)
+    
+    def start_message_writer(self):
+        """Start the background writer that batches message inserts on one connection"""
+        self.message_writer = MessageWriter(
+            self.db_path,
+            batch_size=self.db_batch_size,
+            flush_interval_ms=self.db_flush_interval_ms,
+            max_queue_size=self.db_max_queue_size,
+            pragmas=self.db_pragmas,
+            on_error=self.on_log,
+            shards=self.db_shards,
+            compressor=self.create_compressor(),
+            extractor=FieldExtractor(self.db_fields) if self.db_fields else None,
+            rollups=self.db_rollups,
+            rollup_minute_days=self.db_rollup_minute_days,
+        )
+        self.message_writer.start()
+    
+    def create_compressor(self) -> Optional[PayloadCompressor]:
+        codec, level, use_dictionaries = self.db_compression
+        if codec is None:
+            return None
+        return PayloadCompressor(codec, level, use_dictionaries)
+    
+    def stop_message_writer(self):
+        """Flush pending messages to the database and stop the writer thread"""
+        if self.message_writer:
+            self.message_writer.stop()
+            self.message_writer = None
+    
+    def insert_message(self, timestamp: str, topic: str, payload: str, ts_us: Optional[int] = None):
+        """Queue received message for the batched SQLite writer (non-blocking)"""
+        try:
+            if self.message_writer:
+                self.message_writer.submit(timestamp, topic, payload, ts_us)
+        except Exception as e:
+            self._log(f"Error inserting message to database: {e}", logging.ERROR)
+    
+    def on_mqtt_message(self, topic, payload, **kwargs):
+        """Callback on the MQTT thread: hand raw bytes to the ingest pipeline (never blocks)"""
+        for tap in tuple(self.message_taps):
+            if tap(topic, payload):
+                return
+        self.ingest_pipeline.submit(topic, payload)
+    
+    def connect(self) -> bool:
+        return self.connection_manager.connect()
+    
+    def disconnect(self) -> bool:
+        self.reconnect_supervisor.stop()
+        return self.connection_manager.disconnect()
+    
+    def subscribe(self, topic_filter: str, timeout: float = 5, handler=None) -> bool:
+        """
+        Subscribe one filter and wait for the SUBACK. Returns False if already subscribed.
+        handler(ReceivedMessage), if given, is called on the ingest worker for messages matching
+        this filter (overlapping filters each get their own call).
+        Use self.subscriptions directly to subscribe without blocking.
+        """
+        return self.subscriptions.subscribe(topic_filter, handler).result(timeout=timeout)
+    
+    def unsubscribe(self, topic_filter: str, timeout: float = 5):
+        self.subscriptions.unsubscribe(topic_filter).result(timeout=timeout)
+    
+    def publish(self, topic: str, payload: str, qos: int = 1) -> int:
+        """Queue a publish through the outbox (never blocks). Returns its publish id."""
+        return self.publish_engine.publish(topic, payload, qos)
+    
+    def get_stats(self) -> dict:
+        return {
+            "state": self.connection_manager.state,
+            "subscriptions": sorted(self.subscribed_topics),
+            "subscription_manager": self.subscriptions.get_stats(),
+            "ingest": self.ingest_pipeline.get_stats(),
+            "topic_activity": self.topic_activity.get_stats(),
+            "writer": self.message_writer.get_stats() if self.message_writer else None,
+            "publish": self.publish_engine.get_stats(),
+            "reconnect": self.reconnect_supervisor.get_stats(),
+            "retention": self.retention.get_stats() if self.retention.is_enabled() else None,
+            "search_index": self.search_indexer.get_stats() if self.search_indexer else None,
+        }
+
+
+def run_headless(argv) -> int:
+    """Daemon mode (no window, no PyQt6): python iot_pubsub_gui.py --headless [options]"""
+    parser = argparse.ArgumentParser(
+        prog="iot_pubsub_gui.py --headless",
+        description="Run the AWS IoT ingest engine without the GUI (e.g. as a systemd service).",
+    )
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--subscribe", action="append", metavar="FILTER",
+                        help="topic filter to subscribe to (repeatable; default: the saved subscription sets, "
+                             f"or devices/{IOT_THING_NAME}/# if there are none)")
+    parser.add_argument("--save-subscription-set", metavar="NAME",
+                        help="save the --subscribe filters as a named subscription set, then exit")
+    parser.add_argument("--delete-subscription-set", metavar="NAME",
+                        help="delete a saved subscription set, then exit")
+    parser.add_argument("--client-id", default=IOT_CLIENT_ID)
+    parser.add_argument("--db", help="SQLite database path (default: iot_messages.db next to the app)")
+    parser.add_argument("--stats-interval", type=float, default=300, help="seconds between stats log lines (0 = off)")
+    parser.add_argument("--log-messages", action="store_true", help="log every received message")
+    parser.add_argument("--update-check-hours", type=float, default=0,
+                        help="check for a newer Release/* version every N hours (0 = off)")
+    parser.add_argument("--auto-update", action="store_true",
+                        help="apply a newer release and exit so the service manager restarts the new version")
+    parser.add_argument("--retention-days", type=float, help="delete messages older than N days")
+    parser.add_argument("--retention-rows", type=int, help="keep at most N messages")
+    parser.add_argument("--retention-mb", type=float, help="keep the database under N MB")
+    parser.add_argument("--shards", choices=sorted(MessageShards.KEY_LENGTHS),
+                        help="store messages in per-day or per-hour files (same as IOT_DB_SHARDS)")
+    parser.add_argument("--compression", choices=sorted(PAYLOAD_CODECS),
+                        help="compress stored payloads (same as IOT_DB_COMPRESSION)")
+    parser.add_argument("--compression-report", action="store_true",
+                        help="print the compression ratio and decode cost of the newest 10000 messages, then exit")
+    parser.add_argument("--fields", metavar="PATHS",
+                        help="comma-separated JSON paths to extract and index (same as IOT_DB_FIELDS)")
+    parser.add_argument("--backfill-fields", action="store_true",
+                        help="extract the configured fields from already stored messages, then exit")
+    parser.add_argument("--compact-db", action="store_true",
+                        help="rebuild the database with incremental vacuum enabled, then exit")
+    args = parser.parse_args(argv)
+    filters = args.subscribe or []
+    for topic_filter in filters:
+        try:
+            validate_topic_filter(topic_filter)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.shards:
+        os.environ["IOT_DB_SHARDS"] = args.shards
+    if args.compression:
+        os.environ["IOT_DB_COMPRESSION"] = args.compression
+    if args.fields:
+        os.environ["IOT_DB_FIELDS"] = args.fields
+
+    engine = IoTEngine(client_id=args.client_id, db_path=args.db)
+    if args.compression_report:
+        engine.init_database()
+        print(json.dumps(_compression_report(engine), indent=2))
+        return 0
+    if args.backfill_fields:
+        if not engine.db_fields:
+            parser.error("--backfill-fields needs --fields or IOT_DB_FIELDS")
+        engine.init_database()
+        _backfill_fields(engine)
+        return 0
+    if args.compact_db:
+        engine.init_database()
+        before, after = compact_database(engine.db_path, engine.db_pragmas)
+        logger.info(f"Compacted {engine.db_path}: {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB")
+        return 0
+    if args.save_subscription_set or args.delete_subscription_set:
+        engine.init_database()
+        if args.save_subscription_set:
+            if not filters:
+                parser.error("--save-subscription-set needs at least one --subscribe filter")
+            try:
+                engine.subscriptions.save_set(args.save_subscription_set, filters)
+            except ValueError as e:
+                parser.error(str(e))
+            logger.info(f"Saved subscription set '{args.save_subscription_set}': {', '.join(filters)}")
+        else:
+            engine.subscriptions.delete_set(args.delete_subscription_set)
+            logger.info(f"Deleted subscription set '{args.delete_subscription_set}'")
+        return 0
+    policy = engine.retention.default_policy
+    if args.retention_days is not None:
+        policy.max_age_secs = args.retention_days * 86400 or None
+    if args.retention_rows is not None:
+        policy.max_rows = args.retention_rows or None
+    if args.retention_mb is not None:
+        policy.max_bytes = int(args.retention_mb * 1024 * 1024) or None
+    manager = engine.connection_manager
+    if args.log_messages:
+        engine.ingest_pipeline.add_listener(
+            lambda message: logger.info(f"Received on '{message.topic}': {message.payload}")
+        )
+
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    engine.start()
+    # Command-line filters join the saved sets for this run only
+    if filters or not any(enabled for _, enabled, _, _ in engine.subscriptions.sets()):
+        engine.subscriptions.save_set("command line", filters or [f"devices/{IOT_THING_NAME}/#"], persist=False)
+    set_names = [name for name, enabled, _, _ in engine.subscriptions.sets() if enabled]
+    logger.info(f"Headless mode v{__version__}: client {args.client_id}, subscription sets {', '.join(set_names)}")
+    connect_attempt = 0
+    next_connect_at = time.monotonic()
+    next_stats_at = time.monotonic() + args.stats_interval
+    next_update_check_at = time.monotonic() + 60 if args.update_check_hours > 0 else None
+    while not stop_event.is_set():
+        now = time.monotonic()
+        state = manager.state
+        if state == ConnectionState.CONNECTED:
+            connect_attempt = 0  # the subscription manager subscribes every set on connect
+        elif state == ConnectionState.DISCONNECTED and not engine.reconnect_supervisor.active:
+            # Initial connect (or a failed one): the supervisor only takes over once connected
+            if now >= next_connect_at:
+                connect_attempt += 1
+                engine.connect()
+                next_connect_at = now + engine.reconnect_supervisor.backoff_delay(connect_attempt)
+        if args.stats_interval > 0 and now >= next_stats_at:
+            next_stats_at = now + args.stats_interval
+            logger.info(f"Stats: {json.dumps(engine.get_stats(), default=str)}")
+        if next_update_check_at is not None and now >= next_update_check_at:
+            next_update_check_at = now + args.update_check_hours * 3600
+            if _headless_update(engine, args.auto_update):
+                break
+        stop_event.wait(1.0)
+
+    logger.info("Stopping headless engine...")
+    engine.stop()
+    logger.info("Headless engine stopped")
+    return 0
+
+
+def _compression_report(engine: IoTEngine, limit: int = 10000) -> dict:
+    """measure_compression over the newest messages (newest shard, or the main database)"""
+    conn = open_database(engine.db_path, engine.db_pragmas)
+    try:
+        decoder = PayloadDecoder(conn)
+        keys = engine.db_shards.keys() if engine.db_shards else []
+        if keys:
+            engine.db_shards.attach(conn, keys[-1], "shard")
+            return measure_compression(conn, limit, "shard", decoder)
+        return measure_compression(conn, limit, "main", decoder)
+    finally:
+        conn.close()
+
+
+def _backfill_fields(engine: IoTEngine):
+    """backfill_fields over the main database and every shard"""
+    extractor = FieldExtractor(engine.db_fields)
+    targets = [(engine.db_path, lambda: open_database(engine.db_path, engine.db_pragmas))]
+    if engine.db_shards:
+        targets += [(engine.db_shards.path(key), functools.partial(engine.db_shards.open, key))
+                    for key in engine.db_shards.keys()]
+    next_log = [time.monotonic() + 10]
+
+    def progress(last_id, added):
+        if time.monotonic() >= next_log[0]:
+            next_log[0] = time.monotonic() + 10
+            logger.info(f"{name}: up to message id {last_id}, {added} value(s) so far")
+
+    for name, connect in targets:
+        conn = connect()
+        try:
+            added = backfill_fields(conn, extractor, on_progress=progress)
+            logger.info(f"Backfilled {added} field value(s) in {name}")
+        finally:
+            conn.close()
+
+
+def _parse_time_arg(text: str) -> int:
+    """--since/--until value: ISO date/time ("2026-10-01", "2026-10-01 12:00") or an age ("90m", "24h", "7d")."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text.strip())
+    if match:
+        seconds = float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return epoch_us(time.time() - seconds)
+    ts_us = timestamp_to_epoch_us(text.strip())
+    if ts_us is None:
+        raise argparse.ArgumentTypeError(f"not a date/time or age: {text!r}")
+    return ts_us
+
+
+def run_export_cli(argv) -> int:
+    """Export stored messages without the GUI: python iot_pubsub_gui.py --export FILE [options]"""
+    parser = argparse.ArgumentParser(
+        prog="iot_pubsub_gui.py --export",
+        description="Stream stored messages to CSV, NDJSON (.gz for gzip), Parquet or Arrow.",
+    )
+    parser.add_argument("--export", required=True, metavar="FILE",
+                        help="output file; the format follows the extension unless --format is given")
+    parser.add_argument("--format", choices=EXPORT_FORMATS)
+    parser.add_argument("--db", help="SQLite database path (default: iot_messages.db next to the app)")
+    parser.add_argument("--since", type=_parse_time_arg, help='start time ("2026-10-01 12:00") or age ("24h", "7d")')
+    parser.add_argument("--until", type=_parse_time_arg, help="end time (exclusive), same forms as --since")
+    parser.add_argument("--topic", help="only this topic")
+    parser.add_argument("--where", type=FieldFilter.parse, metavar="CONDITION",
+                        help='extracted field condition, e.g. "temperature > 80" (see IOT_DB_FIELDS)')
+    args = parser.parse_args(argv)
+
+    engine = IoTEngine(db_path=args.db)
+    engine.init_database()
+    try:
+        exporter = MessageExporter(
+            engine.db_path, args.export, args.format, args.since, args.until, args.topic, args.where,
+            shards=engine.db_shards, pragmas=engine.db_pragmas,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    signal.signal(signal.SIGINT, lambda signum, frame: exporter.cancel())
+    thread = threading.Thread(target=exporter.run, name="MessageExporter", daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(10)
+        stats = exporter.get_stats()
+        if thread.is_alive() and stats["total"]:
+            logger.info(f"Exported {stats['rows']} of {stats['total']} messages")
+    stats = exporter.get_stats()
+    return 0 if stats["error"] is None and not stats["cancelled"] else 1
+
+
+def _headless_update(engine: IoTEngine, apply: bool) -> bool:
+    """Check for a newer release; with apply, install it. Returns True if the process should exit to restart."""
+    try:
+        latest = find_latest_release_version()
+    except Exception as e:
+        logger.warning(f"Update check failed: {e}")
+        return False
+    if not latest or compare_versions(__version__, latest) >= 0:
+        logger.info(f"Application is up to date (current: {__version__})")
+        return False
+    logger.info(f"Update available! Latest version: {latest}, Current version: {__version__}")
+    if not apply:
+        return False
+    success, message = apply_release_update(str(engine.script_dir), latest, on_status=logger.info, on_log=logger.info)
+    if not success:
+        logger.error(message)
+        return False
+    logger.info(f"Updated to {latest}; exiting so the service restarts the new version")
+    return True
+
+
+def main(argv=None) -> int:
+    """Entry point for the modes that run without PyQt6 (--headless, --load-test, --export)"""
+    argv = sys.argv[1:] if argv is None else argv
+    configure_logging()
+    if "--load-test" in argv:
+        return run_load_test_cli(argv)
+    if "--export" in argv:
+        return run_export_cli(argv)
+    return run_headless(argv)
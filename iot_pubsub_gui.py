@@ -9,6 +9,8 @@ Installation:
 
 Run:
     python iot_pubsub_gui.py
+    python iot_pubsub_gui.py --headless   # no window / no PyQt6 (see iot_engine.py)
+    python iot_pubsub_gui.py --export messages.csv   # stream stored messages to a file (no PyQt6)
 
 On Raspberry Pi: use install.sh for one-click setup, then run from menu or:
     cd ~/iot-pubsub-gui && venv/bin/python3 iot_pubsub_gui.py
@@ -16,17 +18,54 @@ On Raspberry Pi: use install.sh for one-click setup, then run from menu or:
 
 import sys
 import json
-import traceback
 import os
-import sqlite3
 import subprocess
 import logging
 import threading
 import time
+import importlib.util
+import html
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 
+_STARTUP_T0 = time.perf_counter()
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase (--startup-profile); printed once the window has painted"""
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.phases = []
+        self._last = _STARTUP_T0
+        self._reported = False
+
+    def mark(self, phase: str):
+        """End the phase that started at the previous mark (or at process start)."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000.0))
+        self._last = now
+
+    def report(self):
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        lines = ["Startup profile (ms):"]
+        lines += [f"  {phase:<18}{ms:9.1f}" for phase, ms in self.phases]
+        lines.append(f"  {'total':<18}{sum(ms for _, ms in self.phases):9.1f}")
+        print("\n".join(lines), flush=True)
+
+    def first_paint(self):
+        """Called from paintEvent: closes the last phase and prints the report (once)."""
+        if self.enabled and not self._reported:
+            self.mark("first paint")
+            self.report()
+
+
+startup_profile = StartupProfile("--startup-profile" in sys.argv)
+
 # Check for required dependencies before importing PyQt6
 # All packages from requirements.txt (import_name -> pip package name for messages)
 _REQUIRED_IMPORTS = {
@@ -40,8 +79,8 @@ _REQUIRED_IMPORTS = {
 }
 
 
-def check_dependencies():
-    """Check that we run with project venv and all required packages are installed."""
+def check_dependencies(skip=()):
+    """Check that we run with project venv and all required packages (except `skip`) are installed."""
     script_dir = Path(__file__).parent.absolute()
     venv_python_paths = [
         script_dir / "venv" / "bin" / "python3",
@@ -69,12 +108,16 @@ def check_dependencies():
         print("=" * 60)
         sys.exit(1)
 
-    # Check all packages from requirements.txt
+    # Check all packages from requirements.txt (located only; each is imported when first needed)
     missing_deps = []
     for module_name, package_name in _REQUIRED_IMPORTS.items():
+        if module_name in skip:
+            continue
         try:
-            __import__(module_name)
-        except ImportError:
+            found = importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
             missing_deps.append(package_name)
 
     if missing_deps:
@@ -94,64 +137,88 @@ def check_dependencies():
         sys.exit(1)
 
 
+def ensure_engine_module():
+    """
+    Restore iot_engine.py if missing: in-app updaters from versions before the engine was split
+    out only check out iot_pubsub_gui.py and VERSION, so fetch it from the same release branch.
+    """
+    script_dir = Path(__file__).parent.absolute()
+    if (script_dir / "iot_engine.py").exists():
+        return
+    try:
+        version = (script_dir / "VERSION").read_text().strip()
+        subprocess.run(
+            ["git", "checkout", f"origin/Release/{version}", "--", "iot_engine.py"],
+            cwd=str(script_dir),
+            timeout=30,
+            capture_output=True,
+            check=True,
+        )
+    except Exception as e:
+        print(f"ERROR: iot_engine.py is missing and could not be restored from git: {e}")
+        print("Update the installation manually (git pull) and restart.")
+        sys.exit(1)
+
+
+# Headless daemon and command-line modes run the engine only; PyQt6 is never imported
+if __name__ == "__main__" and ("--headless" in sys.argv or "--load-test" in sys.argv or "--export" in sys.argv):
+    check_dependencies(skip=("PyQt6",))
+    ensure_engine_module()
+    import iot_engine
+    sys.exit(iot_engine.main(sys.argv[1:]))
+
 # Check dependencies before proceeding
 check_dependencies()
+ensure_engine_module()
+startup_profile.mark("dependency check")
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QTextEdit, QPushButton, QGroupBox, QMessageBox,
     QDialog, QTableWidget, QTableWidgetItem, QHeaderView, QProgressBar,
-    QFrame, QScrollArea, QSizePolicy
+    QFrame, QScrollArea, QSizePolicy, QListView, QAbstractItemView, QTableView,
+    QSpinBox, QDoubleSpinBox, QFormLayout, QFileDialog, QComboBox, QStyledItemDelegate, QStyle,
+    QProgressDialog, QTreeWidget, QTreeWidgetItem, QListWidget, QListWidgetItem, QPlainTextEdit, QCheckBox
+)
+from PyQt6.QtCore import (
+    Qt, QObject, pyqtSignal, QThread, QTimer, QEvent,
+    QAbstractListModel, QAbstractTableModel, QModelIndex, QRectF, QPointF
 )
-from PyQt6.QtCore import Qt, QObject, pyqtSignal, QMetaObject, Q_ARG, QThread, QTimer, QEvent
-from PyQt6.QtGui import QTextCursor, QColor, QKeyEvent
+from PyQt6.QtGui import QColor, QKeyEvent, QTextDocument, QPainter, QPen, QPolygonF
 
 from awscrt import mqtt
-from awsiot import mqtt_connection_builder
-
-# Try to import requests for update check
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError:
-    REQUESTS_AVAILABLE = False
-
-# Try to import GitPython for in-app git updates
-try:
-    import git  # type: ignore[import-untyped]
-    GITPYTHON_AVAILABLE = True
-except ImportError:
-    GITPYTHON_AVAILABLE = False
-
-# Version information
-__version__ = "1.0.0"
-VERSION_FILE = Path(__file__).parent / "VERSION"
-
-# Try to read version from VERSION file if it exists
-if VERSION_FILE.exists():
-    try:
-        with open(VERSION_FILE, 'r') as f:
-            version_from_file = f.read().strip()
-            if version_from_file:
-                __version__ = version_from_file
-    except Exception:
-        pass
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Path(__file__).parent / "iot_pubsub_gui.log"),
-        logging.StreamHandler()
-    ]
+from iot_engine import (
+    __version__, GITPYTHON_AVAILABLE, REQUESTS_AVAILABLE, configure_logging,
+    open_database, fetch_messages_page, count_messages_in_range, list_topics,
+    format_payload, format_epoch_us, epoch_us, MessageShards, PayloadDecoder,
+    FieldFilter, list_fields, topic_summary, field_summary,
+    MessageExporter, export_format_for, PYARROW_AVAILABLE,
+    fts_query, search_terms_pattern, search_messages_page, count_search_matches, search_index_backlog,
+    ConnectionState, ConnectionManager, IoTEngine, SubscriptionState,
+    TopicActivity, decimate_minmax, NUMPY_AVAILABLE,
+    DEFAULT_LOAD_TEMPLATE, LoadGenerator,
+    load_test_topics, LatencyProbe, compare_versions, find_latest_release_version,
+    apply_release_update,
 )
-logger = logging.getLogger(__name__)
 
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+startup_profile.mark("imports")
 
 class MessageReceiver(QObject):
     """Signal emitter for thread-safe GUI updates from MQTT callbacks"""
     message_received = pyqtSignal(str, str, str)  # timestamp, topic, payload
+    log_message = pyqtSignal(str)  # log message from persistence/worker threads
+
+
+class ConnectionSignals(QObject):
+    """Marshals ConnectionManager callbacks from awscrt threads to the GUI thread"""
+    state_changed = pyqtSignal(str, str)  # state, detail
+    publish_completed = pyqtSignal(int, str, str, str, float)  # publish_id, topic, payload, error, latency_secs
+    subscribe_completed = pyqtSignal(str, str)  # topic filter, error ("" on SUBACK)
+    subscriptions_changed = pyqtSignal()  # subscription set or per-filter state changed
 
 
 class UpdateChecker(QObject):
@@ -271,34 +338,1203 @@ class UpdateProgressDialog(QDialog):
                 pass
 
 
+class LogListModel(QAbstractListModel):
+    """
+    Fixed-capacity ring buffer of log lines for the live message log.
+    Appending is O(lines appended) regardless of history; the oldest lines are evicted once
+    capacity is reached, and the QListView only materializes the rows that are visible.
+    """
+    def __init__(self, capacity: int = 5000, parent=None):
+        super().__init__(parent)
+        self._capacity = max(1, capacity)
+        self._buffer = [None] * self._capacity
+        self._start = 0
+        self._count = 0
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        if 0 <= row < self._count:
+            return self._buffer[(self._start + row) % self._capacity]
+        return None
+
+    def append_lines(self, lines) -> int:
+        """Append lines at the end, evicting the oldest beyond capacity. Returns rows evicted."""
+        lines = list(lines)[-self._capacity:]
+        if not lines:
+            return 0
+        evicted = max(0, self._count + len(lines) - self._capacity)
+        if evicted:
+            self.beginRemoveRows(QModelIndex(), 0, evicted - 1)
+            for i in range(evicted):
+                self._buffer[(self._start + i) % self._capacity] = None
+            self._start = (self._start + evicted) % self._capacity
+            self._count -= evicted
+            self.endRemoveRows()
+        first = self._count
+        self.beginInsertRows(QModelIndex(), first, first + len(lines) - 1)
+        for line in lines:
+            self._buffer[(self._start + self._count) % self._capacity] = line
+            self._count += 1
+        self.endInsertRows()
+        return evicted
+
+    def clear(self):
+        self.beginResetModel()
+        self._buffer = [None] * self._capacity
+        self._start = 0
+        self._count = 0
+        self.endResetModel()
+
+
+class MessageTableModel(QAbstractTableModel):
+    """
+    Read-only, lazily loaded view of the messages table for the database viewer.
+    Rows are fetched a page at a time with keyset pagination as the view scrolls
+    (fetchMore/canFetchMore); payloads are pretty-printed only when a cell is painted.
+    set_filter() limits the view to a time range and/or one topic (index range queries), to messages
+    whose extracted field matches a FieldFilter (message_fields index), and optionally to full-text
+    matches (FTS5, newest first); search_ms is the time the filter took.
+    Compressed payloads are decoded as pages are fetched (see compression_summary()).
+    With shards, the shard files are read newest first, each ATTACHed while it is being paged,
+    followed by any messages stored in the main database before sharding was enabled.
+    """
+    HEADERS = ["ID", "Timestamp", "Topic", "Payload", "Created At"]
+    TIMESTAMP_COLUMN = 1
+    PAYLOAD_COLUMN = 3
+
+    def __init__(self, db_path: str, pragmas: Optional[dict] = None, page_size: int = 500, parent=None,
+                 shards: Optional[MessageShards] = None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.shards = shards
+        self._conn = open_database(db_path, pragmas)
+        self._decoder = PayloadDecoder(self._conn)
+        self._rows = []
+        self._attached = False
+        self.start_us = self.end_us = self.topic = None
+        self.field_filter = None
+        self.search = ""
+        self.count_limit = 10000  # full-text match counts stop here ("10000+")
+        self.search_ms = 0.0
+        self.search_backlog = 0
+        self._reset_cursor()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def set_filter(self, start_us: Optional[int] = None, end_us: Optional[int] = None, topic: Optional[str] = None,
+                   search: str = "", field_filter: Optional[FieldFilter] = None):
+        """
+        Show only messages in [start_us, end_us), on one topic, matching field_filter and/or
+        matching `search`; None/"" = no limit.
+        """
+        started = time.perf_counter()
+        self.beginResetModel()
+        self.start_us, self.end_us, self.topic = start_us, end_us, topic
+        self.field_filter = field_filter
+        self.search = fts_query(search or "")
+        self._rows = []
+        self._reset_cursor()
+        self.endResetModel()
+        self.fetchMore()
+        self.search_ms = (time.perf_counter() - started) * 1000.0
+
+    def topics(self) -> list:
+        """Distinct topics across the main database and all shards."""
+        topics = set(list_topics(self._conn))
+        for key in (self.shards.keys() if self.shards else []):
+            self._with_shard(key, lambda: topics.update(list_topics(self._conn, "shard")))
+        return sorted(topics)
+
+    def fields(self) -> list:
+        """Extracted field paths across the main database and all shards."""
+        fields = set(list_fields(self._conn))
+        for key in (self.shards.keys() if self.shards else []):
+            self._with_shard(key, lambda: fields.update(list_fields(self._conn, "shard")))
+        return sorted(fields)
+
+    def compression_summary(self) -> str:
+        """Compression ratio and decode cost of the rows loaded so far ("" if none were compressed)."""
+        stats = self._decoder.get_stats()
+        if not stats["compressed_rows"]:
+            return ""
+        return (f"payloads stored {stats['ratio']:.1f}x smaller, "
+                f"{stats['cpu_us_per_row']:.0f} \u00b5s/message to decompress")
+
+    def summary(self, recent_secs: float = 3600) -> tuple:
+        """
+        ([(topic, count, bytes, first_ts, last_ts, recent count, recent bytes)], [(topic, field, count, avg, min, max)])
+        from the rollup tables (main database and shards), without reading any messages.
+        """
+        topics, fields = {}, {}
+
+        def collect(schema):
+            for topic, count, size, first, last, recent, recent_bytes in topic_summary(self._conn, recent_secs, schema):
+                row = topics.setdefault(topic, [0, 0, first, last, 0, 0])
+                row[0] += count
+                row[1] += size
+                row[2], row[3] = min(row[2], first), max(row[3], last)
+                row[4] += recent
+                row[5] += recent_bytes
+            for topic, path, count, avg, low, high in field_summary(self._conn, recent_secs, schema):
+                row = fields.setdefault((topic, path), [0, 0.0, low, high])
+                row[0] += count
+                row[1] += avg * count
+                row[2], row[3] = min(row[2], low), max(row[3], high)
+
+        collect("main")
+        for key in (self.shards.keys() if self.shards else []):
+            self._with_shard(key, lambda: collect("shard"))
+        return (
+            [(topic, *row) for topic, row in sorted(topics.items())],
+            [(topic, path, count, total / count, low, high)
+             for (topic, path), (count, total, low, high) in sorted(fields.items())],
+        )
+
+    def _with_shard(self, key: str, fn):
+        self.shards.attach(self._conn, key, "shard")
+        try:
+            return fn()
+        finally:
+            self._conn.execute("DETACH DATABASE shard")
+
+    def _reset_cursor(self):
+        if self._attached:
+            self._conn.execute("DETACH DATABASE shard")
+            self._attached = False
+        self._exhausted = False
+        self._after_key = None
+        # Remaining sources, newest first: shard keys that overlap the range, then None for the main database
+        shard_keys = self.shards.keys_in_range(self.start_us, self.end_us) if self.shards else []
+        self._sources = list(reversed(shard_keys)) + [None]
+        filters = (self.start_us, self.end_us, self.topic)
+        if self.search:
+            # Counted with the same time range / topic / field conditions as the rows shown
+            def count(schema):
+                return count_search_matches(
+                    self._conn, self.search, schema, self.count_limit, *filters, self.field_filter
+                )
+            backlog = search_index_backlog
+        else:
+            def count(schema):
+                return count_messages_in_range(self._conn, *filters, schema, self.field_filter)
+
+            def backlog(conn, schema):
+                return 0
+        self.total_count = count("main") + sum(self._with_shard(key, lambda: count("shard")) for key in shard_keys)
+        self.search_backlog = backlog(self._conn, "main") + sum(
+            self._with_shard(key, lambda: backlog(self._conn, "shard")) for key in shard_keys
+        )
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self._rows[index.row()][index.column()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if index.column() == self.PAYLOAD_COLUMN and value:
+                return format_payload(str(value))
+            if index.column() == self.TIMESTAMP_COLUMN:
+                return format_epoch_us(value)
+            return "" if value is None else str(value)
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() == self.PAYLOAD_COLUMN:
+            return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and self._conn is not None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        page = []
+        while len(page) < self.page_size and self._sources:
+            source = self._sources[0]
+            if source is not None and not self._attached:
+                self.shards.attach(self._conn, source, "shard")
+                self._attached = True
+            wanted = self.page_size - len(page)
+            schema = "main" if source is None else "shard"
+            if self.search:
+                rows = search_messages_page(
+                    self._conn, self.search, self._after_key, wanted, schema, self.start_us, self.end_us, self.topic,
+                    self.field_filter,
+                )
+            else:
+                rows = fetch_messages_page(
+                    self._conn, self._after_key, wanted, schema, self.start_us, self.end_us, self.topic,
+                    self.field_filter,
+                )
+            page.extend((row[0], row[1], row[2], self._decoder.decode(row[3]), row[4]) for row in rows)
+            if rows:
+                self._after_key = rows[-1][0] if self.search else (rows[-1][1], rows[-1][0])
+            if len(rows) < wanted:
+                # This source is exhausted; continue with the next older one
+                if self._attached:
+                    self._conn.execute("DETACH DATABASE shard")
+                    self._attached = False
+                self._sources.pop(0)
+                self._after_key = None
+        if not self._sources:
+            self._exhausted = True
+        if page:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+
+class HighlightDelegate(QStyledItemDelegate):
+    """Paints cell text with the current search terms highlighted (plain painting when nothing matches)."""
+    HIGHLIGHT = "background-color: #ffe066;"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pattern = None
+
+    def paint(self, painter, option, index):
+        text = index.data(Qt.ItemDataRole.DisplayRole)
+        if self.pattern is None or not text or not self.pattern.search(text):
+            super().paint(painter, option, index)
+            return
+        # Background/selection from the style, then the text as rich text with the matches marked
+        self.initStyleOption(option, index)
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_ItemViewItem, option, painter, option.widget)
+        parts, last = [], 0
+        for match in self.pattern.finditer(text):
+            parts.append(html.escape(text[last:match.start()]))
+            parts.append(f'<span style="{self.HIGHLIGHT}">{html.escape(match.group())}</span>')
+            last = match.end()
+        parts.append(html.escape(text[last:]))
+        doc = QTextDocument()
+        doc.setDefaultFont(option.font)
+        doc.setHtml(f'<div style="white-space: pre-wrap;">{"".join(parts)}</div>')
+        doc.setTextWidth(option.rect.width())
+        painter.save()
+        painter.translate(option.rect.topLeft())
+        doc.drawContents(painter, QRectF(0, 0, option.rect.width(), option.rect.height()))
+        painter.restore()
+
+
+class LoadTestDialog(QDialog):
+    """
+    Non-modal load-test panel: configures a LoadGenerator over the GUI's connection,
+    starts/stops it and shows achieved rate, PUBACK latency and errors while it runs.
+    """
+    load_finished = pyqtSignal(dict)
+
+    def __init__(self, manager: ConnectionManager, topic_prefix: str, parent=None, on_log=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.on_log = on_log
+        self.generator = None
+        self.setWindowTitle("Publish Load Test")
+        self.setModal(False)
+        self.resize(560, 520)
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.topic_prefix_edit = QLineEdit(topic_prefix)
+        form.addRow("Topic prefix:", self.topic_prefix_edit)
+        self.topic_count_spin = QSpinBox()
+        self.topic_count_spin.setRange(1, 10000)
+        form.addRow("Topics (prefix/0..N-1):", self.topic_count_spin)
+        self.rate_spin = QDoubleSpinBox()
+        self.rate_spin.setRange(0, 100000)
+        self.rate_spin.setDecimals(1)
+        self.rate_spin.setValue(10)
+        form.addRow("Rate (msg/s, 0 = max):", self.rate_spin)
+        self.count_spin = QSpinBox()
+        self.count_spin.setRange(0, 100_000_000)
+        self.count_spin.setValue(1000)
+        form.addRow("Messages (0 = no limit):", self.count_spin)
+        self.duration_spin = QSpinBox()
+        self.duration_spin.setRange(0, 7 * 24 * 3600)
+        form.addRow("Duration (s, 0 = no limit):", self.duration_spin)
+        self.in_flight_spin = QSpinBox()
+        self.in_flight_spin.setRange(1, 10000)
+        self.in_flight_spin.setValue(100)
+        form.addRow("In-flight window:", self.in_flight_spin)
+        self.qos_spin = QSpinBox()
+        self.qos_spin.setRange(0, 1)
+        self.qos_spin.setValue(1)
+        form.addRow("QoS:", self.qos_spin)
+        layout.addLayout(form)
+
+        layout.addWidget(QLabel("Payload template:"))
+        self.template_edit = QTextEdit()
+        self.template_edit.setPlainText(DEFAULT_LOAD_TEMPLATE)
+        self.template_edit.setMinimumHeight(80)
+        layout.addWidget(self.template_edit)
+        hint = QLabel("Placeholders: {seq} {ts} {epoch_ms} {topic} {rand} {rand:LO:HI} {randint:LO:HI}")
+        hint.setStyleSheet("font-size: 9pt; color: gray;")
+        layout.addWidget(hint)
+
+        self.stats_label = QLabel("Idle")
+        self.stats_label.setStyleSheet("font-family: 'Courier New', monospace; font-size: 9pt; padding: 5px;")
+        self.stats_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(self.stats_label)
+
+        btn_layout = QHBoxLayout()
+        self.start_btn = QPushButton("Start")
+        self.start_btn.clicked.connect(self.start_load)
+        btn_layout.addWidget(self.start_btn)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.clicked.connect(self.stop_load)
+        self.stop_btn.setEnabled(False)
+        btn_layout.addWidget(self.stop_btn)
+        btn_layout.addStretch()
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self.load_finished.connect(self._on_load_finished)
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.timeout.connect(self._refresh_stats)
+
+    def start_load(self):
+        if self.generator and self.generator.is_running():
+            return
+        if self.manager.state != ConnectionState.CONNECTED:
+            QMessageBox.warning(self, "Not Connected", "Please connect to AWS IoT first.")
+            return
+        prefix = self.topic_prefix_edit.text().strip().rstrip("/")
+        if not prefix:
+            QMessageBox.warning(self, "Invalid Topic", "Please enter a topic prefix.")
+            return
+        self.generator = LoadGenerator(
+            self.manager,
+            load_test_topics(prefix, self.topic_count_spin.value()),
+            self.template_edit.toPlainText().strip(),
+            rate=self.rate_spin.value(),
+            count=self.count_spin.value(),
+            duration_secs=self.duration_spin.value(),
+            qos=self.qos_spin.value(),
+            max_in_flight=self.in_flight_spin.value(),
+            on_finished=self.load_finished.emit,
+            on_log=self.on_log,
+        )
+        self.generator.start()
+        self.start_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self._refresh_timer.start(500)
+
+    def stop_load(self):
+        if self.generator:
+            self.generator.stop()
+            self.stop_btn.setEnabled(False)
+
+    def _on_load_finished(self, report: dict):
+        self._refresh_timer.stop()
+        self._show_report(report)
+        self.start_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+
+    def _refresh_stats(self):
+        if self.generator:
+            self._show_report(self.generator.get_report())
+
+    def _show_report(self, report: dict):
+        latency = report["puback_latency"]
+        errors = ", ".join(f"{name} x{n}" for name, n in report["errors"].items()) or "none"
+        self.stats_label.setText(
+            f"Sent {report['sent']}  acked {report['acked']}  failed {report['failed']}  "
+            f"in flight {report['in_flight']}\n"
+            f"Elapsed {report['elapsed_secs']:.1f} s  achieved {report['achieved_rate']:.1f} msg/s\n"
+            f"PUBACK ms  p50 {latency['p50_ms']:.1f}  p90 {latency['p90_ms']:.1f}  "
+            f"p99 {latency['p99_ms']:.1f}  max {latency['max_ms']:.1f}\n"
+            f"Errors: {errors}"
+        )
+
+    def closeEvent(self, event):
+        self.stop_load()
+        super().closeEvent(event)
+
+
+class LatencyProbeDialog(QDialog):
+    """
+    Non-modal round-trip latency probe panel. Subscribes to the probe topic through the app's
+    normal subscribe path, runs a LatencyProbe and exports its results as CSV or JSON.
+    """
+    probe_finished = pyqtSignal(dict)
+
+    def __init__(self, manager: ConnectionManager, topic: str, subscribe_filter, unsubscribe_filter,
+                 message_taps: list, parent=None, on_log=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.subscribe_filter = subscribe_filter
+        self.unsubscribe_filter = unsubscribe_filter
+        self.message_taps = message_taps
+        self.on_log = on_log
+        self.probe = None
+        self._subscribed_by_probe = None
+        self.setWindowTitle("Latency Probe")
+        self.setModal(False)
+        self.resize(520, 360)
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.topic_edit = QLineEdit(topic)
+        form.addRow("Probe topic:", self.topic_edit)
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(10, 60000)
+        self.interval_spin.setValue(1000)
+        form.addRow("Interval (ms):", self.interval_spin)
+        self.count_spin = QSpinBox()
+        self.count_spin.setRange(0, 10_000_000)
+        self.count_spin.setValue(60)
+        form.addRow("Messages (0 = until stopped):", self.count_spin)
+        self.timeout_spin = QDoubleSpinBox()
+        self.timeout_spin.setRange(0.5, 300)
+        self.timeout_spin.setValue(5)
+        form.addRow("Loss timeout (s):", self.timeout_spin)
+        self.qos_spin = QSpinBox()
+        self.qos_spin.setRange(0, 1)
+        self.qos_spin.setValue(1)
+        form.addRow("QoS:", self.qos_spin)
+        layout.addLayout(form)
+
+        self.stats_label = QLabel("Idle")
+        self.stats_label.setStyleSheet("font-family: 'Courier New', monospace; font-size: 9pt; padding: 5px;")
+        self.stats_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(self.stats_label)
+
+        btn_layout = QHBoxLayout()
+        self.start_btn = QPushButton("Start")
+        self.start_btn.clicked.connect(self.start_probe)
+        btn_layout.addWidget(self.start_btn)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.clicked.connect(self.stop_probe)
+        self.stop_btn.setEnabled(False)
+        btn_layout.addWidget(self.stop_btn)
+        self.export_csv_btn = QPushButton("Export CSV...")
+        self.export_csv_btn.clicked.connect(lambda: self._export("csv"))
+        self.export_csv_btn.setEnabled(False)
+        btn_layout.addWidget(self.export_csv_btn)
+        self.export_json_btn = QPushButton("Export JSON...")
+        self.export_json_btn.clicked.connect(lambda: self._export("json"))
+        self.export_json_btn.setEnabled(False)
+        btn_layout.addWidget(self.export_json_btn)
+        btn_layout.addStretch()
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self.probe_finished.connect(self._on_probe_finished)
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.timeout.connect(self._refresh_stats)
+
+    def start_probe(self):
+        if self.probe and self.probe.is_running():
+            return
+        if self.manager.state != ConnectionState.CONNECTED:
+            QMessageBox.warning(self, "Not Connected", "Please connect to AWS IoT first.")
+            return
+        topic = self.topic_edit.text().strip()
+        if not topic or "+" in topic or "#" in topic:
+            QMessageBox.warning(self, "Invalid Topic", "Please enter a concrete topic (no wildcards).")
+            return
+        try:
+            if self.subscribe_filter(topic):
+                self._subscribed_by_probe = topic
+        except Exception as e:
+            QMessageBox.critical(self, "Subscribe Error", f"Subscribe failed: {e}")
+            return
+        self.probe = LatencyProbe(
+            self.manager,
+            topic,
+            interval_secs=self.interval_spin.value() / 1000.0,
+            count=self.count_spin.value(),
+            qos=self.qos_spin.value(),
+            loss_timeout_secs=self.timeout_spin.value(),
+            on_finished=self.probe_finished.emit,
+            on_log=self.on_log,
+        )
+        self.message_taps.append(self.probe.on_message)
+        self.probe.start()
+        self.start_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.export_csv_btn.setEnabled(False)
+        self.export_json_btn.setEnabled(False)
+        self._refresh_timer.start(500)
+
+    def stop_probe(self):
+        if self.probe and self.probe.is_running():
+            self.probe.stop()
+            self.stop_btn.setEnabled(False)
+            self.stats_label.setText(self.stats_label.text() + "\nWaiting for outstanding replies...")
+
+    def _on_probe_finished(self, report: dict):
+        self._refresh_timer.stop()
+        if self.probe.on_message in self.message_taps:
+            self.message_taps.remove(self.probe.on_message)
+        if self._subscribed_by_probe:
+            try:
+                self.unsubscribe_filter(self._subscribed_by_probe)
+            except Exception as e:
+                logger.warning(f"Could not unsubscribe probe topic: {e}")
+            self._subscribed_by_probe = None
+        self._show_report(report)
+        self.start_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        self.export_csv_btn.setEnabled(True)
+        self.export_json_btn.setEnabled(True)
+
+    def _refresh_stats(self):
+        if self.probe:
+            self._show_report(self.probe.get_report())
+
+    def _show_report(self, report: dict):
+        latency = report["latency"]
+        self.stats_label.setText(
+            f"Sent {report['sent']}  received {report['received']}  waiting {report['waiting']}\n"
+            f"Lost {report['lost']} ({report['loss_percent']:.1f}%)  late {report['late']}  "
+            f"reordered {report['reordered']}  duplicates {report['duplicates']}\n"
+            f"RTT ms  p50 {latency['p50_ms']:.1f}  p90 {latency['p90_ms']:.1f}  "
+            f"p99 {latency['p99_ms']:.1f}  max {latency['max_ms']:.1f}"
+        )
+
+    def _export(self, fmt: str):
+        if not self.probe:
+            return
+        default_name = f"latency_probe_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Latency Probe", default_name,
+            "CSV files (*.csv)" if fmt == "csv" else "JSON files (*.json)",
+        )
+        if not path:
+            return
+        try:
+            if fmt == "csv":
+                self.probe.export_csv(path)
+            else:
+                self.probe.export_json(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", f"Could not write {path}: {e}")
+
+    def closeEvent(self, event):
+        self.stop_probe()
+        super().closeEvent(event)
+
+
+class LiveChartWidget(QWidget):
+    """
+    Plots the FieldSeriesFeed series over a sliding time window. Every repaint takes the window
+    from each series' ring buffer and min/max-decimates it to the plot's pixel width, so drawing
+    costs the same at 10 or 50,000 samples per second.
+    """
+    COLORS = ["#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd", "#8c564b", "#e377c2", "#17becf"]
+    MARGINS = (64, 8, 12, 22)  # left, top, right, bottom
+
+    def __init__(self, feed, parent=None):
+        super().__init__(parent)
+        self.feed = feed
+        self.window_secs = 60.0
+        self.paused_at = None  # epoch seconds the view is frozen at, None = follow now
+        self.samples_in_view = 0
+        self.points_drawn = 0
+        self.frame_ms = 0.0
+        self.setMinimumSize(400, 220)
+
+    def paintEvent(self, event):
+        started = time.perf_counter()
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        left, top, right, bottom = self.MARGINS
+        plot = QRectF(left, top, max(1, self.width() - left - right), max(1, self.height() - top - bottom))
+        end = self.paused_at or time.time()
+        start = end - self.window_secs
+        lines = []
+        for index, (topic_filter, path, buffer) in enumerate(self.feed.series()):
+            times, values = buffer.window(start)
+            x, y = decimate_minmax(times, values, start, end, int(plot.width()))
+            lines.append((index, f"{topic_filter} · {path}", x, y, values[-1] if len(values) else None, len(times)))
+        drawn = [line[3] for line in lines if len(line[3])]
+        low = min(float(y.min()) for y in drawn) if drawn else 0.0
+        high = max(float(y.max()) for y in drawn) if drawn else 1.0
+        if high - low < 1e-9:
+            low, high = low - 0.5, high + 0.5
+        padding = (high - low) * 0.05
+        low, high = low - padding, high + padding
+
+        painter.setPen(QColor("#e0e0e0"))
+        for i in range(5):
+            y = plot.top() + plot.height() * i / 4
+            painter.drawLine(QPointF(plot.left(), y), QPointF(plot.right(), y))
+        painter.setPen(QColor("#606060"))
+        painter.drawRect(plot)
+        for i in range(5):
+            y = plot.top() + plot.height() * i / 4
+            painter.drawText(QRectF(0, y - 8, left - 6, 16), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter,
+                             f"{high - (high - low) * i / 4:.4g}")
+        label_rect = QRectF(plot.left(), plot.bottom() + 2, plot.width(), bottom - 2)
+        painter.drawText(label_rect, Qt.AlignmentFlag.AlignLeft, f"-{self.window_secs:g} s")
+        painter.drawText(label_rect, Qt.AlignmentFlag.AlignRight, "paused" if self.paused_at else "now")
+
+        painter.setClipRect(plot)
+        x_scale = plot.width() / self.window_secs
+        y_scale = plot.height() / (high - low)
+        points = 0
+        for index, label, x, y, last, count in lines:
+            color = QColor(self.COLORS[index % len(self.COLORS)])
+            if len(x):
+                px = (plot.left() + (x - start) * x_scale).tolist()
+                py = (plot.bottom() - (y - low) * y_scale).tolist()
+                painter.setPen(QPen(color, 1))
+                painter.drawPolyline(QPolygonF([QPointF(a, b) for a, b in zip(px, py)]))
+                points += len(px)
+            text = f"{label}: {last:.4g}" if last is not None else f"{label}: no data"
+            metrics = painter.fontMetrics()
+            baseline = QPointF(plot.left() + 6, plot.top() + 16 + 16 * index)
+            painter.fillRect(QRectF(baseline.x() - 3, baseline.y() - metrics.ascent() - 1,
+                                    metrics.horizontalAdvance(text) + 6, metrics.height() + 2), QColor(255, 255, 255, 210))
+            painter.setPen(color)
+            painter.drawText(baseline, text)
+        painter.end()
+        self.samples_in_view = sum(line[5] for line in lines)
+        self.points_drawn = points
+        self.frame_ms = (time.perf_counter() - started) * 1000.0
+
+
+class LiveChartDialog(QDialog):
+    """
+    Non-modal live chart of numeric JSON payload fields. Pick a topic (or filter) and a field path
+    and add it as a series; the chart repaints at 10 frames/s while the dialog is open.
+    """
+    WINDOWS = [("10 s", 10), ("1 min", 60), ("5 min", 300), ("15 min", 900)]
+
+    def __init__(self, feed, topic_filters, parent=None, frame_hz: int = 10):
+        super().__init__(parent)
+        self.feed = feed
+        self.topic_filters = topic_filters  # callable returning the current subscription filters
+        self.setWindowTitle("Live Chart")
+        self.setModal(False)
+        self.resize(820, 480)
+
+        layout = QVBoxLayout(self)
+        picker = QHBoxLayout()
+        picker.addWidget(QLabel("Topic:"))
+        self.topic_combo = QComboBox()
+        self.topic_combo.setEditable(True)
+        self.topic_combo.setMinimumWidth(220)
+        self.topic_combo.currentTextChanged.connect(self._refresh_fields)
+        picker.addWidget(self.topic_combo, 2)
+        picker.addWidget(QLabel("Field:"))
+        self.field_combo = QComboBox()
+        self.field_combo.setEditable(True)
+        self.field_combo.setMinimumWidth(140)
+        picker.addWidget(self.field_combo, 1)
+        add_btn = QPushButton("Add Series")
+        add_btn.clicked.connect(self.add_series)
+        picker.addWidget(add_btn)
+        layout.addLayout(picker)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Window:"))
+        self.window_combo = QComboBox()
+        for label, secs in self.WINDOWS:
+            self.window_combo.addItem(label, secs)
+        self.window_combo.setCurrentIndex(1)
+        self.window_combo.currentIndexChanged.connect(self._on_window_changed)
+        controls.addWidget(self.window_combo)
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setCheckable(True)
+        self.pause_btn.toggled.connect(self._on_pause_toggled)
+        controls.addWidget(self.pause_btn)
+        clear_btn = QPushButton("Remove All Series")
+        clear_btn.clicked.connect(self.clear_series)
+        controls.addWidget(clear_btn)
+        controls.addStretch()
+        self.status_label = QLabel("")
+        self.status_label.setStyleSheet("font-size: 9pt; color: gray;")
+        controls.addWidget(self.status_label)
+        layout.addLayout(controls)
+
+        self.chart = LiveChartWidget(feed, self)
+        layout.addWidget(self.chart, 1)
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.timeout.connect(self._on_frame)
+        self._frame_interval_ms = max(1, int(1000 / frame_hz))
+
+    def showEvent(self, event):
+        self._refresh_topics()
+        self._frame_timer.start(self._frame_interval_ms)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._frame_timer.stop()
+        super().hideEvent(event)
+
+    def _refresh_topics(self):
+        current = self.topic_combo.currentText()
+        self.topic_combo.blockSignals(True)
+        self.topic_combo.clear()
+        self.topic_combo.addItems(list(dict.fromkeys(self.feed.recent_topics() + list(self.topic_filters()))))
+        self.topic_combo.setCurrentText(current or (self.topic_combo.itemText(0) if self.topic_combo.count() else ""))
+        self.topic_combo.blockSignals(False)
+        self._refresh_fields(self.topic_combo.currentText())
+
+    def _refresh_fields(self, topic: str):
+        current = self.field_combo.currentText() or "temperature"
+        self.field_combo.clear()
+        self.field_combo.addItems(self.feed.fields_for(topic.strip()))
+        self.field_combo.setCurrentText(current)
+
+    def add_series(self):
+        topic = self.topic_combo.currentText().strip()
+        path = self.field_combo.currentText().strip()
+        if not topic or not path:
+            QMessageBox.warning(self, "Live Chart", "Please enter a topic and a field.")
+            return
+        try:
+            self.feed.watch(topic, path)
+        except (ValueError, RuntimeError) as e:
+            QMessageBox.warning(self, "Live Chart", str(e))
+            return
+        self.chart.update()
+
+    def clear_series(self):
+        for topic_filter, path, _ in self.feed.series():
+            self.feed.unwatch(topic_filter, path)
+        self.chart.update()
+
+    def _on_window_changed(self, index: int):
+        self.chart.window_secs = float(self.window_combo.itemData(index))
+        self.chart.update()
+
+    def _on_pause_toggled(self, paused: bool):
+        self.chart.paused_at = time.time() if paused else None
+        self.pause_btn.setText("Resume" if paused else "Pause")
+        self.chart.update()
+
+    def _on_frame(self):
+        if self.chart.paused_at is None:
+            self.chart.update()
+        self.status_label.setText(
+            f"{self.chart.samples_in_view} samples in view, {self.chart.points_drawn} points drawn, "
+            f"{self.chart.frame_ms:.1f} ms/frame"
+        )
+
+
+class SubscriptionManagerDialog(QDialog):
+    """
+    Non-modal editor for named subscription sets (saved in the database) plus a live table of
+    every tracked filter's state and SUBACK latency. Checked sets are subscribed right away and
+    on every connect; the table refreshes at most 5 times a second while the dialog is open.
+    """
+    COLUMNS = ["Topic filter", "Sets", "State", "QoS", "SUBACK (ms)", "Error"]
+    STATE_COLORS = {
+        SubscriptionState.SUBSCRIBED: "#2e7d32",
+        SubscriptionState.SUBSCRIBING: "#ef6c00",
+        SubscriptionState.FAILED: "#c62828",
+    }
+
+    def __init__(self, subscriptions, changed_signal, parent=None, refresh_ms: int = 200):
+        super().__init__(parent)
+        self.subscriptions = subscriptions
+        self.setWindowTitle("Subscription Sets")
+        self.setModal(False)
+        self.resize(860, 580)
+
+        layout = QVBoxLayout(self)
+        sets_row = QHBoxLayout()
+        sets_group = QGroupBox("Subscription Sets")
+        sets_layout = QVBoxLayout(sets_group)
+        self.set_list = QListWidget()
+        self.set_list.currentItemChanged.connect(self._on_set_selected)
+        self.set_list.itemChanged.connect(self._on_set_toggled)
+        sets_layout.addWidget(self.set_list)
+        hint = QLabel("Checked sets are subscribed on every connect.")
+        hint.setStyleSheet("font-size: 9pt; color: gray;")
+        sets_layout.addWidget(hint)
+        set_buttons = QHBoxLayout()
+        new_btn = QPushButton("New")
+        new_btn.clicked.connect(self.new_set)
+        set_buttons.addWidget(new_btn)
+        delete_btn = QPushButton("Delete")
+        delete_btn.clicked.connect(self.delete_set)
+        set_buttons.addWidget(delete_btn)
+        sets_layout.addLayout(set_buttons)
+        sets_row.addWidget(sets_group, 1)
+
+        editor_group = QGroupBox("Set")
+        editor_layout = QFormLayout(editor_group)
+        self.name_edit = QLineEdit()
+        editor_layout.addRow("Name:", self.name_edit)
+        self.filters_edit = QPlainTextEdit()
+        self.filters_edit.setPlaceholderText("One topic filter per line, e.g.\ndevices/+/telemetry\nalarms/#")
+        editor_layout.addRow("Topic filters:", self.filters_edit)
+        self.enabled_check = QCheckBox("Subscribe on connect")
+        self.enabled_check.setChecked(True)
+        editor_layout.addRow("", self.enabled_check)
+        save_btn = QPushButton("Save Set")
+        save_btn.clicked.connect(self.save_set)
+        editor_layout.addRow("", save_btn)
+        sets_row.addWidget(editor_group, 2)
+        layout.addLayout(sets_row)
+
+        self.summary_label = QLabel("")
+        self.summary_label.setStyleSheet("font-size: 9pt; color: gray;")
+        layout.addWidget(self.summary_label)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setStyleSheet("font-size: 9pt;")
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, len(self.COLUMNS)):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.table, 1)
+
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        close_layout = QHBoxLayout()
+        close_layout.addStretch()
+        close_layout.addWidget(close_btn)
+        layout.addLayout(close_layout)
+
+        # SUBACKs arrive in bursts on connect: coalesce change notifications into one refresh
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(refresh_ms)
+        self._refresh_timer.timeout.connect(self.refresh)
+        changed_signal.connect(self._schedule_refresh)
+
+    def showEvent(self, event):
+        self._reload_sets()
+        self.refresh()
+        super().showEvent(event)
+
+    def _schedule_refresh(self):
+        if self.isVisible() and not self._refresh_timer.isActive():
+            self._refresh_timer.start()
+
+    def _reload_sets(self, select: str = None):
+        current = self.set_list.currentItem()
+        select = select or (current.data(Qt.ItemDataRole.UserRole) if current else None)
+        self.set_list.blockSignals(True)
+        self.set_list.clear()
+        for name, enabled, filters, persisted in self.subscriptions.sets():
+            item = QListWidgetItem(name)
+            item.setData(Qt.ItemDataRole.UserRole, name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if enabled else Qt.CheckState.Unchecked)
+            item.setToolTip(f"{len(filters)} topic filter(s)" + ("" if persisted else " (this run only)"))
+            self.set_list.addItem(item)
+            if name == select:
+                self.set_list.setCurrentItem(item)
+        self.set_list.blockSignals(False)
+        if select is None and self.set_list.count():
+            self.set_list.setCurrentRow(0)
+
+    def _on_set_selected(self, current, previous):
+        if current is None:
+            return
+        name = current.data(Qt.ItemDataRole.UserRole)
+        for set_name, enabled, filters, _ in self.subscriptions.sets():
+            if set_name == name:
+                self.name_edit.setText(set_name)
+                self.filters_edit.setPlainText("\n".join(filters))
+                self.enabled_check.setChecked(enabled)
+                return
+
+    def _on_set_toggled(self, item):
+        name = item.data(Qt.ItemDataRole.UserRole)
+        enabled = item.checkState() == Qt.CheckState.Checked
+        try:
+            self.subscriptions.set_enabled(name, enabled)
+        except Exception as e:
+            QMessageBox.warning(self, "Subscription Sets", f"Could not update '{name}': {e}")
+        if self.set_list.currentItem() is item:
+            self.enabled_check.setChecked(enabled)
+
+    def new_set(self):
+        self.set_list.setCurrentItem(None)
+        self.name_edit.clear()
+        self.filters_edit.clear()
+        self.enabled_check.setChecked(True)
+        self.name_edit.setFocus()
+
+    def save_set(self):
+        name = self.name_edit.text().strip()
+        filters = self.filters_edit.toPlainText().splitlines()
+        try:
+            self.subscriptions.save_set(name, filters, self.enabled_check.isChecked())
+        except Exception as e:
+            QMessageBox.warning(self, "Subscription Sets", str(e))
+            return
+        self._reload_sets(select=name)
+
+    def delete_set(self):
+        item = self.set_list.currentItem()
+        if item is None:
+            return
+        name = item.data(Qt.ItemDataRole.UserRole)
+        reply = QMessageBox.question(
+            self, "Delete Subscription Set",
+            f"Delete '{name}'? Its filters are unsubscribed unless another checked set includes them.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            self.subscriptions.delete_set(name)
+        except Exception as e:
+            QMessageBox.warning(self, "Subscription Sets", str(e))
+            return
+        self._reload_sets()
+        if self.set_list.count() == 0:
+            self.new_set()
+
+    def refresh(self):
+        rows = self.subscriptions.snapshot()
+        self.table.setRowCount(len(rows))
+        for index, row in enumerate(rows):
+            sets = ", ".join(row["sets"] + (("one-off",) if row["manual"] else ()))
+            values = [
+                row["filter"],
+                sets,
+                row["state"],
+                "" if row["qos"] is None else str(row["qos"]),
+                "" if row["suback_ms"] is None else f"{row['suback_ms']:.0f}",
+                row["error"],
+            ]
+            for column, value in enumerate(values):
+                item = self.table.item(index, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(index, column, item)
+                item.setText(value)
+            color = self.STATE_COLORS.get(row["state"])
+            self.table.item(index, 2).setForeground(QColor(color) if color else self.palette().text().color())
+        stats = self.subscriptions.get_stats()
+        summary = (
+            f"{stats['subscribed']} subscribed, {stats['pending']} pending, "
+            f"{stats['subscribing']} waiting for SUBACK, {stats['failed']} failed"
+        )
+        if stats["subacks"]:
+            summary += f"; SUBACK avg {stats['avg_suback_secs'] * 1000:.0f} ms, max {stats['max_suback_secs'] * 1000:.0f} ms"
+        if stats["last_batch_filters"]:
+            summary += (
+                f"; last bulk subscribe: {stats['last_batch_filters']} filter(s) "
+                f"in {stats['last_batch_secs'] * 1000:.0f} ms"
+            )
+        self.summary_label.setText(summary)
+
+
+def sparkline(values) -> str:
+    """Unicode block sparkline, scaled to the largest value (blank = no messages)"""
+    peak = max(values, default=0)
+    if not peak:
+        return " " * len(values)
+    return "".join(" " if not v else "▁▂▃▄▅▆▇█"[(v * 7) // peak] for v in values)
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{max(seconds, 0):.0f} s ago"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min ago"
+    return f"{seconds / 3600:.1f} h ago"
+
+
+class TopicStatsPanel(QGroupBox):
+    """
+    Live per-filter / per-topic message rates from the engine's TopicActivity: msg/s, KB/s,
+    last-seen age, totals and a sparkline of the last minute. Refreshes on a 1 s timer only
+    while expanded; items are updated in place so expanded filters stay expanded.
+    """
+    COLUMNS = ["Filter / topic", "msg/s", "KB/s", "Last seen", "Total", "Last 60 s"]
+    OTHER_TOPICS = "(no matching filter)"
+
+    def __init__(self, activity, filters, parent=None, refresh_ms: int = 1000, max_topics_per_filter: int = 25):
+        super().__init__("Live Topic Statistics", parent)
+        self.activity = activity
+        self.filters = filters  # callable returning the current subscription filters
+        self.max_topics_per_filter = max_topics_per_filter
+        self._filter_items = {}
+        self.setCheckable(True)
+        self.setChecked(False)
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel("")
+        self.summary_label.setStyleSheet("font-size: 9pt; color: gray;")
+        layout.addWidget(self.summary_label)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(self.COLUMNS)
+        self.tree.setUniformRowHeights(True)
+        self.tree.setRootIsDecorated(True)
+        self.tree.setMinimumHeight(160)
+        self.tree.setStyleSheet("font-size: 9pt;")
+        header = self.tree.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, len(self.COLUMNS)):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.tree)
+        self._spark_font = self.tree.font()
+        self._spark_font.setFamily("DejaVu Sans Mono")
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._refresh_ms = refresh_ms
+        self.toggled.connect(self._on_toggled)
+        self._on_toggled(False)
+
+    def _on_toggled(self, expanded: bool):
+        self.summary_label.setVisible(expanded)
+        self.tree.setVisible(expanded)
+        if expanded:
+            self.refresh()
+            self._timer.start(self._refresh_ms)
+        else:
+            self._timer.stop()
+
+    def refresh(self):
+        now = time.time()
+        snapshot = self.activity.snapshot(self.filters(), now=now)
+        by_name = {row["name"]: row for row in snapshot["topics"]}
+        groups = [(row, [by_name[name] for name in row["topics"]]) for row in snapshot["filters"]]
+        matched = {name for row in snapshot["filters"] for name in row["topics"]}
+        others = [row for row in snapshot["topics"] if row["name"] not in matched]
+        if others:
+            groups.append(({**TopicActivity.combine(others, self.activity.history_secs), "name": self.OTHER_TOPICS}, others))
+        for name in list(self._filter_items):
+            if name not in {row["name"] for row, _ in groups}:
+                self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(self._filter_items.pop(name)))
+        for position, (row, topics) in enumerate(groups):
+            item = self._filter_items.get(row["name"])
+            if item is None:
+                item = self._filter_items[row["name"]] = QTreeWidgetItem()
+                font = item.font(0)
+                font.setBold(True)
+                item.setFont(0, font)
+                self.tree.insertTopLevelItem(position, item)
+                item.setExpanded(True)
+            self._set_row(item, row, now)
+            topics = sorted(topics, key=lambda r: (r["msgs_per_sec"], r["last_seen"]), reverse=True)
+            hidden = len(topics) - self.max_topics_per_filter
+            shown = topics[:self.max_topics_per_filter]
+            wanted = len(shown) + (1 if hidden > 0 else 0)
+            while item.childCount() > wanted:
+                item.removeChild(item.child(item.childCount() - 1))
+            while item.childCount() < wanted:
+                item.addChild(QTreeWidgetItem())
+            for index, topic_row in enumerate(shown):
+                self._set_row(item.child(index), topic_row, now)
+            if hidden > 0:
+                more = item.child(len(shown))
+                more.setText(0, f"... {hidden} quieter topic(s)")
+                for column in range(1, len(self.COLUMNS)):
+                    more.setText(column, "")
+        evicted = f", {snapshot['evicted']} evicted (oldest first)" if snapshot["evicted"] else ""
+        self.summary_label.setText(
+            f"{len(snapshot['topics'])} topic(s) seen since start{evicted}; rates over the last 5 s"
+        )
+
+    def _set_row(self, item: QTreeWidgetItem, row: dict, now: float):
+        item.setText(0, row["name"])
+        item.setText(1, f"{row['msgs_per_sec']:.1f}")
+        item.setText(2, f"{row['bytes_per_sec'] / 1024:.1f}")
+        item.setText(3, format_age(now - row["last_seen"]) if row["last_seen"] else "never")
+        item.setText(4, str(row["total"]))
+        item.setText(5, sparkline(row["history"]))
+        item.setFont(5, self._spark_font)
+
+
 class AWSIoTPubSubGUI(QMainWindow):
+    # Time range presets for the database viewer: (label, seconds back from now; None = all)
+    VIEWER_TIME_RANGES = [
+        ("All time", None),
+        ("Last 15 minutes", 15 * 60),
+        ("Last hour", 3600),
+        ("Last 6 hours", 6 * 3600),
+        ("Last 24 hours", 24 * 3600),
+        ("Last 7 days", 7 * 24 * 3600),
+    ]
+
     def __init__(self):
         super().__init__()
         
         # Get the directory where this script is located
         script_dir = Path(__file__).parent.absolute()
         
-        # AWS IoT Configuration
-        self.endpoint = "a1qvvs16o26pnz-ats.iot.ap-southeast-2.amazonaws.com"
-        self.thing_name = "feasibility_demo"
-        self.client_id = "feasibility_demo"
-        
-        # Certificate paths relative to the script directory (PublishDemo folder)
-        self.ca_path = str(script_dir / "AmazonRootCA1.pem")
-        self.cert_path = str(script_dir / "ebb0b9fb27d1eb1ca52f7f89260e123a992759bf3b630f9863575015132ebbef-certificate.pem.crt")
-        self.key_path = str(script_dir / "ebb0b9fb27d1eb1ca52f7f89260e123a992759bf3b630f9863575015132ebbef-private.pem.key")
+        # Message receiver for thread-safe updates
+        self.message_receiver = MessageReceiver()
+        self.message_receiver.message_received.connect(self.on_message_received)
+        self.message_receiver.log_message.connect(self.add_log)
         
-        # MQTT Connection
+        # MQTT Connection (non-blocking; state changes arrive via connection_signals)
         self.mqtt_connection = None
         self.is_connected = False
-        self.subscribed_topics = set()
+        self.connection_state = ConnectionState.DISCONNECTED
+        self._user_connect_pending = False  # only user-started attempts show an error dialog
+        self.connection_signals = ConnectionSignals()
+        self.connection_signals.state_changed.connect(self._on_connection_state_changed)
+        self.connection_signals.publish_completed.connect(self._on_publish_completed)
+        self.connection_signals.subscribe_completed.connect(self._on_subscribe_completed)
         
-        # Message receiver for thread-safe updates
-        self.message_receiver = MessageReceiver()
-        self.message_receiver.message_received.connect(self.on_message_received)
+        # Connection, reconnect, ingest/persistence and publishing live in the Qt-free engine;
+        # its callbacks arrive on worker threads and are marshalled here through the signals
+        self.engine = IoTEngine(
+            script_dir,
+            on_log=self.message_receiver.log_message.emit,
+            on_state_changed=self.connection_signals.state_changed.emit,
+            on_publish_complete=self.connection_signals.publish_completed.emit,
+        )
+        self.endpoint = self.engine.endpoint
+        self.thing_name = self.engine.thing_name
+        self.client_id = self.engine.client_id
+        self.connection_manager = self.engine.connection_manager
+        self.subscribed_topics = self.engine.subscribed_topics
+        self.subscriptions = self.engine.subscriptions
+        self.subscriptions.on_changed = self.connection_signals.subscriptions_changed.emit
+        self.reconnect_supervisor = self.engine.reconnect_supervisor
+        self.ingest_pipeline = self.engine.ingest_pipeline
+        self.publish_engine = self.engine.publish_engine
+        self.message_taps = self.engine.message_taps
+        self.db_path = self.engine.db_path
+        self.db_pragmas = self.engine.db_pragmas
+        
+        # GUI drains the ingest pipeline on a frame tick
+        self.ui_frame_hz = 20
+        self.ui_max_messages_per_frame = 50
+        self.coalesced_total = 0
+        
+        # Live log retention (lines kept in the ring buffer behind the log view)
+        self.log_retention_lines = int(os.environ.get("IOT_LOG_RETENTION_LINES", "5000") or 5000)
+        self._log_follow_tail = True
+        self._log_scroll_pending = False
+        self._log_evicted_pending = 0
         
-        # SQLite Database
-        self.db_path = str(script_dir / "iot_messages.db")
+        self.load_test_dialog = None
+        self.latency_probe_dialog = None
+        self.live_chart_dialog = None
+        self.subscription_dialog = None
         
         # Update check
         self.update_checker = UpdateChecker()
@@ -312,7 +1548,12 @@ class AWSIoTPubSubGUI(QMainWindow):
         self.kiosk_mode = "--kiosk" in sys.argv
         
         self.init_ui()
-        self.init_database()  # Initialize database after UI so log_text exists
+        startup_profile.mark("ui build")
+        self.engine.start()  # after the UI so database/startup messages reach the log view
+        startup_profile.mark("db init")
+        self._ui_frame_timer = QTimer(self)
+        self._ui_frame_timer.timeout.connect(self._drain_ingest_pipeline)
+        self._ui_frame_timer.start(max(1, int(1000 / self.ui_frame_hz)))
         self.update_status("Disconnected", False)
         
         # Kiosk: optional idle cursor hide (when unclutter not used)
@@ -426,6 +1667,14 @@ class AWSIoTPubSubGUI(QMainWindow):
         self.publish_shadow_btn.clicked.connect(self.publish_shadow_update)
         self.publish_shadow_btn.setEnabled(False)
         publish_btn_layout.addWidget(self.publish_shadow_btn)
+        
+        self.load_test_btn = QPushButton("Load Test...")
+        self.load_test_btn.clicked.connect(self.show_load_test)
+        publish_btn_layout.addWidget(self.load_test_btn)
+        
+        self.latency_probe_btn = QPushButton("Latency Probe...")
+        self.latency_probe_btn.clicked.connect(self.show_latency_probe)
+        publish_btn_layout.addWidget(self.latency_probe_btn)
         publish_layout.addLayout(publish_btn_layout)
         
         publish_group.setLayout(publish_layout)
@@ -453,12 +1702,24 @@ class AWSIoTPubSubGUI(QMainWindow):
         self.unsubscribe_btn.clicked.connect(self.unsubscribe_topic)
         self.unsubscribe_btn.setEnabled(False)
         subscribe_btn_layout.addWidget(self.unsubscribe_btn)
+        
+        self.subscriptions_btn = QPushButton("Subscription Sets...")
+        self.subscriptions_btn.clicked.connect(self.show_subscription_manager)
+        subscribe_btn_layout.addWidget(self.subscriptions_btn)
+        
+        self.live_chart_btn = QPushButton("Live Chart...")
+        self.live_chart_btn.clicked.connect(self.show_live_chart)
+        subscribe_btn_layout.addWidget(self.live_chart_btn)
         subscribe_btn_layout.addStretch()
         subscribe_layout.addLayout(subscribe_btn_layout)
         
         subscribe_group.setLayout(subscribe_layout)
         main_layout.addWidget(subscribe_group)
         
+        # Live per-topic rates (collapsed by default; refreshes only while expanded)
+        self.topic_stats_panel = TopicStatsPanel(self.engine.topic_activity, lambda: sorted(self.subscribed_topics))
+        main_layout.addWidget(self.topic_stats_panel)
+        
         # Log Area
         log_group = QGroupBox("Message Log")
         log_layout = QVBoxLayout()
@@ -470,13 +1731,32 @@ class AWSIoTPubSubGUI(QMainWindow):
         self.view_logs_btn.setStyleSheet("font-size: 10pt; padding: 5px;")
         log_btn_layout.addWidget(self.view_logs_btn)
         log_btn_layout.addStretch()
+        # Shown once the display falls behind and messages are summarized instead of listed
+        self.coalesced_label = QLabel("")
+        self.coalesced_label.setStyleSheet("font-size: 9pt; color: #e37400; padding: 5px;")
+        self.coalesced_label.setVisible(False)
+        log_btn_layout.addWidget(self.coalesced_label)
         log_layout.addLayout(log_btn_layout)
         
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
-        self.log_text.setMinimumHeight(250)
-        self.log_text.setStyleSheet("font-family: 'Courier New', monospace; font-size: 9pt;")
-        log_layout.addWidget(self.log_text)
+        # Shown while auto-scroll is paused (user scrolled up); jumps back to the newest line
+        self.log_follow_btn = QPushButton("Jump to latest")
+        self.log_follow_btn.setStyleSheet("font-size: 9pt; padding: 4px 8px;")
+        self.log_follow_btn.clicked.connect(self._resume_log_follow)
+        self.log_follow_btn.setVisible(False)
+        log_btn_layout.addWidget(self.log_follow_btn)
+        
+        # Bounded ring-buffer model; uniform rows let the view lay out only what is visible
+        self.log_model = LogListModel(self.log_retention_lines, self)
+        self.log_view = QListView()
+        self.log_view.setModel(self.log_model)
+        self.log_view.setUniformItemSizes(True)
+        self.log_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.log_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.log_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerItem)
+        self.log_view.setMinimumHeight(250)
+        self.log_view.setStyleSheet("font-family: 'Courier New', monospace; font-size: 9pt;")
+        self.log_view.verticalScrollBar().valueChanged.connect(self._on_log_scrolled)
+        log_layout.addWidget(self.log_view)
         log_group.setLayout(log_layout)
         main_layout.addWidget(log_group)
         
@@ -559,187 +1839,138 @@ class AWSIoTPubSubGUI(QMainWindow):
     
     def add_log(self, message: str):
         """Add a message to the log area with timestamp"""
-        # Check if log_text exists (may not be initialized yet)
-        if not hasattr(self, 'log_text') or self.log_text is None:
+        self.add_log_entries([message])
+    
+    def add_log_entries(self, messages):
+        """Append several timestamped messages to the log view in one model update"""
+        # Check if the log view exists (may not be initialized yet)
+        if getattr(self, "log_model", None) is None:
             return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        self.log_text.moveCursor(QTextCursor.MoveOperation.End)
-        self.log_text.insertPlainText(log_entry)
-        self.log_text.moveCursor(QTextCursor.MoveOperation.End)
+        lines = []
+        for message in messages:
+            # One row per text line keeps row heights uniform (multi-line JSON payloads)
+            lines.extend(f"[{timestamp}] {message}".split("\n"))
+        self._log_evicted_pending += self.log_model.append_lines(lines)
+        # Scroll once per event-loop pass, not per append: scrolling forces a view relayout
+        if not self._log_scroll_pending:
+            self._log_scroll_pending = True
+            QTimer.singleShot(0, self._apply_log_scroll)
+    
+    def _apply_log_scroll(self):
+        """Follow the newest line, or keep the user's rows in place while old rows are evicted"""
+        self._log_scroll_pending = False
+        evicted, self._log_evicted_pending = self._log_evicted_pending, 0
+        if self._log_follow_tail:
+            self.log_view.scrollToBottom()
+        elif evicted:
+            scrollbar = self.log_view.verticalScrollBar()
+            scrollbar.setValue(max(0, scrollbar.value() - evicted))
+    
+    def _on_log_scrolled(self, value: int):
+        """Pause auto-scroll when the user scrolls up; resume when back at the bottom"""
+        follow = value >= self.log_view.verticalScrollBar().maximum()
+        if follow != self._log_follow_tail:
+            self._log_follow_tail = follow
+            self.log_follow_btn.setVisible(not follow)
+    
+    def _resume_log_follow(self):
+        self._log_follow_tail = True
+        self.log_follow_btn.setVisible(False)
+        self.log_view.scrollToBottom()
     
     def toggle_connection(self):
         """Connect or disconnect from AWS IoT"""
-        if not self.is_connected:
+        if self.connection_state == ConnectionState.DISCONNECTED and not self.reconnect_supervisor.active:
             self.connect_to_iot()
         else:
             self.disconnect_from_iot()
     
     def connect_to_iot(self):
-        """Establish MQTT connection to AWS IoT Core"""
-        try:
+        """Start connecting to AWS IoT Core (returns immediately; see _on_connection_state_changed)"""
+        self.add_log("=" * 60)
+        self.add_log("Attempting to connect to AWS IoT Core...")
+        self.add_log(f"Endpoint: {self.endpoint}")
+        self.add_log(f"Client ID: {self.client_id}")
+        self.add_log(f"Thing Name: {self.thing_name}")
+        self._user_connect_pending = self.connection_manager.connect()
+    
+    def disconnect_from_iot(self):
+        """Start disconnecting from AWS IoT Core (unsubscribes all topics first)"""
+        self.reconnect_supervisor.stop()
+        if not self.connection_manager.disconnect():
+            # Nothing connected (e.g. waiting between reconnect attempts): just stop retrying
+            self.subscribed_topics.clear()
+            self._on_connection_state_changed(ConnectionState.DISCONNECTED, "")
+    
+    def _set_connected_controls(self, enabled: bool, allow_publish: bool = False):
+        # While a dropped link is being restored, publishes still go to the outbox
+        self.publish_btn.setEnabled(enabled or allow_publish)
+        self.publish_shadow_btn.setEnabled(enabled or allow_publish)
+        self.subscribe_btn.setEnabled(enabled)
+        self.unsubscribe_btn.setEnabled(enabled)
+    
+    def _publish_session_active(self) -> bool:
+        """True while connected or while a dropped connection is being restored"""
+        return self.is_connected or self.reconnect_supervisor.active
+    
+    def _on_connection_state_changed(self, state: str, detail: str):
+        """Apply a ConnectionManager state change on the GUI thread"""
+        previous = self.connection_state
+        self.connection_state = state
+        self.is_connected = state == ConnectionState.CONNECTED
+        self.mqtt_connection = self.connection_manager.connection
+        
+        if state == ConnectionState.CONNECTING:
             self.update_status("Connecting...", True)
-            self.add_log("=" * 60)
-            self.add_log("Attempting to connect to AWS IoT Core...")
-            self.add_log(f"Endpoint: {self.endpoint}")
-            self.add_log(f"Client ID: {self.client_id}")
-            self.add_log(f"Thing Name: {self.thing_name}")
+            self._set_connected_controls(False)
             self.connect_btn.setEnabled(False)
-            
-            # Step 1: Verify certificate files exist
-            self.add_log("Step 1: Verifying certificate files...")
-            cert_files = {
-                "CA Root": self.ca_path,
-                "Certificate": self.cert_path,
-                "Private Key": self.key_path
-            }
-            
-            missing_files = []
-            for name, path in cert_files.items():
-                if os.path.exists(path):
-                    file_size = os.path.getsize(path)
-                    self.add_log(f"  ✓ {name}: {path} (Size: {file_size} bytes)")
-                else:
-                    missing_files.append(f"{name}: {path}")
-                    self.add_log(f"  ✗ {name}: NOT FOUND - {path}")
-            
-            if missing_files:
-                error_msg = f"Certificate files not found:\n" + "\n".join(missing_files)
-                self.update_status("Connection Failed: Missing Files", False)
-                self.add_log(f"ERROR: {error_msg}")
-                self.connect_btn.setEnabled(True)
-                QMessageBox.critical(self, "Connection Error", error_msg)
-                return
-            
-            # Step 2: Build MQTT connection
-            self.add_log("Step 2: Building MQTT connection with mTLS...")
-            try:
-                self.mqtt_connection = mqtt_connection_builder.mtls_from_path(
-                    endpoint=self.endpoint,
-                    cert_filepath=self.cert_path,
-                    pri_key_filepath=self.key_path,
-                    ca_filepath=self.ca_path,
-                    client_id=self.client_id,
-                    clean_session=False,
-                    keep_alive_secs=30
-                )
-                self.add_log("  ✓ MQTT connection object created successfully")
-            except Exception as e:
-                error_msg = f"Failed to create MQTT connection object: {str(e)}"
-                self.add_log(f"ERROR: {error_msg}")
-                self.add_log(f"Exception type: {type(e).__name__}")
-                self.add_log(f"Traceback:\n{''.join(traceback.format_tb(e.__traceback__))}")
-                self.update_status("Connection Failed: Build Error", False)
-                self.connect_btn.setEnabled(True)
-                QMessageBox.critical(self, "Connection Error", error_msg)
-                return
-            
-            # Step 3: Establish connection
-            self.add_log("Step 3: Establishing connection to AWS IoT Core...")
-            try:
-                connect_future = self.mqtt_connection.connect()
-                self.add_log("  → Waiting for connection (timeout: 10 seconds)...")
-                connect_future.result(timeout=10)
-                self.add_log("  ✓ Connection established successfully!")
-            except Exception as e:
-                error_msg = f"Connection timeout or failed: {str(e)}"
-                self.add_log(f"ERROR: {error_msg}")
-                self.add_log(f"Exception type: {type(e).__name__}")
-                self.add_log(f"Full traceback:\n{''.join(traceback.format_tb(e.__traceback__))}")
-                
-                # Additional diagnostics
-                self.add_log("\nDiagnostics:")
-                self.add_log(f"  - Check if endpoint is correct: {self.endpoint}")
-                self.add_log(f"  - Check if certificate policy allows iot:Connect")
-                self.add_log(f"  - Check if client ID is unique and not already in use")
-                self.add_log(f"  - Check network connectivity to AWS IoT endpoint")
-                
-                self.update_status("Connection Failed", False)
-                self.connect_btn.setEnabled(True)
-                QMessageBox.critical(self, "Connection Error", 
-                    f"{error_msg}\n\nCheck the log for detailed diagnostics.")
-                self.mqtt_connection = None
-                return
-            
-            # Success
-            self.is_connected = True
+        elif state == ConnectionState.CONNECTED:
+            self._user_connect_pending = False
             self.update_status("Connected!", True)
-            self.add_log("=" * 60)
-            self.add_log(f"✓ Successfully connected to AWS IoT Core!")
-            self.add_log(f"  Endpoint: {self.endpoint}")
-            self.add_log(f"  Client ID: {self.client_id}")
-            self.add_log("=" * 60)
-            
-            # Enable buttons
-            self.publish_btn.setEnabled(True)
-            self.publish_shadow_btn.setEnabled(True)
-            self.subscribe_btn.setEnabled(True)
-            self.unsubscribe_btn.setEnabled(True)
+            if previous == ConnectionState.CONNECTING:
+                self.add_log("=" * 60)
+                self.add_log("✓ Successfully connected to AWS IoT Core!")
+                self.add_log(f"  Endpoint: {self.endpoint}")
+                self.add_log(f"  Client ID: {self.client_id}")
+                self.add_log("=" * 60)
+            self._set_connected_controls(True)
             self.connect_btn.setText("Disconnect from AWS IoT")
             self.connect_btn.setEnabled(True)
-            
-        except FileNotFoundError as e:
-            error_msg = f"Certificate file not found: {str(e)}"
-            self.add_log(f"ERROR: {error_msg}")
-            self.add_log(f"Exception type: {type(e).__name__}")
-            self.add_log(f"Traceback:\n{''.join(traceback.format_tb(e.__traceback__))}")
-            self.update_status("Connection Failed: File Not Found", False)
-            self.connect_btn.setEnabled(True)
-            QMessageBox.critical(self, "Connection Error", error_msg)
-            self.mqtt_connection = None
-        except Exception as e:
-            error_msg = f"Unexpected error during connection: {str(e)}"
-            self.add_log(f"ERROR: {error_msg}")
-            self.add_log(f"Exception type: {type(e).__name__}")
-            self.add_log(f"Full traceback:\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
-            self.update_status("Connection Failed: Unexpected Error", False)
+        elif state == ConnectionState.INTERRUPTED:
+            self.update_status("Connection Interrupted - reconnecting...", False)
+            self._set_connected_controls(False, allow_publish=True)
+        elif state == ConnectionState.RESUMING:
+            self.update_status("Resuming connection...", True)
+        elif state == ConnectionState.DISCONNECTING:
+            self.update_status("Disconnecting...", True)
+            self._set_connected_controls(False)
+            self.connect_btn.setEnabled(False)
+        elif state == ConnectionState.DISCONNECTED:
+            self._set_connected_controls(False)
+            self.connect_btn.setText("Connect to AWS IoT")
             self.connect_btn.setEnabled(True)
-            QMessageBox.critical(self, "Connection Error", 
-                f"{error_msg}\n\nCheck the log for full details.")
-            self.mqtt_connection = None
-    
-    def disconnect_from_iot(self):
-        """Disconnect from AWS IoT Core"""
-        try:
-            if self.mqtt_connection:
-                # Unsubscribe from all topics first
-                for topic in list(self.subscribed_topics):
-                    try:
-                        # Unsubscribe (returns tuple: (future, packet_id))
-                        unsubscribe_future, packet_id = self.mqtt_connection.unsubscribe(topic)
-                        unsubscribe_future.result(timeout=5)
-                        self.add_log(f"Unsubscribed from: {topic}")
-                    except Exception as e:
-                        self.add_log(f"Error unsubscribing from {topic}: {e}")
-                
-                self.subscribed_topics.clear()
-                
-                # Disconnect
-                disconnect_future = self.mqtt_connection.disconnect()
-                disconnect_future.result(timeout=5)
-                
-                self.mqtt_connection = None
-                self.is_connected = False
-                self.update_status("Disconnected", False)
+            user_connect_failed = self._user_connect_pending and previous == ConnectionState.CONNECTING
+            self._user_connect_pending = False
+            if self.reconnect_supervisor.active:
+                # Supervisor will retry; keep the button as a way to stop reconnecting
+                self.update_status("Connection lost - reconnecting...", False)
+                self.connect_btn.setText("Disconnect from AWS IoT")
+                self._set_connected_controls(False, allow_publish=True)
+            elif user_connect_failed:
+                status = f"Connection Failed: {detail}" if detail else "Connection Failed"
+                self.update_status(status, False)
+                QMessageBox.critical(
+                    self, "Connection Error",
+                    f"{self.connection_manager.last_error}\n\nCheck the log for detailed diagnostics."
+                )
+            else:
+                self.update_status(f"Disconnected ({detail})" if detail else "Disconnected", False)
                 self.add_log("Disconnected from AWS IoT Core")
-                
-                # Disable buttons
-                self.publish_btn.setEnabled(False)
-                self.publish_shadow_btn.setEnabled(False)
-                self.subscribe_btn.setEnabled(False)
-                self.unsubscribe_btn.setEnabled(False)
-                self.connect_btn.setText("Connect to AWS IoT")
-                self.connect_btn.setEnabled(True)
-        except Exception as e:
-            error_msg = f"Disconnect error: {str(e)}"
-            self.add_log(f"ERROR: {error_msg}")
-            self.mqtt_connection = None
-            self.is_connected = False
-            self.update_status("Disconnected (with errors)", False)
     
     def publish_message(self):
-        """Publish a message to the specified topic"""
-        if not self.is_connected or not self.mqtt_connection:
+        """Queue a message for publishing to the specified topic (completion is reported asynchronously)"""
+        if not self._publish_session_active():
             QMessageBox.warning(self, "Not Connected", "Please connect to AWS IoT first.")
             return
         
@@ -758,32 +1989,16 @@ class AWSIoTPubSubGUI(QMainWindow):
             # Validate JSON
             payload_dict = json.loads(payload_text)
             payload_json = json.dumps(payload_dict)
-            
-            # Publish (returns tuple: (future, packet_id))
-            publish_future, packet_id = self.mqtt_connection.publish(
-                topic=topic,
-                payload=payload_json,
-                qos=mqtt.QoS.AT_LEAST_ONCE
-            )
-            publish_future.result(timeout=5)
-            
-            self.update_status("Publish Success", True)
-            self.add_log(f"Published to '{topic}': {payload_json}")
-            
+            self._queue_publish(topic, payload_json)
         except json.JSONDecodeError as e:
             error_msg = f"Invalid JSON: {str(e)}"
             self.update_status(error_msg, False)
             self.add_log(f"ERROR: {error_msg}")
             QMessageBox.warning(self, "Invalid JSON", error_msg)
-        except Exception as e:
-            error_msg = f"Publish failed: {str(e)}"
-            self.update_status(error_msg, False)
-            self.add_log(f"ERROR: {error_msg}")
-            QMessageBox.critical(self, "Publish Error", error_msg)
     
     def publish_shadow_update(self):
-        """Publish a shadow update to the device shadow"""
-        if not self.is_connected or not self.mqtt_connection:
+        """Queue a shadow update to the device shadow"""
+        if not self._publish_session_active():
             QMessageBox.warning(self, "Not Connected", "Please connect to AWS IoT first.")
             return
         
@@ -797,26 +2012,29 @@ class AWSIoTPubSubGUI(QMainWindow):
                 }
             }
         }
-        
-        try:
-            payload_json = json.dumps(default_payload)
-            
-            # Publish (returns tuple: (future, packet_id))
-            publish_future, packet_id = self.mqtt_connection.publish(
-                topic=shadow_topic,
-                payload=payload_json,
-                qos=mqtt.QoS.AT_LEAST_ONCE
-            )
-            publish_future.result(timeout=5)
-            
-            self.update_status("Shadow Update Published", True)
-            self.add_log(f"Published shadow update to '{shadow_topic}': {payload_json}")
-            
-        except Exception as e:
-            error_msg = f"Shadow update failed: {str(e)}"
+        self._queue_publish(shadow_topic, json.dumps(default_payload))
+    
+    def _queue_publish(self, topic: str, payload_json: str):
+        publish_id = self.publish_engine.publish(topic, payload_json, qos=mqtt.QoS.AT_LEAST_ONCE.value)
+        if self.is_connected:
+            self.update_status("Publishing...", True)
+        else:
+            self.update_status("Publish queued (offline)", True)
+            self.add_log(f"Queued publish #{publish_id} to '{topic}' in outbox; it will be sent after reconnect")
+    
+    def _on_publish_completed(self, publish_id: int, topic: str, payload: str, error: str, latency: float):
+        """PUBACK (or final failure) for a queued publish, delivered on the GUI thread"""
+        if error:
+            error_msg = f"Publish failed: {error}"
             self.update_status(error_msg, False)
-            self.add_log(f"ERROR: {error_msg}")
-            QMessageBox.critical(self, "Shadow Update Error", error_msg)
+            self.add_log(f"ERROR: {error_msg} (topic '{topic}', publish #{publish_id})")
+            return
+        if topic.startswith("$aws/things/") and "/shadow/" in topic:
+            self.update_status("Shadow Update Published", True)
+            self.add_log(f"Published shadow update to '{topic}': {payload}")
+        else:
+            self.update_status("Publish Success", True)
+            self.add_log(f"Published to '{topic}': {payload} ({latency * 1000:.0f} ms)")
     
     def subscribe_topic(self):
         """Subscribe to the specified topic filter"""
@@ -835,42 +2053,24 @@ class AWSIoTPubSubGUI(QMainWindow):
             return
         
         try:
-            # Define callback function for received messages
-            def on_message_received(topic, payload, **kwargs):
-                """Callback function called when a message is received"""
-                try:
-                    payload_str = payload.decode('utf-8')
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    # Use signal to safely update GUI from callback thread
-                    self.message_receiver.message_received.emit(timestamp, topic, payload_str)
-                except Exception as e:
-                    # If signal fails, try direct invoke (fallback)
-                    QMetaObject.invokeMethod(
-                        self,
-                        "on_message_received",
-                        Qt.ConnectionType.QueuedConnection,
-                        Q_ARG(str, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                        Q_ARG(str, topic),
-                        Q_ARG(str, f"Error decoding payload: {e}")
-                    )
-            
-            # Subscribe
-            subscribe_future, packet_id = self.mqtt_connection.subscribe(
-                topic=topic_filter,
-                qos=mqtt.QoS.AT_LEAST_ONCE,
-                callback=on_message_received
-            )
-            subscribe_future.result(timeout=5)
-            
-            self.subscribed_topics.add(topic_filter)
-            self.update_status(f"Subscribed to: {topic_filter}", True)
-            self.add_log(f"Subscribed to topic filter: {topic_filter}")
-            
+            # Non-blocking: the SUBACK (logged by the subscription manager) completes it
+            future = self.subscriptions.subscribe(topic_filter)
         except Exception as e:
-            error_msg = f"Subscribe failed: {str(e)}"
+            self._on_subscribe_completed(topic_filter, str(e))
+            return
+        self.update_status(f"Subscribing to: {topic_filter}...", True)
+        future.add_done_callback(
+            lambda f: self.connection_signals.subscribe_completed.emit(topic_filter, str(f.exception() or ""))
+        )
+    
+    def _on_subscribe_completed(self, topic_filter: str, error: str):
+        if error:
+            error_msg = f"Subscribe failed: {error}"
             self.update_status(error_msg, False)
             self.add_log(f"ERROR: {error_msg}")
             QMessageBox.critical(self, "Subscribe Error", error_msg)
+        else:
+            self.update_status(f"Subscribed to: {topic_filter}", True)
     
     def unsubscribe_topic(self):
         """Unsubscribe from the specified topic filter"""
@@ -889,11 +2089,7 @@ class AWSIoTPubSubGUI(QMainWindow):
             return
         
         try:
-            # Unsubscribe (returns tuple: (future, packet_id))
-            unsubscribe_future, packet_id = self.mqtt_connection.unsubscribe(topic_filter)
-            unsubscribe_future.result(timeout=5)
-            
-            self.subscribed_topics.discard(topic_filter)
+            self._unsubscribe_filter(topic_filter)
             self.update_status(f"Unsubscribed from: {topic_filter}", True)
             self.add_log(f"Unsubscribed from topic filter: {topic_filter}")
             
@@ -903,90 +2099,52 @@ class AWSIoTPubSubGUI(QMainWindow):
             self.add_log(f"ERROR: {error_msg}")
             QMessageBox.critical(self, "Unsubscribe Error", error_msg)
     
-    def init_database(self):
-        """Initialize SQLite database and create table if it doesn't exist"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create messages table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    topic TEXT NOT NULL,
-                    payload TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create index on timestamp for faster queries
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)
-            ''')
-            
-            # Create index on topic for faster queries
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_topic ON messages(topic)
-            ''')
-            
-            conn.commit()
-            conn.close()
-            self.add_log(f"SQLite database initialized: {self.db_path}")
-        except Exception as e:
-            self.add_log(f"Error initializing database: {e}")
+    def _subscribe_filter(self, topic_filter: str) -> bool:
+        """Subscribe with the app's message callback. Returns False if already subscribed."""
+        return self.engine.subscribe(topic_filter)
     
-    def insert_message_to_db(self, timestamp: str, topic: str, payload: str):
-        """Insert received message into SQLite database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO messages (timestamp, topic, payload)
-                VALUES (?, ?, ?)
-            ''', (timestamp, topic, payload))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            self.add_log(f"Error inserting message to database: {e}")
+    def _unsubscribe_filter(self, topic_filter: str):
+        self.engine.unsubscribe(topic_filter)
+    
+    def stop_background_workers(self):
+        """Stop test tools, then drain the ingest pipeline and flush the database writer"""
+        if self.load_test_dialog:
+            self.load_test_dialog.stop_load()
+        if self.latency_probe_dialog:
+            self.latency_probe_dialog.stop_probe()
+        self.engine.stop_workers()
+    
+    def insert_message_to_db(self, timestamp: str, topic: str, payload: str, ts_us: Optional[int] = None):
+        """Queue received message for the batched SQLite writer (non-blocking)"""
+        self.engine.insert_message(timestamp, topic, payload, ts_us)
     
     def on_message_received(self, timestamp: str, topic: str, payload: str):
-        """Handle received message (called from signal, thread-safe)"""
+        """Handle an already-decoded message (signal slot): queue it on the ingest pipeline"""
+        self.ingest_pipeline.submit(topic, payload, timestamp)
+    
+    def _drain_ingest_pipeline(self):
+        """Frame tick: show the newest processed messages and summarize the ones skipped"""
         try:
-            # Insert message into SQLite database
-            self.insert_message_to_db(timestamp, topic, payload)
-            
-            # Try to format JSON if possible
-            try:
-                payload_dict = json.loads(payload)
-                formatted_payload = json.dumps(payload_dict, indent=2)
-            except:
-                formatted_payload = payload
-            
-            log_message = f"Received on '{topic}': {formatted_payload}"
-            self.add_log(log_message)
-            self.update_status("Message Received", True)
-            
+            messages, coalesced = self.ingest_pipeline.drain_display(self.ui_max_messages_per_frame)
+            entries = []
+            if coalesced:
+                self.coalesced_total += coalesced
+                entries.append(f"... {coalesced} message(s) coalesced (saved to database, not shown)")
+                self.coalesced_label.setText(f"{self.coalesced_total} messages coalesced")
+                self.coalesced_label.setVisible(True)
+            entries.extend(message.display_text for message in messages)
+            if entries:
+                self.add_log_entries(entries)
+            if messages:
+                self.update_status("Message Received", True)
         except Exception as e:
             self.add_log(f"Error processing received message: {e}")
     
     def show_all_messages(self):
-        """Show all messages from SQLite database in a dialog"""
+        """Show messages from SQLite database in a dialog (pages are loaded as you scroll)"""
+        model = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get all messages ordered by timestamp (newest first)
-            cursor.execute('''
-                SELECT id, timestamp, topic, payload, created_at
-                FROM messages
-                ORDER BY timestamp DESC
-            ''')
-            
-            rows = cursor.fetchall()
-            conn.close()
+            model = MessageTableModel(self.db_path, self.db_pragmas, shards=self.engine.db_shards)
             
             # Create dialog window
             dialog = QDialog(self)
@@ -995,73 +2153,136 @@ class AWSIoTPubSubGUI(QMainWindow):
             
             layout = QVBoxLayout(dialog)
             
-            # Add label with count
-            count_label = QLabel(f"Total messages: {len(rows)}")
+            # Add label with count (from the cached counter, not a table scan)
+            model.fetchMore()
+            compression = model.compression_summary()
+            count_label = QLabel(f"Total messages: {model.total_count}" + (f"  ({compression})" if compression else ""))
             count_label.setStyleSheet("font-size: 11pt; font-weight: bold; padding: 5px;")
             layout.addWidget(count_label)
             
-            # Create table
-            table = QTableWidget()
-            table.setColumnCount(5)
-            table.setHorizontalHeaderLabels(["ID", "Timestamp", "Topic", "Payload", "Created At"])
+            # Time range / topic filter (answered from the ts and (topic, ts) indexes)
+            filter_layout = QHBoxLayout()
+            filter_layout.addWidget(QLabel("Time range:"))
+            range_combo = QComboBox()
+            for label, seconds in self.VIEWER_TIME_RANGES:
+                range_combo.addItem(label, seconds)
+            filter_layout.addWidget(range_combo)
+            filter_layout.addWidget(QLabel("Topic:"))
+            topic_combo = QComboBox()
+            topic_combo.addItem("All topics", None)
+            for topic in model.topics():
+                topic_combo.addItem(topic, topic)
+            filter_layout.addWidget(topic_combo, 1)
+            layout.addLayout(filter_layout)
+            
+            # Full-text search over topic and payload (FTS5 index kept by the engine's SearchIndexer)
+            search_layout = QHBoxLayout()
+            search_layout.addWidget(QLabel("Search:"))
+            search_edit = QLineEdit()
+            search_edit.setPlaceholderText('words, "exact phrase", prefix*  (all terms must match)')
+            search_edit.setClearButtonEnabled(True)
+            search_layout.addWidget(search_edit, 1)
+            # Extracted payload field condition, e.g. temperature > 80 (IOT_DB_FIELDS / --fields)
+            field_combo = QComboBox()
+            field_combo.addItem("Any field value", None)
+            for path in sorted(set(model.fields()) | set(self.engine.db_fields)):
+                field_combo.addItem(path, path)
+            op_combo = QComboBox()
+            op_combo.addItems(FieldFilter.OPERATORS)
+            value_edit = QLineEdit()
+            value_edit.setPlaceholderText("value (number, or text)")
+            value_edit.setMaximumWidth(180)
+            if field_combo.count() > 1:
+                search_layout.addWidget(QLabel("Where:"))
+                search_layout.addWidget(field_combo)
+                search_layout.addWidget(op_combo)
+                search_layout.addWidget(value_edit)
+            layout.addLayout(search_layout)
+            
+            highlighter = HighlightDelegate(dialog)
+            
+            def apply_filter():
+                seconds = range_combo.currentData()
+                start_us = epoch_us(time.time() - seconds) if seconds else None
+                path = field_combo.currentData()
+                field_filter = FieldFilter(path, op_combo.currentText(), value_edit.text()) \
+                    if path and value_edit.text().strip() else None
+                model.set_filter(start_us, None, topic_combo.currentData(), search_edit.text(), field_filter)
+                highlighter.pattern = search_terms_pattern(search_edit.text()) if model.search else None
+                if model.search:
+                    shown = f"{model.count_limit}+" if model.total_count > model.count_limit else model.total_count
+                    text = f"Matching messages: {shown}  ({model.search_ms:.0f} ms)"
+                    if model.search_backlog:
+                        text += f"  - {model.search_backlog} newer messages not indexed yet"
+                else:
+                    filtered = start_us is not None or topic_combo.currentData() is not None or field_filter is not None
+                    text = f"{'Matching' if filtered else 'Total'} messages: {model.total_count}"
+                    if field_filter is not None:
+                        text += f"  (where {field_filter.describe()}, {model.search_ms:.0f} ms)"
+                count_label.setText(text)
+            
+            # Search as you type, once typing pauses (Enter applies immediately)
+            search_timer = QTimer(dialog)
+            search_timer.setSingleShot(True)
+            search_timer.setInterval(300)
+            search_timer.timeout.connect(apply_filter)
+            search_edit.textChanged.connect(search_timer.start)
+            search_edit.returnPressed.connect(search_timer.stop)
+            search_edit.returnPressed.connect(apply_filter)
+            range_combo.currentIndexChanged.connect(apply_filter)
+            topic_combo.currentIndexChanged.connect(apply_filter)
+            field_combo.currentIndexChanged.connect(lambda: value_edit.text().strip() and apply_filter())
+            op_combo.currentIndexChanged.connect(lambda: value_edit.text().strip() and apply_filter())
+            value_edit.returnPressed.connect(apply_filter)
+            value_edit.textChanged.connect(lambda text: text.strip() or apply_filter())
+            
+            # Create table (rows are fetched on demand by the model)
+            table = QTableView()
+            table.setModel(model)
+            table.setItemDelegateForColumn(2, highlighter)  # Topic
+            table.setItemDelegateForColumn(3, highlighter)  # Payload
             
             # Set table properties
-            table.setRowCount(len(rows))
             table.setAlternatingRowColors(True)
-            table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+            table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
             table.setWordWrap(True)  # Enable word wrapping
             table.horizontalHeader().setStretchLastSection(False)
             
-            # Set column resize modes
-            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)  # ID
-            table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)  # Timestamp
-            table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)  # Topic
+            # Fixed column modes: ResizeToContents would measure every loaded row on each page
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
             table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)  # Payload - stretch to fill
-            table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)  # Created At
             
             # Set minimum widths for better visibility
             table.setColumnWidth(0, 60)   # ID
-            table.setColumnWidth(1, 180)  # Timestamp
+            table.setColumnWidth(1, 190)  # Timestamp (ms)
             table.setColumnWidth(2, 250)  # Topic
             table.setColumnWidth(3, 600)  # Payload - minimum width
             table.setColumnWidth(4, 180)  # Created At
             
-            # Populate table
-            for row_idx, row_data in enumerate(rows):
-                for col_idx, value in enumerate(row_data):
-                    # Format payload if it's JSON
-                    if col_idx == 3 and value:  # Payload column
-                        try:
-                            # Try to parse and format JSON
-                            payload_dict = json.loads(str(value))
-                            formatted_value = json.dumps(payload_dict, indent=2)
-                        except:
-                            # Not JSON, use as is
-                            formatted_value = str(value)
-                    else:
-                        formatted_value = str(value)
-                    
-                    item = QTableWidgetItem(formatted_value)
-                    item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)  # Make read-only
-                    
-                    # Enable text wrapping for payload column
-                    if col_idx == 3:  # Payload column
-                        item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
-                    
-                    table.setItem(row_idx, col_idx, item)
-                
-                # Set row height to accommodate wrapped text
-                table.setRowHeight(row_idx, 100)  # Initial height, will auto-adjust
-            
-            # Adjust row heights based on content
-            table.resizeRowsToContents()
+            # Fixed row height instead of resizeRowsToContents(); double-click a row to fit its payload
+            table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+            table.verticalHeader().setDefaultSectionSize(100)
+            table.doubleClicked.connect(lambda index: table.resizeRowToContents(index.row()))
             
             layout.addWidget(table)
             
-            # Add close button
+            # Export (streams the rows matching the current filters) and close buttons
+            btn_layout = QHBoxLayout()
+            export_btn = QPushButton("Export...")
+            export_btn.setToolTip("Write the messages matching the time range, topic and Where filters "
+                                  "(not the text search) to CSV, NDJSON or Parquet")
+            export_btn.clicked.connect(lambda: self.export_messages(
+                dialog, model.start_us, model.end_us, model.topic, model.field_filter
+            ))
+            btn_layout.addWidget(export_btn)
+            summary_btn = QPushButton("Topic Summary...")
+            summary_btn.setToolTip("Per-topic message counts, data volume and field statistics (from the rollup tables)")
+            summary_btn.clicked.connect(lambda: self.show_topic_summary(dialog, model))
+            btn_layout.addWidget(summary_btn)
             close_btn = QPushButton("Close")
             close_btn.clicked.connect(dialog.close)
-            layout.addWidget(close_btn)
+            btn_layout.addWidget(close_btn, 1)
+            layout.addLayout(btn_layout)
             
             dialog.exec()
             
@@ -1069,6 +2290,152 @@ class AWSIoTPubSubGUI(QMainWindow):
             error_msg = f"Error retrieving messages from database: {e}"
             self.add_log(error_msg)
             QMessageBox.critical(self, "Database Error", error_msg)
+        finally:
+            if model is not None:
+                model.close()
+    
+    def show_topic_summary(self, parent, model):
+        """Per-topic totals and last-hour activity from the rollup tables (no message scan)"""
+        started = time.perf_counter()
+        topics, fields = model.summary(3600)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        
+        def size(n):
+            return f"{n / 1048576:.1f} MB" if n >= 1048576 else f"{n / 1024:.1f} KB"
+        
+        def table(headers, rows):
+            widget = QTableWidget(len(rows), len(headers))
+            widget.setHorizontalHeaderLabels(headers)
+            widget.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+            widget.verticalHeader().setVisible(False)
+            for r, row in enumerate(rows):
+                for c, value in enumerate(row):
+                    widget.setItem(r, c, QTableWidgetItem(str(value)))
+            widget.resizeColumnsToContents()
+            widget.horizontalHeader().setStretchLastSection(True)
+            return widget
+        
+        dialog = QDialog(parent)
+        dialog.setWindowTitle("Topic Summary")
+        dialog.setGeometry(150, 150, 1100, 600)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(
+            f"{len(topics)} topic(s); totals include messages already removed by retention "
+            f"(read from rollups in {elapsed_ms:.0f} ms)"
+        ))
+        layout.addWidget(table(
+            ["Topic", "Messages", "Data", "First seen", "Last seen", "Last hour", "Last hour data"],
+            [(topic, count, size(total_bytes), format_epoch_us(first), format_epoch_us(last), recent, size(recent_bytes))
+             for topic, count, total_bytes, first, last, recent, recent_bytes in topics],
+        ), 2)
+        if fields:
+            layout.addWidget(QLabel("Numeric payload fields, last hour (IOT_DB_FIELDS):"))
+            layout.addWidget(table(
+                ["Topic", "Field", "Samples", "Average", "Min", "Max"],
+                [(topic, path, count, f"{avg:.4g}", f"{low:.4g}", f"{high:.4g}")
+                 for topic, path, count, avg, low, high in fields],
+            ), 1)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(dialog.close)
+        layout.addWidget(close_btn)
+        dialog.exec()
+    
+    def export_messages(self, parent, start_us=None, end_us=None, topic=None, field_filter=None):
+        """Stream stored messages (optionally filtered) to a file on a worker thread, with a progress dialog"""
+        formats = ["CSV (*.csv)", "CSV, gzip (*.csv.gz)", "NDJSON (*.ndjson)", "NDJSON, gzip (*.ndjson.gz)"]
+        if PYARROW_AVAILABLE:
+            formats += ["Parquet (*.parquet)", "Arrow IPC (*.arrow)"]
+        default_name = f"iot_messages_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        path, selected = QFileDialog.getSaveFileName(parent, "Export Messages", default_name, ";;".join(formats))
+        if not path:
+            return
+        if export_format_for(path) is None:
+            path += selected[selected.index("*") + 1:-1]  # no known extension: use the chosen filter's
+        try:
+            exporter = MessageExporter(
+                self.db_path, path, start_us=start_us, end_us=end_us, topic=topic, field_filter=field_filter,
+                shards=self.engine.db_shards, pragmas=self.db_pragmas, on_log=self.message_receiver.log_message.emit,
+            )
+        except ValueError as e:
+            QMessageBox.warning(parent, "Export", str(e))
+            return
+        progress = QProgressDialog("Counting messages...", "Cancel", 0, 0, parent)
+        progress.setWindowTitle("Export Messages")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoReset(False)
+        progress.setMinimumDuration(0)
+        progress.canceled.connect(exporter.cancel)
+        threading.Thread(target=exporter.run, name="MessageExporter", daemon=True).start()
+        
+        def refresh():
+            stats = exporter.get_stats()
+            if stats["total"]:
+                progress.setMaximum(stats["total"])
+                progress.setValue(stats["rows"])
+                progress.setLabelText(f"Exported {stats['rows']} of {stats['total']} messages")
+            if not stats["done"]:
+                return
+            timer.stop()
+            progress.close()
+            if stats["error"]:
+                QMessageBox.critical(parent, "Export Error", f"Could not export to {path}: {stats['error']}")
+            elif not stats["cancelled"]:
+                QMessageBox.information(
+                    parent, "Export",
+                    f"Exported {stats['rows']} messages to {path} ({stats['bytes'] / 1048576:.1f} MB)",
+                )
+        
+        timer = QTimer(progress)
+        timer.timeout.connect(refresh)
+        timer.start(200)
+    
+    def show_load_test(self):
+        """Open the (non-modal) publish load-test panel"""
+        if self.load_test_dialog is None:
+            self.load_test_dialog = LoadTestDialog(
+                self.connection_manager,
+                f"devices/{self.thing_name}/loadtest",
+                self,
+                on_log=self.message_receiver.log_message.emit,
+            )
+        self.load_test_dialog.show()
+        self.load_test_dialog.raise_()
+    
+    def show_live_chart(self):
+        """Open the (non-modal) live chart of numeric payload fields"""
+        if not NUMPY_AVAILABLE:
+            QMessageBox.information(self, "Live Chart", "Live charts need NumPy:\n\nvenv/bin/pip install numpy")
+            return
+        if self.live_chart_dialog is None:
+            self.live_chart_dialog = LiveChartDialog(
+                self.engine.field_series, lambda: sorted(self.subscribed_topics), self
+            )
+        self.live_chart_dialog.show()
+        self.live_chart_dialog.raise_()
+    
+    def show_subscription_manager(self):
+        """Open the (non-modal) subscription set editor with per-filter state"""
+        if self.subscription_dialog is None:
+            self.subscription_dialog = SubscriptionManagerDialog(
+                self.subscriptions, self.connection_signals.subscriptions_changed, self
+            )
+        self.subscription_dialog.show()
+        self.subscription_dialog.raise_()
+    
+    def show_latency_probe(self):
+        """Open the (non-modal) round-trip latency probe panel"""
+        if self.latency_probe_dialog is None:
+            self.latency_probe_dialog = LatencyProbeDialog(
+                self.connection_manager,
+                f"devices/{self.thing_name}/probe",
+                self._subscribe_filter,
+                self._unsubscribe_filter,
+                self.message_taps,
+                self,
+                on_log=self.message_receiver.log_message.emit,
+            )
+        self.latency_probe_dialog.show()
+        self.latency_probe_dialog.raise_()
     
     def _get_venv_python(self):
         """Get the virtual environment Python executable path"""
@@ -1102,44 +2469,18 @@ class AWSIoTPubSubGUI(QMainWindow):
                 
                 if REQUESTS_AVAILABLE:
                     try:
-                        # Get all branches from GitHub
-                        branches_url = "https://api.github.com/repos/thienanlktl/Pideployment/branches"
-                        response = requests.get(branches_url, timeout=10)
-                        
-                        if response.status_code == 200:
-                            branches_data = response.json()
-                            logger.info(f"Found {len(branches_data)} branches")
-                            
-                            # Filter Release/* branches and extract versions
-                            release_versions = []
-                            for branch in branches_data:
-                                branch_name = branch.get('name', '')
-                                if branch_name.startswith('Release/'):
-                                    # Extract version from branch name (Release/1.0.2 -> 1.0.2)
-                                    version_str = branch_name.replace('Release/', '').strip()
-                                    if version_str:
-                                        release_versions.append(version_str)
-                                        logger.info(f"Found Release branch: {branch_name} (version: {version_str})")
+                        latest_release_version = find_latest_release_version()
+                        if latest_release_version:
+                            logger.info(f"Latest Release branch version: {latest_release_version}")
                             
-                            if release_versions:
-                                # Find the latest version by comparing all release versions
-                                latest_release_version = release_versions[0]
-                                for version in release_versions:
-                                    if self._compare_versions(latest_release_version, version) < 0:
-                                        latest_release_version = version
-                                
-                                logger.info(f"Latest Release branch version: {latest_release_version}")
-                                
-                                # Compare with local version
-                                if self._compare_versions(local_version, latest_release_version) < 0:
-                                    update_available = True
-                                    logger.info(f"Update available! Latest Release: {latest_release_version}, Current: {local_version}")
-                                else:
-                                    logger.info(f"Application is up to date (current: {local_version}, latest release: {latest_release_version})")
+                            # Compare with local version
+                            if compare_versions(local_version, latest_release_version) < 0:
+                                update_available = True
+                                logger.info(f"Update available! Latest Release: {latest_release_version}, Current: {local_version}")
                             else:
-                                logger.info("No Release/* branches found")
+                                logger.info(f"Application is up to date (current: {local_version}, latest release: {latest_release_version})")
                         else:
-                            logger.warning(f"GitHub API returned status {response.status_code}")
+                            logger.info("No Release/* branches found")
                     except Exception as e:
                         logger.warning(f"Error checking Release branches: {e}")
                         self.update_checker.log_message.emit(f"Update check error: {e}")
@@ -1165,33 +2506,6 @@ class AWSIoTPubSubGUI(QMainWindow):
         thread = threading.Thread(target=check_update, daemon=True)
         thread.start()
     
-    def _compare_versions(self, v1: str, v2: str) -> int:
-        """Compare two version strings. Returns -1 if v1 < v2, 0 if equal, 1 if v1 > v2"""
-        try:
-            # Split version strings into parts
-            parts1 = [int(x) for x in v1.split('.')]
-            parts2 = [int(x) for x in v2.split('.')]
-            
-            # Pad with zeros to make same length
-            max_len = max(len(parts1), len(parts2))
-            parts1.extend([0] * (max_len - len(parts1)))
-            parts2.extend([0] * (max_len - len(parts2)))
-            
-            # Compare
-            for p1, p2 in zip(parts1, parts2):
-                if p1 < p2:
-                    return -1
-                elif p1 > p2:
-                    return 1
-            return 0
-        except Exception:
-            # If version comparison fails, do string comparison
-            if v1 < v2:
-                return -1
-            elif v1 > v2:
-                return 1
-            return 0
-    
     def on_update_available(self, remote_version: str, local_version: str):
         """Handle update available signal"""
         self.latest_release_version = remote_version
@@ -1254,6 +2568,7 @@ class AWSIoTPubSubGUI(QMainWindow):
 
     def _restart_app_after_update(self):
         """Start a new process running this app (new version) then quit current process."""
+        self.stop_background_workers()  # flush queued messages before the process exits
         python_exe = self._get_venv_python() or sys.executable
         script = self.script_dir / "iot_pubsub_gui.py"
         cwd = str(self.script_dir)
@@ -1305,46 +2620,6 @@ class AWSIoTPubSubGUI(QMainWindow):
         self.new_version_label.setText(f"→ New version {self.latest_release_version} available (click to upgrade)")
         self.new_version_label.setEnabled(True)
 
-    def _get_git_env_with_ssh(self):
-        """
-        Find .ssh in the current user's home directory: home/{user}/.ssh (e.g. /home/pi/.ssh).
-        Use public/private key from that folder only; never from the iot pubsub app folder.
-        IOT_SSH_DIR overrides the path; else id_ed25519, id_rsa, id_ecdsa or any PRIVATE KEY file.
-        """
-        env = os.environ.copy()
-        # home/{user}/.ssh — current user's home directory (e.g. /home/pi/.ssh on Pi)
-        user_home = Path.home()
-        default_ssh = user_home / ".ssh"
-        ssh_dir = Path(os.environ["IOT_SSH_DIR"]).expanduser().resolve() if os.environ.get("IOT_SSH_DIR") else default_ssh
-        key_file = None
-        if os.environ.get("IOT_SSH_KEY"):
-            k = Path(os.environ["IOT_SSH_KEY"]).expanduser().resolve()
-            if k.is_file():
-                key_file = k
-        if not key_file and ssh_dir.is_dir():
-            for name in ("id_ed25519", "id_rsa", "id_ecdsa"):
-                p = ssh_dir / name
-                if p.is_file():
-                    key_file = p
-                    break
-            if not key_file:
-                for f in ssh_dir.iterdir():
-                    if not f.is_file():
-                        continue
-                    if f.suffix == ".pub" or f.name in ("config", "known_hosts", "authorized_keys"):
-                        continue
-                    try:
-                        if "PRIVATE KEY" in f.read_text(encoding="utf-8", errors="ignore"):
-                            key_file = f
-                            break
-                    except Exception:
-                        continue
-        if key_file:
-            key_path = str(key_file.resolve())
-            env["GIT_SSH_COMMAND"] = f"ssh -i '{key_path}' -o StrictHostKeyChecking=accept-new -o BatchMode=yes"
-            return env, key_path
-        return env, None
-
     def _do_git_update(
         self,
         script_dir: str,
@@ -1353,161 +2628,19 @@ class AWSIoTPubSubGUI(QMainWindow):
         cancel_event: threading.Event,
     ):
         """
-        Fetch Release/<target_version> and update only iot_pubsub_gui.py and VERSION.
-        No clean, no remove, no reset, no branch change - only these two files are replaced.
-        All other files (desktop launcher, install.sh, etc.) are left unchanged.
-        Uses SSH key from ~/.ssh. Runs in background thread. Emits status_message and finished on signals.
+        Apply the Release/<target_version> update (see apply_release_update). Runs in a background
+        thread; progress and the result are reported through the dialog's signals.
         """
-        try:
-            signals.status_message.emit("Checking repository...")
-            if cancel_event.is_set():
-                signals.finished.emit(False, "Update cancelled.")
-                return
-
-            git_env, ssh_key_path = self._get_git_env_with_ssh()
-            if ssh_key_path:
-                signals.log_line.emit(f"Using SSH key from user home .ssh: {ssh_key_path}")
-
-            if not GITPYTHON_AVAILABLE:
-                signals.log_line.emit("ERROR: GitPython not installed.")
-                signals.finished.emit(False, "GitPython not installed. Run: pip install gitpython")
-                return
-
-            try:
-                repo = git.Repo(script_dir)
-            except Exception as e:
-                signals.log_line.emit(f"ERROR: {e}")
-                signals.finished.emit(False, "Not a git repository or access denied.")
-                return
-
-            if repo.bare:
-                signals.log_line.emit("ERROR: Repository is bare.")
-                signals.finished.emit(False, "Not a git repository (bare).")
-                return
-
-            signals.log_line.emit("Repository OK. No clean/remove/reset - only iot_pubsub_gui.py and VERSION will be updated.")
-
-            # Use SSH remote so GIT_SSH_COMMAND (and SSH key) is used; avoid permission denied
-            try:
-                origin_url = repo.remotes.origin.url
-                if origin_url.startswith("https://github.com/"):
-                    path = origin_url.replace("https://github.com/", "").strip("/").replace(".git", "")
-                    ssh_url = f"git@github.com:{path}.git"
-                    if ssh_url != origin_url:
-                        repo.remotes.origin.set_url(ssh_url)
-                        signals.log_line.emit(f"Using SSH remote for update: {ssh_url}")
-                elif origin_url.startswith("https://gitlab.com/"):
-                    path = origin_url.replace("https://gitlab.com/", "").strip("/").replace(".git", "")
-                    ssh_url = f"git@gitlab.com:{path}.git"
-                    if ssh_url != origin_url:
-                        repo.remotes.origin.set_url(ssh_url)
-                        signals.log_line.emit(f"Using SSH remote for update: {ssh_url}")
-            except Exception as e:
-                signals.log_line.emit(f"Note: Could not switch to SSH remote: {e}")
-
-            release_branch = f"Release/{target_version}"
-            # Fetch only the release branch (faster than full fetch) with timeout
-            signals.status_message.emit("Fetching from remote...")
-            if cancel_event.is_set():
-                signals.finished.emit(False, "Update cancelled.")
-                return
-            try:
-                # Fetch only latest commit (depth=1); use SSH key to avoid permission denied
-                subprocess.run(
-                    ["git", "fetch", "origin", release_branch, "--depth=1"],
-                    cwd=script_dir,
-                    timeout=60,
-                    capture_output=True,
-                    check=True,
-                    text=True,
-                    env=git_env,
-                )
-                signals.log_line.emit("Fetch completed (latest only).")
-            except subprocess.TimeoutExpired:
-                signals.log_line.emit("ERROR (fetch): Timeout after 60 seconds.")
-                signals.finished.emit(False, "Fetch timed out. Check network and try again.")
-                return
-            except subprocess.CalledProcessError as e:
-                err = (e.stderr or e.stdout or "").strip() or "Fetch failed."
-                signals.log_line.emit(f"ERROR (fetch): {err}")
-                if "permission denied" in err.lower() or "access denied" in err.lower() or "publickey" in err.lower():
-                    signals.log_line.emit("Tip: Ensure SSH key is in ~/.ssh (id_ed25519 or id_rsa) and public key is added to GitHub/GitLab. Remote should use SSH URL (git@github.com:...).")
-                signals.finished.emit(False, f"Fetch failed: {err}")
-                return
-            except Exception as e:
-                logger.exception("Git fetch failed")
-                err = str(e).strip() or "Network or permission error."
-                signals.log_line.emit(f"ERROR (fetch): {err}")
-                signals.finished.emit(False, f"Fetch failed: {err}")
-                return
-
-            # Update only these two files from the Release branch (no pull, no reset, no clean)
-            ref = f"origin/{release_branch}"
-            signals.status_message.emit("Updating iot_pubsub_gui.py and VERSION...")
-            signals.log_line.emit("Checking out latest iot_pubsub_gui.py and VERSION only (no other changes).")
-            if cancel_event.is_set():
-                signals.finished.emit(False, "Update cancelled.")
-                return
-            try:
-                subprocess.run(
-                    ["git", "checkout", ref, "--", "iot_pubsub_gui.py", "VERSION"],
-                    cwd=script_dir,
-                    timeout=30,
-                    capture_output=True,
-                    check=True,
-                    text=True,
-                    env=git_env,
-                )
-                signals.log_line.emit("Updated iot_pubsub_gui.py and VERSION from release branch.")
-            except subprocess.CalledProcessError as e:
-                err = (e.stderr or e.stdout or "").strip() or str(e)
-                # If VERSION is missing on release branch, try only the .py file
-                if "VERSION" in err or "did not match any file" in err:
-                    try:
-                        subprocess.run(
-                            ["git", "checkout", ref, "--", "iot_pubsub_gui.py"],
-                            cwd=script_dir,
-                            timeout=30,
-                            capture_output=True,
-                            check=True,
-                            text=True,
-                            env=git_env,
-                        )
-                        signals.log_line.emit("Updated iot_pubsub_gui.py (VERSION not on release branch).")
-                    except subprocess.CalledProcessError as e2:
-                        err2 = (e2.stderr or e2.stdout or "").strip() or str(e2)
-                        signals.log_line.emit(f"ERROR (checkout): {err2}")
-                        signals.finished.emit(False, f"Update failed: {err2}")
-                        return
-                else:
-                    signals.log_line.emit(f"ERROR (checkout): {err}")
-                    signals.finished.emit(False, f"Update failed: {err}")
-                    return
-            except subprocess.TimeoutExpired:
-                signals.log_line.emit("ERROR: Timeout updating files.")
-                signals.finished.emit(False, "Update timed out.")
-                return
-            except Exception as e:
-                logger.exception("Checkout files failed")
-                signals.log_line.emit(f"ERROR: {e}")
-                signals.finished.emit(False, f"Update failed: {e}")
-                return
-
-            logger.info("In-app update completed successfully")
-            signals.log_line.emit("Update completed successfully.")
+        success, message = apply_release_update(
+            script_dir,
+            target_version,
+            on_status=signals.status_message.emit,
+            on_log=signals.log_line.emit,
+            cancel_event=cancel_event,
+        )
+        if success:
             self.update_checker.log_message.emit("Update completed. Restart the application to apply changes.")
-            signals.finished.emit(
-                True,
-                "Update complete. Restart the application to apply changes.",
-            )
-        except Exception as e:
-            logger.exception("Update failed")
-            err_msg = str(e).strip() or type(e).__name__
-            signals.log_line.emit(f"ERROR: {err_msg}")
-            for line in traceback.format_exc().splitlines()[-5:]:
-                if line.strip():
-                    signals.log_line.emit(f"  {line.strip()}")
-            signals.finished.emit(False, f"Update failed: {err_msg}")
+        signals.finished.emit(success, message)
 
     def perform_update(self):
         """Legacy: start in-app update if a new version is available."""
@@ -1516,6 +2649,10 @@ class AWSIoTPubSubGUI(QMainWindow):
         else:
             self.add_log("No update available.")
     
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        startup_profile.first_paint()
+    
     def changeEvent(self, event):
         """Update full screen button text when window state changes (e.g. after showFullScreen() at startup)."""
         super().changeEvent(event)
@@ -1527,18 +2664,23 @@ class AWSIoTPubSubGUI(QMainWindow):
         if getattr(self, "kiosk_mode", False):
             event.ignore()
             return
-        if self.is_connected:
-            self.disconnect_from_iot()
+        if self.connection_manager.disconnect():
+            # Give the DISCONNECT a moment to go out; the process is exiting anyway
+            self.connection_manager.wait_until_disconnected(3.0)
+        self.stop_background_workers()
         event.accept()
 
 
 def main():
-    """Main entry point"""
+    """Main entry point (--headless, --load-test and --export are dispatched before PyQt6 is imported)"""
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Modern look
+    startup_profile.mark("qt app")
 
     window = AWSIoTPubSubGUI()
+    startup_profile.mark("window init")
     window.show()
+    startup_profile.mark("show")
     # Full screen by default (and always when --kiosk). Use --no-fullscreen to start windowed.
     use_fullscreen = "--kiosk" in sys.argv or "--no-fullscreen" not in sys.argv
     if use_fullscreen: